@@ -0,0 +1,10 @@
+#!/bin/bash
+set -e
+
+scriptParentDir="$(dirname "$(perl -MCwd -e 'print Cwd::abs_path shift' "$0")")"
+cd "$scriptParentDir"
+
+# runs the benchmarks on synthetic dependency graphs. Sample usage:
+#   ./bench.sh --sizes 100,1000,10000 --out new.json
+#   ./bench.sh compare old.json new.json
+python3 -m benchmark "$@"
@@ -0,0 +1,10 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmarks of depz on synthetic dependency graphs.
+
+Not a part of the distributed package. Run from the repository root:
+
+	python3 -m benchmark --sizes 100,1000 --out new.json
+	python3 -m benchmark compare old.json new.json
+"""
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import argparse
+import json
+import sys
+
+from benchmark.run import runAll, compareResults
+from benchmark.startup import measureStartup
+from benchmark.graphs import SHAPES
+
+
+def main(programArgs=None):
+	if programArgs is None:
+		programArgs = sys.argv[1:]
+
+	if programArgs[:1] == ["compare"]:
+		parser = argparse.ArgumentParser(prog="python3 -m benchmark compare")
+		parser.add_argument("old", help="JSON results of the baseline version")
+		parser.add_argument("new", help="JSON results of the version to compare")
+		args = parser.parse_args(programArgs[1:])
+		with open(args.old) as f:
+			old = json.load(f)
+		with open(args.new) as f:
+			new = json.load(f)
+		print(compareResults(old, new))
+		return
+
+	if programArgs[:1] == ["startup"]:
+		parser = argparse.ArgumentParser(prog="python3 -m benchmark startup")
+		parser.add_argument("--repeat", type=int, default=10,
+							help="Start each command N times and keep the best. Defaults to 10")
+		parser.add_argument("--budget-ms", type=float, default=20.0,
+							help="Fail if importing the CLI hot path adds more than this "
+								 "to the bare interpreter start. Defaults to 20")
+		args = parser.parse_args(programArgs[1:])
+		results = measureStartup(args.repeat)
+		for name, seconds in results["times"].items():
+			print(f"{name:<12} {seconds * 1000:>8.1f} ms")
+		overheadMs = results["importOverhead"] * 1000
+		print(f"import overhead {overheadMs:.1f} ms (budget {args.budget_ms:.1f} ms)")
+		print("depz modules: " + " ".join(results["hotPathModules"]))
+		if overheadMs > args.budget_ms:
+			sys.exit("Over the import budget")
+		return
+
+	parser = argparse.ArgumentParser(prog="python3 -m benchmark")
+	parser.add_argument("--shapes", type=str, default=",".join(SHAPES),
+						help=f"Comma-separated graph shapes. Defaults to {','.join(SHAPES)}")
+	parser.add_argument("--sizes", type=str, default="100,1000",
+						help="Comma-separated numbers of libraries. Defaults to 100,1000")
+	parser.add_argument("--modes", type=str, default="default,layout",
+						help="Comma-separated link modes. Defaults to default,layout")
+	parser.add_argument("--repeat", type=int, default=3,
+						help="Repeat each timing N times and keep the best. Defaults to 3")
+	parser.add_argument("--out", type=str,
+						help="Save the results as JSON to this file")
+	parser.add_argument("--memory", action="store_true",
+						help="Create the trees in memory instead of a temporary dir, "
+							 "leaving out the disk latency")
+	args = parser.parse_args(programArgs)
+
+	results = runAll(shapes=args.shapes.split(","),
+					 sizes=[int(s) for s in args.sizes.split(",")],
+					 modes=args.modes.split(","),
+					 repeat=args.repeat,
+					 log=lambda text: print(text, file=sys.stderr),
+					 memory=args.memory)
+	text = json.dumps(results, indent=2)
+	if args.out:
+		with open(args.out, "w") as f:
+			f.write(text + "\n")
+	else:
+		print(text)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Generators of synthetic library trees.
+
+Each generator creates the "project" dir and `size` library dirs under the
+root, writes their depz.txt files and returns the project dir. The files are
+written through depz.x10_fs, so the trees may be created in memory.
+"""
+
+from pathlib import Path
+from typing import *
+
+from depz.x10_fs import fs
+
+SHAPES = ["chain", "fanout", "diamond"]
+
+_EXTERNALS = ["numpy", "requests", "pandas", "flask", "attrs"]
+
+
+def _libName(i: int) -> str:
+	return f"lib{i:05d}"
+
+
+def _write(path: Path, text: str):
+	fs.writeBytes(str(path), text.encode())
+
+
+def _createLib(root: Path, i: int, deps: Iterable[int], layout: bool):
+	libDir = root / "libs" / _libName(i)
+	if layout:
+		fs.makedirs(str(libDir / "lib"))
+		fs.mkdir(str(libDir / "test"))
+		_write(libDir / "lib" / "code.dart", "")
+		_write(libDir / "test" / "code_test.dart", "")
+	else:
+		fs.makedirs(str(libDir))
+		_write(libDir / "__init__.py", "")
+	lines = [f"../{_libName(d)}" for d in deps]
+	lines.append(_EXTERNALS[i % len(_EXTERNALS)])
+	lines.append(f"external_{i % 50}")
+	_write(libDir / "depz.txt", "\n".join(lines) + "\n")
+
+
+def _createProject(root: Path, deps: Iterable[int]) -> Path:
+	projectDir = root / "project"
+	fs.makedirs(str(projectDir))
+	lines = [f"../libs/{_libName(d)}" for d in deps] + ["numpy"]
+	_write(projectDir / "depz.txt", "\n".join(lines) + "\n")
+	return projectDir
+
+
+def chain(root: Path, size: int, layout: bool = False) -> Path:
+	"""project -> lib0 -> lib1 -> ... -> lib(size-1). The deepest possible graph."""
+	for i in range(size):
+		_createLib(root, i, [i + 1] if i + 1 < size else [], layout)
+	return _createProject(root, [0])
+
+
+def fanout(root: Path, size: int, layout: bool = False) -> Path:
+	"""project -> each of the libraries directly. The widest possible graph."""
+	for i in range(size):
+		_createLib(root, i, [], layout)
+	return _createProject(root, range(size))
+
+
+def diamond(root: Path, size: int, layout: bool = False, width: int = 10) -> Path:
+	"""Layers of `width` libraries. Each library depends on two libraries of
+	the next layer, so most libraries are reachable by many paths."""
+	for i in range(size):
+		layer, pos = divmod(i, width)
+		nextLayer = (layer + 1) * width
+		deps = [nextLayer + pos, nextLayer + (pos + 1) % width]
+		_createLib(root, i, [d for d in deps if d < size], layout)
+	return _createProject(root, range(min(width, size)))
+
+
+def generate(shape: str, root: Path, size: int, layout: bool = False) -> Path:
+	generators: Dict[str, Callable[..., Path]] = {
+		"chain": chain, "fanout": fanout, "diamond": diamond}
+	return generators[shape](root, size, layout)
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import *
+
+from benchmark.graphs import generate
+from depz import __version__
+from depz.x00_common import Mode, printVerbose
+from depz.x05_stats import stats
+from depz.x10_fs import fs, MemoryFileSystem
+from depz.x80_rescanRelink import Scanner, traverse, computeMapping, relinkProject
+
+PHASES = ["scan", "mapping", "relink", "noop_relink", "unlink"]
+
+
+def _timed(func: Callable[[], Any]) -> Tuple[float, Any]:
+	started = time.perf_counter()
+	result = func()
+	return time.perf_counter() - started, result
+
+
+def _maxRssKb() -> Optional[int]:
+	try:
+		import resource
+	except ImportError:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def benchmarkProject(projectDir: Path, mode: Mode, repeat: int) -> Dict[str, Any]:
+	"""Times all the phases on the generated tree. Each timing is the best
+	of `repeat` runs."""
+	best: Dict[str, float] = {phase: float("inf") for phase in PHASES}
+	libsCount = 0
+	linksCount = 0
+
+	for _ in range(repeat):
+		scanner = Scanner()  # a new scanner does not remember anything
+		t, (localLibs, _) = _timed(lambda: traverse(projectDir, scanner))
+		best["scan"] = min(best["scan"], t)
+		t, mapping = _timed(lambda: computeMapping(localLibs, projectDir, mode, scanner.listings))
+		best["mapping"] = min(best["mapping"], t)
+		t, _ = _timed(lambda: relinkProject(projectDir, mapping, mode))
+		best["relink"] = min(best["relink"], t)
+		t, _ = _timed(lambda: relinkProject(projectDir, mapping, mode))
+		best["noop_relink"] = min(best["noop_relink"], t)
+		t, _ = _timed(lambda: relinkProject(projectDir, dict(), mode))
+		best["unlink"] = min(best["unlink"], t)
+		libsCount = len(localLibs)
+		linksCount = len(mapping)
+
+	# a separate pass: tracing allocations slows everything down
+	tracemalloc.start()
+	scanner = Scanner()
+	localLibs, _ = traverse(projectDir, scanner)
+	mapping = computeMapping(localLibs, projectDir, mode, scanner.listings)
+	relinkProject(projectDir, mapping, mode)
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	# one more pass counting the operations
+	relinkProject(projectDir, dict(), mode)
+	stats.reset()
+	stats.enabled = True
+	try:
+		scanner = Scanner()
+		localLibs, _ = traverse(projectDir, scanner)
+		relinkProject(projectDir, computeMapping(localLibs, projectDir, mode, scanner.listings),
+					  mode)
+	finally:
+		stats.enabled = False
+	counters = dict(stats.counters)
+	relinkProject(projectDir, dict(), mode)
+
+	return {"libs": libsCount,
+			"links": linksCount,
+			"times": best,
+			"peakTracedBytes": peak,
+			"counters": counters}
+
+
+def _runCase(shape: str, size: int, mode: Mode, repeat: int, root: Path,
+			 log: Callable[[str], None]) -> Dict[str, Any]:
+	t, projectDir = _timed(lambda: generate(shape, root, size, layout=mode == Mode.layout))
+	log(f"{shape} {size} {mode.name}: generated in {t:.2f} s")
+	return benchmarkProject(projectDir, mode, repeat)
+
+
+def runAll(shapes: List[str], sizes: List[int], modes: List[str], repeat: int,
+		   log: Callable[[str], None], memory: bool = False) -> Dict[str, Any]:
+	"""Runs the benchmark for each combination of the shapes, sizes and modes.
+
+	:param memory: Create the trees in memory (MemoryFileSystem) instead of a
+	temporary dir. The times then show the cost of the algorithms alone.
+	"""
+	printVerbose.allowed = False
+	cases: List[Dict[str, Any]] = list()
+	for shape in shapes:
+		for size in sizes:
+			for modeName in modes:
+				mode = Mode[modeName]
+				if memory:
+					with fs.using(MemoryFileSystem()):
+						case = _runCase(shape, size, mode, repeat, Path("/bench"), log)
+				else:
+					with TemporaryDirectory() as td:
+						case = _runCase(shape, size, mode, repeat, Path(td), log)
+				case.update({"shape": shape, "size": size, "mode": modeName})
+				log("  " + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in case["times"].items()))
+				cases.append(case)
+	return {"depz": __version__,
+			"filesystem": "memory" if memory else "os",
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"maxRssKb": _maxRssKb(),
+			"cases": cases}
+
+
+def compareResults(old: Dict[str, Any], new: Dict[str, Any]) -> str:
+	"""Returns a table with the timings of the same cases side by side."""
+
+	def key(case):
+		return case["shape"], case["size"], case["mode"]
+
+	oldCases = {key(c): c for c in old["cases"]}
+	lines = [f"{'case':<28} {'phase':<12} {old['depz']:>12} {new['depz']:>12} {'ratio':>7}"]
+	for case in new["cases"]:
+		before = oldCases.get(key(case))
+		if before is None:
+			continue
+		name = " ".join(str(k) for k in key(case))
+		for phase in PHASES:
+			a = before["times"].get(phase)
+			b = case["times"].get(phase)
+			if a is None or b is None:
+				continue
+			ratio = b / a if a else float("inf")
+			lines.append(f"{name:<28} {phase:<12} {a * 1000:>10.1f}ms {b * 1000:>10.1f}ms "
+						 f"{ratio:>6.2f}x")
+		lines.append(f"{name:<28} {'peak memory':<12} {before['peakTracedBytes']:>12} "
+					 f"{case['peakTracedBytes']:>12}")
+	return "\n".join(lines)
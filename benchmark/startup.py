@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Cold start timings of the CLI.
+
+Each command runs in a new interpreter, so the timings include the imports.
+The bare interpreter start is measured as well and subtracted: the budget
+only limits what depz adds on top of it. The bytecode is cached, as it is
+for an installed package.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import *
+
+from benchmark.graphs import generate
+
+# the modules imported by a typical run of the console script
+HOT_PATH_IMPORT = "import argparse, depz.x99_run, depz.x98_dooo"
+
+# the commands run in other dirs, so the tested depz is passed by the path
+_ENV = dict(os.environ,
+			PYTHONPATH=os.pathsep.join(
+				[str(Path(__file__).parent.parent)] +
+				[p for p in [os.environ.get("PYTHONPATH")] if p]))
+# without the cached bytecode each run would compile all the modules
+_ENV.pop("PYTHONDONTWRITEBYTECODE", None)
+
+
+def _bestTime(args: List[str], repeat: int, cwd: Optional[Path] = None) -> float:
+	best = float("inf")
+	for _ in range(repeat):
+		started = time.perf_counter()
+		subprocess.run(args, cwd=None if cwd is None else str(cwd), env=_ENV, check=True,
+					   stdout=subprocess.DEVNULL)
+		best = min(best, time.perf_counter() - started)
+	return best
+
+
+def importedModules(code: str) -> List[str]:
+	"""Returns the names of all the modules loaded after running the code."""
+	script = code + "\nimport sys\nprint('\\n'.join(sorted(sys.modules)))"
+	out = subprocess.check_output([sys.executable, "-c", script], env=_ENV)
+	return out.decode().split()
+
+
+def measureStartup(repeat: int) -> Dict[str, Any]:
+	python = sys.executable
+	_bestTime([python, "-c", HOT_PATH_IMPORT], 1)  # writes the bytecode
+	times: Dict[str, float] = dict()
+	times["interpreter"] = _bestTime([python, "-c", "pass"], repeat)
+	times["argparse"] = _bestTime([python, "-c", "import argparse"], repeat)
+	times["import"] = _bestTime([python, "-c", HOT_PATH_IMPORT], repeat)
+	times["version"] = _bestTime(
+		[python, "-c", "from depz import runmain; runmain(['--version'])"], repeat)
+	with TemporaryDirectory() as td:
+		projectDir = generate("chain", Path(td), 3)
+		times["scan"] = _bestTime(
+			[python, "-c", "from depz import runmain; runmain(['-e', 'line'])"],
+			repeat, cwd=projectDir)
+	depzModules = [m for m in importedModules(HOT_PATH_IMPORT) if m.startswith("depz")]
+	return {"times": times,
+			"importOverhead": times["import"] - times["interpreter"],
+			"hotPathModules": depzModules}
@@ -1,2 +1,26 @@
 from .x00_version import __version__
-from .x99_run import runmain
+
+# The rest is imported on first access, so that "import depz" (and the
+# console script) does not pay for the modules a run may not need.
+_LAZY = {
+	"runmain": "x99_run",
+	"iterGraph": "x80_rescanRelink",
+	"buildGraph": "x80_rescanRelink",
+	"ManifestRead": "x80_rescanRelink",
+	"LocalEdge": "x80_rescanRelink",
+	"ExternalDep": "x80_rescanRelink",
+}
+
+
+def __getattr__(name):
+	moduleName = _LAZY.get(name)
+	if moduleName is None:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	from importlib import import_module
+	value = getattr(import_module(f".{moduleName}", __package__), name)
+	globals()[name] = value
+	return value
+
+
+def __dir__():
+	return sorted(list(globals()) + list(_LAZY))
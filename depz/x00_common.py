@@ -10,9 +10,19 @@ class Mode(IntEnum):
 	layout = auto()
 
 
+class CopyMethod(IntEnum):
+	"""How --materialize puts the files of the libraries into the project."""
+	clone = auto()  # reflink, then copy_file_range, then a plain copy
+	hardlink = auto()  # falls back to a copy across filesystems
+	copy = auto()
+
+
 def printVerbose(text: str):
 	if printVerbose.allowed:
 		print(text)
+	if printVerbose.log is not None:
+		print(text, file=printVerbose.log)
 
 
 printVerbose.allowed = True
+printVerbose.log = None  # a text file receiving the verbose output even when not allowed
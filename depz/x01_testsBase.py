@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: (c) 2020 Art Galkin <ortemeo@gmail.com>
 # SPDX-License-Identifier: BSD-3-Clause
 
+import os
 import unittest
 from pathlib import Path
 
@@ -14,9 +15,22 @@ class TestWithDataDir(unittest.TestCase):
 		return d
 
 
-class TestWithTempDir(unittest.TestCase):
+class TestWithoutDaemon(unittest.TestCase):
+	"""The runmain calls never reach a daemon the user may be running:
+	the socket path points to a file that does not exist."""
 
 	def setUp(self):
+		from unittest import mock
+		from depz.x88_daemon import SOCKET_ENV
+		patcher = mock.patch.dict(os.environ, {SOCKET_ENV: "/nonexistent/depz.sock"})
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+
+class TestWithTempDir(TestWithoutDaemon):
+
+	def setUp(self):
+		super().setUp()
 		from tempfile import TemporaryDirectory
 		self._td = TemporaryDirectory()
 		self.tempDir = Path(self._td.name)
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+# imported by each CLI run: threading, contextlib and typing are avoided,
+# they would add to the startup time
+import _thread
+import time
+
+
+class _NullPhase:
+	def __enter__(self):
+		pass
+
+	def __exit__(self, *exc):
+		return False
+
+
+_nullPhase = _NullPhase()
+
+
+class _TimedPhase:
+	def __init__(self, owner: "Stats", name: str):
+		self.owner = owner
+		self.name = name
+		self.started = 0.0
+
+	def __enter__(self):
+		self.started = time.perf_counter()
+
+	def __exit__(self, *exc):
+		elapsed = time.perf_counter() - self.started
+		with self.owner._lock:
+			phases = self.owner.phases
+			phases[self.name] = phases.get(self.name, 0.0) + elapsed
+		return False
+
+
+class Stats:
+	"""Performance counters of a run. Collected only when enabled.
+
+	Phase times are wall times summed over all the threads, so with
+	--jobs they may exceed the total time.
+	"""
+
+	def __init__(self):
+		self.enabled = False
+		self._lock = _thread.allocate_lock()
+		self.reset()
+
+	def reset(self):
+		self.phases: "Dict[str, float]" = dict()
+		self.counters: "Dict[str, int]" = dict()
+		self.dirTimes: "Dict[str, float]" = dict()
+		self.nodes = 0
+		self.edges = 0
+		self._started = time.perf_counter()
+
+	def count(self, name: str, n: int = 1):
+		"""Increments the counter of the operation, usually a syscall."""
+		if self.enabled:
+			with self._lock:
+				self.counters[name] = self.counters.get(name, 0) + n
+
+	def phase(self, name: str):
+		"""Returns a context manager that adds the time spent inside to the phase."""
+		if not self.enabled:
+			return _nullPhase
+		return _TimedPhase(self, name)
+
+	def dirScanned(self, dirPath: str, elapsed: float):
+		if self.enabled:
+			with self._lock:
+				self.dirTimes[dirPath] = self.dirTimes.get(dirPath, 0.0) + elapsed
+
+	def slowestDirs(self, count: int = 10) -> "List[Tuple[str, float]]":
+		return sorted(self.dirTimes.items(), key=lambda item: -item[1])[:count]
+
+	def toDict(self) -> "Dict[str, Any]":
+		return {
+			"total": time.perf_counter() - self._started,
+			"phases": dict(self.phases),
+			"counters": dict(sorted(self.counters.items())),
+			"graph": {"nodes": self.nodes, "edges": self.edges},
+			"slowestDirs": [{"dir": d, "time": t} for d, t in self.slowestDirs()],
+		}
+
+	def report(self) -> str:
+		data = self.toDict()
+		lines = [f"Total time: {data['total'] * 1000:.1f} ms", "Phases:"]
+		for name, seconds in data["phases"].items():
+			lines.append(f"  {name}: {seconds * 1000:.1f} ms")
+		lines.append("Operations:")
+		for name, n in data["counters"].items():
+			lines.append(f"  {name}: {n}")
+		lines.append(f"Graph: {self.nodes} nodes, {self.edges} edges")
+		lines.append("Slowest dirs:")
+		for d, seconds in self.slowestDirs():
+			lines.append(f"  {seconds * 1000:.1f} ms  {d}")
+		return "\n".join(lines)
+
+
+stats = Stats()
@@ -0,0 +1,43 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+
+from depz import runmain
+from depz.x01_testsBase import TestWithTempDir
+from depz.x05_stats import stats
+from depz.x99_run_test import CapturedOutput
+
+
+class TestStats(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		(self.project / "depz.txt").write_text("../lib1\n../lib2\nnumpy\n")
+		(self.mkd(self.tempDir / "lib1") / "depz.txt").write_text("../lib2\nrequests\n")
+		self.mkd(self.tempDir / "lib2")
+		self.jsonFile = self.tempDir / "stats.json"
+
+	def run_depz(self, *args):
+		with CapturedOutput() as output:
+			runmain(["--project", str(self.project), "--no-cache", "--stats",
+					 "--stats-json", str(self.jsonFile)] + list(args))
+		return json.loads(self.jsonFile.read_text()), output
+
+	def test_counters(self):
+		data, output = self.run_depz("--relink")
+		self.assertEqual(data["graph"], {"nodes": 3, "edges": 3})
+		self.assertEqual(data["counters"]["read"], 3)  # two manifests and the links file
+		self.assertEqual(data["counters"]["symlink"], 2)
+		for phase in ["discovery", "read", "resolve", "mapping", "links scan", "links apply"]:
+			self.assertIn(phase, data["phases"])
+		self.assertEqual(len(data["slowestDirs"]), 3)
+		self.assertTrue("Slowest dirs:" in output.err)
+		self.assertFalse(stats.enabled)
+
+	def test_noop_relink_writes_nothing(self):
+		self.run_depz("--relink")
+		data, _ = self.run_depz("--relink")
+		for op in ["symlink", "unlink", "rename", "rmdir", "mkdir"]:
+			self.assertNotIn(op, data["counters"])
@@ -0,0 +1,447 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""The filesystem operations of scanning and relinking.
+
+The code calls the methods of the global `fs` object, which forwards them
+to the backend in use: OsFileSystem by default, or MemoryFileSystem, which
+keeps the whole tree in memory. The backends count the operations, so the
+operation counts tell the algorithmic cost apart from the disk latency.
+
+All the paths are strings. The errors are the same OSError subclasses the
+os module raises.
+"""
+
+import errno
+import os
+import posixpath
+import stat
+
+from depz.x05_stats import stats
+
+# The annotations are strings, since importing typing would slow down each
+# CLI run. DirEntry is the (name, isDir, isSymlink) tuple. The isDir follows
+# symlinks, as os.DirEntry.is_dir does.
+
+
+class OsFileSystem:
+	"""The real filesystem. Counts the operations to the global stats."""
+
+	def scandir(self, path: str) -> "List[DirEntry]":
+		stats.count("scandir")
+		result: "List[DirEntry]" = list()
+		with os.scandir(path) as it:
+			for entry in it:
+				try:
+					isDir = entry.is_dir()
+				except OSError:
+					isDir = False
+				result.append((entry.name, isDir, entry.is_symlink()))
+		return result
+
+	def stat(self, path: str) -> os.stat_result:
+		stats.count("stat")
+		return os.stat(path)
+
+	def lstat(self, path: str) -> os.stat_result:
+		stats.count("stat")
+		return os.lstat(path)
+
+	def exists(self, path: str) -> bool:
+		stats.count("stat")
+		return os.path.exists(path)
+
+	def isDir(self, path: str) -> bool:
+		stats.count("stat")
+		return os.path.isdir(path)
+
+	def realpath(self, path: str) -> str:
+		stats.count("realpath")
+		return os.path.realpath(path)
+
+	def readlink(self, path: str) -> str:
+		stats.count("readlink")
+		return os.readlink(path)
+
+	def readText(self, path: str) -> str:
+		stats.count("read")
+		with open(path, "r") as f:
+			return f.read()
+
+	def readBytes(self, path: str) -> bytes:
+		stats.count("read")
+		with open(path, "rb") as f:
+			return f.read()
+
+	def writeBytes(self, path: str, data: bytes):
+		stats.count("write")
+		with open(path, "wb") as f:
+			f.write(data)
+
+	def symlink(self, target: str, path: str, isDir: bool = False):
+		stats.count("symlink")
+		os.symlink(target, path, target_is_directory=isDir)
+
+	def replace(self, src: str, dst: str):
+		stats.count("rename")
+		os.replace(src, dst)
+
+	def unlink(self, path: str):
+		stats.count("unlink")
+		os.unlink(path)
+
+	def mkdir(self, path: str):
+		stats.count("mkdir")
+		os.mkdir(path)
+
+	def makedirs(self, path: str):
+		"""Creates the dir and its missing parents. Does nothing if the dir exists."""
+		stats.count("mkdir")
+		os.makedirs(path, exist_ok=True)
+
+	def rmdir(self, path: str):
+		stats.count("rmdir")
+		os.rmdir(path)
+
+
+class _Dir:
+	__slots__ = ("children", "ino", "mtimeNs")
+
+	def __init__(self, ino: int, mtimeNs: int):
+		self.children: "Dict[str, Any]" = dict()
+		self.ino = ino
+		self.mtimeNs = mtimeNs
+
+
+class _File:
+	__slots__ = ("data", "ino", "mtimeNs")
+
+	def __init__(self, data: bytes, ino: int, mtimeNs: int):
+		self.data = data
+		self.ino = ino
+		self.mtimeNs = mtimeNs
+
+
+class _Link:
+	__slots__ = ("target", "ino", "mtimeNs")
+
+	def __init__(self, target: str, ino: int, mtimeNs: int):
+		self.target = target
+		self.ino = ino
+		self.mtimeNs = mtimeNs
+
+
+class MemoryStat:
+	"""The fields of os.stat_result that depz uses."""
+	__slots__ = ("st_mode", "st_ino", "st_size", "st_mtime_ns", "st_atime_ns")
+
+	def __init__(self, st_mode: int, st_ino: int, st_size: int, st_mtime_ns: int,
+				 st_atime_ns: int):
+		self.st_mode = st_mode
+		self.st_ino = st_ino
+		self.st_size = st_size
+		self.st_mtime_ns = st_mtime_ns
+		self.st_atime_ns = st_atime_ns
+
+
+def _error(cls, code: int, path: str) -> OSError:
+	return cls(code, os.strerror(code), path)
+
+
+class MemoryFileSystem:
+	"""A POSIX-like tree of dirs, files and symlinks kept in memory.
+
+	Relative paths are relative to the root. The symlinks are resolved
+	component by component, like the kernel does, including ".." after
+	a symlink and the ELOOP limit. The mtimes come from a counter that
+	grows with each change, so a rewritten file always gets a new signature.
+
+	The operations are counted to the `ops` dict under the same names as
+	the OS backend uses, and to the global stats too.
+	"""
+
+	_MAX_SYMLINKS = 40
+
+	def __init__(self):
+		self._clock = 0
+		self._root = _Dir(self._tick(), self._clock)
+		self.ops: "Dict[str, int]" = dict()
+
+	def _tick(self) -> int:
+		self._clock += 1
+		return self._clock
+
+	def _count(self, name: str):
+		self.ops[name] = self.ops.get(name, 0) + 1
+		stats.count(name)
+
+	def resetOps(self):
+		self.ops.clear()
+
+	def _walk(self, path: str, followLast: bool, depth: int = 0) -> "Tuple[Any, str]":
+		"""Returns the node at the path (None if it does not exist) and the
+		real path of it."""
+		if depth > self._MAX_SYMLINKS:
+			raise _error(OSError, errno.ELOOP, path)
+		parts = [p for p in path.split("/") if p and p != "."]
+		node, real = self._root, "/"
+		for i, name in enumerate(parts):
+			if not isinstance(node, _Dir):
+				raise _error(NotADirectoryError, errno.ENOTDIR, path)
+			if name == "..":
+				# the parent of the real dir, not of the symlink we came through
+				real = posixpath.dirname(real)
+				node = self._walk(real, True, depth)[0]
+				continue
+			child = node.children.get(name)
+			childReal = real + name if real == "/" else real + "/" + name
+			if isinstance(child, _Link) and (followLast or i < len(parts) - 1):
+				child, childReal = self._walk(posixpath.join(real, child.target), True,
+											  depth + 1)
+			if child is None:
+				return None, posixpath.normpath(posixpath.join(childReal, *parts[i + 1:]))
+			node, real = child, childReal
+		return node, real
+
+	def _node(self, path: str, follow: bool = True):
+		node, _ = self._walk(path, follow)
+		if node is None:
+			raise _error(FileNotFoundError, errno.ENOENT, path)
+		return node
+
+	def _parent(self, path: str) -> "Tuple[_Dir, str]":
+		parentPath, name = posixpath.split(posixpath.normpath("/" + path))
+		parent = self._node(parentPath)
+		if not isinstance(parent, _Dir):
+			raise _error(NotADirectoryError, errno.ENOTDIR, path)
+		return parent, name
+
+	def _stat(self, node) -> MemoryStat:
+		if isinstance(node, _Dir):
+			return MemoryStat(stat.S_IFDIR | 0o755, node.ino, 0, node.mtimeNs, node.mtimeNs)
+		if isinstance(node, _Link):
+			return MemoryStat(stat.S_IFLNK | 0o777, node.ino, len(node.target),
+							  node.mtimeNs, node.mtimeNs)
+		return MemoryStat(stat.S_IFREG | 0o644, node.ino, len(node.data),
+						  node.mtimeNs, node.mtimeNs)
+
+	def scandir(self, path: str) -> "List[DirEntry]":
+		self._count("scandir")
+		node = self._node(path)
+		if not isinstance(node, _Dir):
+			raise _error(NotADirectoryError, errno.ENOTDIR, path)
+		result: "List[DirEntry]" = list()
+		for name, child in node.children.items():
+			isLink = isinstance(child, _Link)
+			if isLink:
+				try:
+					target, _ = self._walk(posixpath.join(path, name), True)
+				except OSError:
+					target = None
+				isDir = isinstance(target, _Dir)
+			else:
+				isDir = isinstance(child, _Dir)
+			result.append((name, isDir, isLink))
+		return result
+
+	def stat(self, path: str) -> MemoryStat:
+		self._count("stat")
+		return self._stat(self._node(path))
+
+	def lstat(self, path: str) -> MemoryStat:
+		self._count("stat")
+		return self._stat(self._node(path, follow=False))
+
+	def exists(self, path: str) -> bool:
+		self._count("stat")
+		try:
+			return self._walk(path, True)[0] is not None
+		except OSError:
+			return False
+
+	def isDir(self, path: str) -> bool:
+		self._count("stat")
+		try:
+			return isinstance(self._walk(path, True)[0], _Dir)
+		except OSError:
+			return False
+
+	def realpath(self, path: str) -> str:
+		self._count("realpath")
+		try:
+			return self._walk(path, True)[1]
+		except OSError:
+			return posixpath.normpath("/" + path)
+
+	def readlink(self, path: str) -> str:
+		self._count("readlink")
+		node = self._node(path, follow=False)
+		if not isinstance(node, _Link):
+			raise _error(OSError, errno.EINVAL, path)
+		return node.target
+
+	def readBytes(self, path: str) -> bytes:
+		self._count("read")
+		node = self._node(path)
+		if isinstance(node, _Dir):
+			raise _error(IsADirectoryError, errno.EISDIR, path)
+		return node.data
+
+	def readText(self, path: str) -> str:
+		return self.readBytes(path).decode()
+
+	def writeBytes(self, path: str, data: bytes):
+		self._count("write")
+		parent, name = self._parent(path)
+		node = parent.children.get(name)
+		if isinstance(node, _Link):
+			node = self._walk(path, True)[0]
+		if isinstance(node, _Dir):
+			raise _error(IsADirectoryError, errno.EISDIR, path)
+		if isinstance(node, _File):
+			node.data = data
+			node.mtimeNs = self._tick()
+		else:
+			parent.children[name] = _File(data, self._tick(), self._clock)
+			parent.mtimeNs = self._clock
+
+	def writeText(self, path: str, text: str):
+		self.writeBytes(path, text.encode())
+
+	def symlink(self, target: str, path: str, isDir: bool = False):
+		self._count("symlink")
+		parent, name = self._parent(path)
+		if name in parent.children:
+			raise _error(FileExistsError, errno.EEXIST, path)
+		parent.children[name] = _Link(target, self._tick(), self._clock)
+		parent.mtimeNs = self._clock
+
+	def replace(self, src: str, dst: str):
+		self._count("rename")
+		srcParent, srcName = self._parent(src)
+		node = srcParent.children.get(srcName)
+		if node is None:
+			raise _error(FileNotFoundError, errno.ENOENT, src)
+		dstParent, dstName = self._parent(dst)
+		old = dstParent.children.get(dstName)
+		if isinstance(old, _Dir):
+			if not isinstance(node, _Dir):
+				raise _error(IsADirectoryError, errno.EISDIR, dst)
+			if old.children:
+				raise _error(OSError, errno.ENOTEMPTY, dst)
+		del srcParent.children[srcName]
+		dstParent.children[dstName] = node
+		srcParent.mtimeNs = dstParent.mtimeNs = self._tick()
+
+	def unlink(self, path: str):
+		self._count("unlink")
+		parent, name = self._parent(path)
+		node = parent.children.get(name)
+		if node is None:
+			raise _error(FileNotFoundError, errno.ENOENT, path)
+		if isinstance(node, _Dir):
+			raise _error(IsADirectoryError, errno.EISDIR, path)
+		del parent.children[name]
+		parent.mtimeNs = self._tick()
+
+	def mkdir(self, path: str):
+		self._count("mkdir")
+		parent, name = self._parent(path)
+		if name in parent.children:
+			raise _error(FileExistsError, errno.EEXIST, path)
+		parent.children[name] = _Dir(self._tick(), self._clock)
+		parent.mtimeNs = self._clock
+
+	def makedirs(self, path: str):
+		"""Creates the dir and its missing parents. Does nothing if the dir exists."""
+		self._count("mkdir")
+		current = ""
+		for name in posixpath.normpath("/" + path).split("/")[1:]:
+			current += "/" + name
+			node, _ = self._walk(current, True)
+			if node is None:
+				parent, _ = self._parent(current)
+				parent.children[name] = _Dir(self._tick(), self._clock)
+				parent.mtimeNs = self._clock
+			elif not isinstance(node, _Dir):
+				raise _error(FileExistsError, errno.EEXIST, current)
+
+	def rmdir(self, path: str):
+		self._count("rmdir")
+		parent, name = self._parent(path)
+		node = parent.children.get(name)
+		if node is None:
+			raise _error(FileNotFoundError, errno.ENOENT, path)
+		if not isinstance(node, _Dir):
+			raise _error(NotADirectoryError, errno.ENOTDIR, path)
+		if node.children:
+			raise _error(OSError, errno.ENOTEMPTY, path)
+		del parent.children[name]
+		parent.mtimeNs = self._tick()
+
+
+_METHODS = ("scandir", "stat", "lstat", "exists", "isDir", "realpath", "readlink",
+			"readText", "readBytes", "writeBytes", "symlink", "replace", "unlink",
+			"mkdir", "makedirs", "rmdir")
+
+
+class CurrentFileSystem:
+	"""Forwards the calls to the backend in use. The methods of the backend
+	are bound to the attributes of this object, so a call costs the same as
+	calling the backend directly."""
+
+	def __init__(self, backend):
+		self.backend = None
+		self.setBackend(backend)
+
+	def setBackend(self, backend):
+		self.backend = backend
+		for name in _METHODS:
+			setattr(self, name, getattr(backend, name))
+
+	def using(self, backend) -> "_UsingBackend":
+		"""Uses the backend inside the with block. Not thread-safe: meant for
+		the tests and the benchmarks."""
+		return _UsingBackend(self, backend)
+
+
+class _UsingBackend:
+	def __init__(self, current: CurrentFileSystem, backend):
+		self.current = current
+		self.backend = backend
+		self.old = None
+
+	def __enter__(self):
+		self.old = self.current.backend
+		self.current.setBackend(self.backend)
+		return self.backend
+
+	def __exit__(self, *exc):
+		self.current.setBackend(self.old)
+		return False
+
+
+fs = CurrentFileSystem(OsFileSystem())
+
+
+def replaceFileAtomically(path: str, create: "Callable[[str], None]"):
+	"""Calls create with a temporary path in the same dir, then renames the
+	created file over the path. The readers see either the old file or the
+	new one, never a half-written one. If anything fails, the temporary
+	file is removed and the error is raised."""
+	head, name = os.path.split(path)
+	tempPath = os.path.join(head, f".{name}.depz-{os.getpid()}.tmp")
+	try:
+		create(tempPath)
+		fs.replace(tempPath, path)
+	except BaseException:
+		try:
+			fs.unlink(tempPath)
+		except OSError:
+			pass
+		raise
+
+
+def writeFileAtomically(path: str, data: bytes):
+	"""Replaces the file with the data, see replaceFileAtomically."""
+	replaceFileAtomically(path, lambda tempPath: fs.writeBytes(tempPath, data))
@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import stat
+
+from depz.x01_testsBase import TestWithTempDir
+from depz.x10_fs import fs, OsFileSystem, MemoryFileSystem, writeFileAtomically, \
+	replaceFileAtomically
+
+
+def scenario(backend, root: str) -> list:
+	"""Runs the same operations on the backend and returns what they gave."""
+	results = list()
+
+	def attempt(func, *args):
+		try:
+			result = func(*args)
+		except OSError as e:
+			result = type(e).__name__
+		results.append(result)
+
+	backend.makedirs(root + "/libs/libA/sub")
+	backend.writeBytes(root + "/libs/libA/depz.txt", b"numpy\n")
+	backend.mkdir(root + "/project")
+	backend.symlink(root + "/libs/libA", root + "/project/libA", True)
+	backend.symlink("../libs/libA/sub", root + "/project/rel", True)
+	backend.symlink("missing", root + "/project/broken")
+	backend.symlink("loop", root + "/project/loop")
+
+	attempt(lambda p: sorted(backend.scandir(p)), root + "/project")
+	attempt(backend.readText, root + "/project/libA/depz.txt")
+	attempt(backend.readText, root + "/project/rel/../depz.txt")
+	attempt(backend.readlink, root + "/project/rel")
+	attempt(backend.readlink, root + "/project")
+	attempt(lambda p: stat.S_ISLNK(backend.lstat(p).st_mode), root + "/project/libA")
+	attempt(lambda p: stat.S_ISDIR(backend.stat(p).st_mode), root + "/project/libA")
+	attempt(backend.stat, root + "/project/broken")
+	attempt(backend.stat, root + "/project/loop")
+	attempt(backend.exists, root + "/project/broken")
+	attempt(backend.isDir, root + "/project/rel")
+	attempt(backend.realpath, root + "/project/rel/..")
+	attempt(backend.mkdir, root + "/project")
+	attempt(backend.mkdir, root + "/nothing/dir")
+	attempt(backend.rmdir, root + "/libs")
+	attempt(backend.unlink, root + "/libs")
+	attempt(backend.unlink, root + "/project/missing")
+	attempt(backend.scandir, root + "/libs/libA/depz.txt")
+
+	backend.symlink(root + "/libs", root + "/project/.tmp")
+	backend.replace(root + "/project/.tmp", root + "/project/libA")
+	attempt(backend.readlink, root + "/project/libA")
+	backend.unlink(root + "/project/broken")
+	attempt(lambda p: sorted(name for name, _, _ in backend.scandir(p)), root + "/project")
+	return results
+
+
+class TestMemoryFileSystem(TestWithTempDir):
+
+	def test_same_as_os(self):
+		real = str(self.tempDir.resolve())
+		osResults = scenario(OsFileSystem(), real)
+		memoryResults = scenario(MemoryFileSystem(), real)
+		self.assertEqual(memoryResults, osResults)
+		self.assertEqual(memoryResults[7:9], ["FileNotFoundError", "OSError"])
+
+	def test_counts_and_signatures(self):
+		memory = MemoryFileSystem()
+		memory.makedirs("/a")
+		memory.writeText("/a/depz.txt", "x")
+		first = memory.stat("/a/depz.txt")
+		memory.writeText("/a/depz.txt", "y")
+		second = memory.stat("/a/depz.txt")
+		self.assertEqual(first.st_ino, second.st_ino)
+		self.assertNotEqual(first.st_mtime_ns, second.st_mtime_ns)
+		self.assertEqual(memory.ops, {"mkdir": 1, "write": 2, "stat": 2})
+
+	def test_using(self):
+		memory = MemoryFileSystem()
+		with fs.using(memory):
+			fs.makedirs("/x")
+			self.assertTrue(fs.isDir("/x"))
+		self.assertIsInstance(fs.backend, OsFileSystem)
+		self.assertEqual(memory.ops["mkdir"], 1)
+
+	def test_atomic_write(self):
+		memory = MemoryFileSystem()
+		memory.makedirs("/p")
+		with fs.using(memory):
+			writeFileAtomically("/p/file", b"old")
+
+			def failing(tempPath: str):
+				fs.writeBytes(tempPath, b"half")
+				raise OSError("disk full")
+
+			with self.assertRaises(OSError):
+				replaceFileAtomically("/p/file", failing)
+			self.assertEqual(fs.readBytes("/p/file"), b"old")
+			self.assertEqual(fs.scandir("/p"), [("file", False, False)])
@@ -0,0 +1,42 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from pathlib import Path
+
+from depz.x10_fs import fs
+
+
+class DirListings:
+	"""Directory listings cached for the duration of a run.
+
+	Each directory is listed with a single scandir call. The file types
+	come from the directory entries, so regular files and dirs need no extra
+	stat calls (symlinks are followed, as Path.is_dir does).
+
+	Safe to use from several scanning threads: in the worst case a dir is
+	listed twice.
+	"""
+
+	def __init__(self):
+		self._cache: "Dict[str, Dict[str, bool]]" = dict()
+
+	def entries(self, dirPath: Path) -> "Dict[str, bool]":
+		"""Returns name -> isDir for each entry of the dir. Returns an empty
+		dict if the dir does not exist or is not a dir."""
+		key = str(dirPath)
+		result = self._cache.get(key)
+		if result is None:
+			try:
+				result = {name: isDir for name, isDir, _ in fs.scandir(key)}
+			except (FileNotFoundError, NotADirectoryError):
+				result = dict()
+			self._cache[key] = result
+		return result
+
+	def subdirs(self, dirPath: Path) -> "List[str]":
+		"""Returns the names of subdirectories (including symlinks to dirs)."""
+		return [name for name, isDir in self.entries(dirPath).items() if isDir]
+
+	def forget(self, dirPath: Path):
+		"""Drops the cached listing, so the dir will be listed again."""
+		self._cache.pop(str(dirPath), None)
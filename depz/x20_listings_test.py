@@ -0,0 +1,47 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+from unittest import mock
+
+from depz.x01_testsBase import TestWithTempDir
+from depz.x20_listings import DirListings
+from depz.x80_rescanRelink import pydpnFiles, layoutMapping
+
+
+class TestManifestDiscovery(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.lib = self.mkd(self.tempDir / "libA")
+		self.mkd(self.lib / "lib")
+		self.mkd(self.lib / "test")
+		for p in [self.lib / "depz.txt", self.lib / "lib" / "depz.txt",
+				  self.lib / "lib" / "pydpn.txt", self.lib / "other.txt"]:
+			p.touch()
+
+	def test_order(self):
+		self.assertEqual(list(pydpnFiles(self.lib)),
+						 [self.lib / "depz.txt", self.lib / "lib" / "depz.txt",
+						  self.lib / "lib" / "pydpn.txt"])
+
+	def test_custom_names(self):
+		self.assertEqual(list(pydpnFiles(self.lib, names=["other.txt"])),
+						 [self.lib / "other.txt"])
+
+	def test_no_lib_subdir(self):
+		(self.lib / "lib" / "depz.txt").unlink()
+		(self.lib / "lib" / "pydpn.txt").unlink()
+		(self.lib / "lib").rmdir()
+		self.assertEqual(list(pydpnFiles(self.lib)), [self.lib / "depz.txt"])
+
+	def test_listings_reused(self):
+		listings = DirListings()
+		with mock.patch("os.scandir", wraps=os.scandir) as scandir:
+			list(pydpnFiles(self.lib, listings))
+			pairs = list(layoutMapping(self.lib, self.tempDir / "project", listings))
+		self.assertEqual(scandir.call_count, 2)  # libA and libA/lib
+		self.assertEqual(sorted(dst.parent.name for _, dst in pairs), ["lib", "test"])
+
+	def test_missing_dir(self):
+		self.assertEqual(list(pydpnFiles(self.tempDir / "nothing")), [])
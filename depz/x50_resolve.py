@@ -2,13 +2,13 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 import os
+import stat
 from pathlib import Path
-from typing import Optional
 
-from depz.x01_testsBase import TestWithTempDir
+from depz.x10_fs import fs
 
 
-def resolvePath(rootDir: Path, packageDir: str) -> Optional[Path]:
+def resolvePath(rootDir: Path, packageDir: str) -> "Optional[Path]":
 	"""Gives interpretation to a single line of depz.txt.
 
 	:param rootDir: The directory where depz.txt found.
@@ -22,30 +22,105 @@ def resolvePath(rootDir: Path, packageDir: str) -> Optional[Path]:
 	packageDir = os.path.expandvars(packageDir)
 	packageDir = os.path.normpath(packageDir)
 
-	if os.path.isabs(packageDir):
-		packageDirPath = Path(packageDir)
-	else:
-		packageDirPath = rootDir / packageDir
-	packageDirPath = packageDirPath.resolve()
+	if not os.path.isabs(packageDir):
+		packageDir = os.path.join(os.path.abspath(str(rootDir)), packageDir)
+	packageDir = fs.realpath(packageDir)
 
-	if packageDirPath.exists() and packageDirPath.is_dir():
-		return packageDirPath
+	if fs.isDir(packageDir):
+		return Path(packageDir)
 
 
-class TestResolvePath(TestWithTempDir):
+_MAX_SYMLINKS = 40  # as in Linux, after that ELOOP
 
-	def test_relative(self):
-		projectDir = self.mkd(self.tempDir/"prj"/"project")
-		libDir = self.mkd(self.tempDir/"libs"/"libA")
-		# finding libDir by relative path
-		self.assertTrue(libDir.samefile(resolvePath(projectDir, "../../libs/libA")))
 
-	def test_absolute(self):
-		projectDir = self.mkd(self.tempDir/"prj"/"project")
-		libDir = self.mkd(self.tempDir/"libs"/"libA")
-		# finding libDir by absolute path
-		self.assertTrue(libDir.samefile(resolvePath(projectDir, str(libDir.absolute()))))
+class PathResolver:
+	"""Memoizing version of resolvePath for resolving many lines during one run.
 
-	def test_no_such_dir(self):
-		projectDir = self.mkd(self.tempDir/"prj"/"project")
-		self.assertEqual(resolvePath(projectDir, "linking_nowhere_2412648263486"), None)
\ No newline at end of file
+	Keeps three caches:
+	- the (rootDir, line) memo, so repeating lines are not even parsed twice;
+	- the negative part of the same memo: lines that resolved to nothing
+	  (usually external names like "numpy") are remembered as None;
+	- the realpath cache of every path component already visited, so the
+	  common parents of the libraries are lstat'ed only once.
+
+	As a result, the number of syscalls depends on the number of distinct
+	paths rather than the number of lines.
+
+	The results are interned: a dir referenced by many manifests is returned
+	as the same Path object each time.
+	"""
+
+	def __init__(self):
+		# rootDir -> line -> result
+		self._memo: "Dict[str, Dict[str, Optional[Path]]]" = dict()
+		self._paths: "Dict[str, Path]" = dict()
+		# real parent + name -> (real path, True if dir / False if not dir / None if missing)
+		self._real: "Dict[str, Tuple[str, Optional[bool]]]" = dict()
+
+	def resolve(self, rootDir: Path, packageDir: str) -> "Optional[Path]":
+		"""Same as resolvePath(rootDir, packageDir), but memoized."""
+		rootKey = str(rootDir)
+		memo = self._memo.get(rootKey)
+		if memo is None:
+			memo = self._memo[rootKey] = dict()
+		try:
+			return memo[packageDir]
+		except KeyError:
+			pass
+
+		line = packageDir.strip()
+		line = os.path.expanduser(line)
+		line = os.path.expandvars(line)
+		line = os.path.normpath(line)
+		if not os.path.isabs(line):
+			line = os.path.join(os.path.abspath(str(rootDir)), line)
+
+		real, isDir = self._realpath(line, 0)
+		result = None
+		if isDir:
+			result = self._paths.get(real)
+			if result is None:
+				result = self._paths[real] = Path(real)
+		memo[packageDir] = result
+		return result
+
+	def _realpath(self, path: str, depth: int) -> "Tuple[str, Optional[bool]]":
+		"""Resolves the symlinks in the absolute path component by component.
+		The results are cached by the real parent path plus the component name,
+		so any path going through the same real dirs benefits from the cache."""
+
+		parent, name = os.path.split(path)
+		if not name:
+			if parent == path:  # the root
+				return path, True
+			return self._realpath(parent, depth)  # trailing slash
+
+		realParent, parentIsDir = self._realpath(parent, depth)
+		if name == ".":
+			return realParent, parentIsDir
+		if name == "..":
+			return os.path.dirname(realParent), parentIsDir
+
+		candidate = os.path.join(realParent, name)
+		if not parentIsDir:
+			return candidate, None
+
+		cached = self._real.get(candidate)
+		if cached is not None:
+			return cached
+
+		try:
+			st = fs.lstat(candidate)
+		except OSError:
+			result = candidate, None
+		else:
+			if not stat.S_ISLNK(st.st_mode):
+				result = candidate, stat.S_ISDIR(st.st_mode)
+			elif depth >= _MAX_SYMLINKS:
+				return candidate, None  # a symlink loop
+			else:
+				target = os.path.join(realParent, fs.readlink(candidate))
+				result = self._realpath(target, depth + 1)
+
+		self._real[candidate] = result
+		return result
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+from unittest import mock
+
+from depz.x01_testsBase import TestWithTempDir
+from depz.x50_resolve import resolvePath, PathResolver
+
+
+class TestPathResolver(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.projectDir = self.mkd(self.tempDir / "prj" / "project")
+		self.libDir = self.mkd(self.tempDir / "libs" / "libA")
+		(self.tempDir / "libs" / "file.txt").touch()
+		# symlinked dir: prj/alias -> libs/libA
+		os.symlink(str(self.libDir), str(self.tempDir / "prj" / "alias"))
+		os.symlink("loop", str(self.tempDir / "prj" / "loop"))
+
+	def test_same_as_resolvePath(self):
+		resolver = PathResolver()
+		for line in ["../../libs/libA", "../alias", "../alias/..", "../alias/../libA",
+					 str(self.libDir), "../../libs/file.txt", "../../libs/nothing",
+					 "numpy", "./", "..", "/"]:
+			self.assertEqual(resolver.resolve(self.projectDir, line),
+							 resolvePath(self.projectDir, line), line)
+
+	def test_symlink_loop(self):
+		# resolvePath raises RuntimeError here, the resolver treats it as external
+		self.assertIsNone(PathResolver().resolve(self.projectDir, "../loop"))
+
+	def test_memoized(self):
+		resolver = PathResolver()
+		with mock.patch("os.lstat", wraps=os.lstat) as lstat:
+			for _ in range(100):
+				self.assertIsNone(resolver.resolve(self.projectDir, "numpy"))
+				self.assertIsNotNone(resolver.resolve(self.projectDir, "../../libs/libA"))
+			callsForTwoLines = lstat.call_count
+			# same external name in another dir: only the new component is checked
+			resolver.resolve(self.libDir, "numpy")
+		self.assertLessEqual(callsForTwoLines, 10)
+		self.assertEqual(lstat.call_count, callsForTwoLines + 1)
+
+
+class TestResolvePath(TestWithTempDir):
+
+	def test_relative(self):
+		projectDir = self.mkd(self.tempDir/"prj"/"project")
+		libDir = self.mkd(self.tempDir/"libs"/"libA")
+		# finding libDir by relative path
+		self.assertTrue(libDir.samefile(resolvePath(projectDir, "../../libs/libA")))
+
+	def test_absolute(self):
+		projectDir = self.mkd(self.tempDir/"prj"/"project")
+		libDir = self.mkd(self.tempDir/"libs"/"libA")
+		# finding libDir by absolute path
+		self.assertTrue(libDir.samefile(resolvePath(projectDir, str(libDir.absolute()))))
+
+	def test_no_such_dir(self):
+		projectDir = self.mkd(self.tempDir/"prj"/"project")
+		self.assertEqual(resolvePath(projectDir, "linking_nowhere_2412648263486"), None)
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import marshal
+from pathlib import Path
+
+from depz.x10_fs import fs, writeFileAtomically
+
+CACHE_FILENAME = ".depz-cache"
+_CACHE_VERSION = 3
+
+# The annotations are strings, since importing typing would slow down each
+# CLI run. Signature is Tuple[int, int, int]; Entries is
+# List[Tuple[str, Optional[Path]]], the resolved lines of a manifest.
+
+
+def statSignature(file: Path) -> "Optional[Signature]":
+	"""Returns (mtime_ns, size, inode) of the file or None if there is no file."""
+	try:
+		st = fs.stat(str(file))
+	except FileNotFoundError:
+		return None
+	return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def isEnvDependent(line: str) -> bool:
+	"""Whether the line resolution depends on the environment (home dir or
+	variables), so the cached result cannot be trusted."""
+	return "~" in line or "$" in line
+
+
+class ScanCache:
+	"""Parsed and resolved lines of depz.txt files, stored between the runs.
+
+	Each manifest is keyed by its absolute path and validated by the
+	(mtime, size, inode) signature. The file is in the marshal format:
+	it loads faster than JSON and needs no extra imports at startup. Unchanged manifests are reused without
+	reading them or resolving their lines.
+
+	A cached entry is dropped when one of its resolved directories no longer
+	exists. Lines that reference the home dir or environment variables are
+	always resolved again. A line that was external but later became an
+	existing directory is only noticed when the manifest changes
+	(or with --no-cache).
+
+	The get and put methods may be called from several scanning threads at once.
+	"""
+
+	def __init__(self, file: Path):
+		self.file = file
+		self._loaded: "Dict[str, dict]" = self._load()
+		self._used: "Dict[str, dict]" = dict()
+		self._dirty = False
+
+	def _load(self) -> "Dict[str, dict]":
+		try:
+			data = marshal.loads(fs.readBytes(str(self.file)))
+		except (FileNotFoundError, ValueError, EOFError, TypeError):
+			return dict()
+		if not isinstance(data, dict) or data.get("version") != _CACHE_VERSION:
+			return dict()
+		return data.get("manifests", dict())
+
+	def get(self, manifest: Path, signature: "Signature") -> "Optional[Entries]":
+		"""Returns the cached entries of the manifest or None, if the manifest
+		is not cached, was changed, or refers to directories that disappeared."""
+		key = str(manifest)
+		record = self._loaded.get(key)
+		if record is None or tuple(record["sig"]) != signature:
+			return None
+
+		entries: "Entries" = list()
+		for line, target in record["entries"]:
+			if target is not None:
+				if not fs.isDir(target):
+					return None
+				entries.append((line, Path(target)))
+			else:
+				entries.append((line, None))
+		self._used[key] = record
+		return entries
+
+	def put(self, manifest: Path, signature: "Signature", entries: "Entries"):
+		record = {"sig": list(signature),
+				  "entries": [[line, None if target is None else str(target)]
+							  for line, target in entries]}
+		self._used[str(manifest)] = record
+		self._dirty = True
+
+	def save(self):
+		"""Writes the cache file, if anything changed. Only the manifests used
+		during the current run are kept."""
+		if not self._dirty and self._used.keys() == self._loaded.keys():
+			return
+		data = {"version": _CACHE_VERSION, "manifests": self._used}
+		try:
+			writeFileAtomically(str(self.file), marshal.dumps(data))
+		except OSError:
+			# the cache is an optimization: a read-only project dir is not an error
+			pass
+		self._loaded = dict(self._used)
+		self._dirty = False
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+
+from depz.x01_testsBase import TestWithTempDir
+from depz.x55_scanCache import ScanCache, statSignature
+from depz.x80_rescanRelink import manifestEntries
+
+
+class TestScanCache(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		self.lib = self.mkd(self.tempDir / "lib")
+		self.manifest = self.project / "depz.txt"
+		self.manifest.write_text("../lib\nnumpy\n")
+		self.cacheFile = self.project / ".depz-cache"
+
+	def fillCache(self):
+		cache = ScanCache(self.cacheFile)
+		entries = manifestEntries(self.manifest, cache)
+		cache.save()
+		return entries
+
+	def test_reused_between_runs(self):
+		entries = self.fillCache()
+		cache = ScanCache(self.cacheFile)
+		self.assertEqual(cache.get(self.manifest, statSignature(self.manifest)), entries)
+		self.assertEqual(entries[1], ("numpy", None))
+		self.assertTrue(entries[0][1].samefile(self.lib))
+
+	def test_unchanged_cache_is_not_rewritten(self):
+		self.fillCache()
+		inode = os.stat(str(self.cacheFile)).st_ino
+		self.fillCache()
+		self.assertEqual(os.stat(str(self.cacheFile)).st_ino, inode)
+
+	def test_changed_manifest(self):
+		self.fillCache()
+		self.manifest.write_text("numpy\nrequests\n")
+		cache = ScanCache(self.cacheFile)
+		self.assertIsNone(cache.get(self.manifest, statSignature(self.manifest)))
+		self.assertEqual(manifestEntries(self.manifest, cache),
+						 [("numpy", None), ("requests", None)])
+
+	def test_resolved_dir_disappeared(self):
+		self.fillCache()
+		self.lib.rmdir()
+		cache = ScanCache(self.cacheFile)
+		self.assertIsNone(cache.get(self.manifest, statSignature(self.manifest)))
+		self.assertEqual(manifestEntries(self.manifest, cache),
+						 [("../lib", None), ("numpy", None)])
+
+	def test_corrupted_file_ignored(self):
+		self.cacheFile.write_text("{not json")
+		self.assertEqual(len(self.fillCache()), 2)
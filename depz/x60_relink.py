@@ -0,0 +1,432 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import errno
+import os
+import stat
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode, printVerbose
+from depz.x05_stats import stats
+from depz.x10_fs import fs, writeFileAtomically
+
+
+def iterSymlinks(parent: Path) -> Iterator[Tuple[Path, str]]:
+	"""Yields (linkPath, target) for each symlink that is an immediate child
+	of the parent dir. The target is the raw value returned by readlink."""
+	parent = str(parent)
+	try:
+		entries = fs.scandir(parent)
+	except FileNotFoundError:
+		return
+	for name, _, isSymlink in entries:
+		if isSymlink:
+			path = os.path.join(parent, name)
+			yield Path(path), fs.readlink(path)
+
+
+def existingLinks(projectDir: Path, mode: Mode) -> Dict[Path, str]:
+	"""Returns the symlinks that a relink is allowed to manage: the symlinks
+	in the project dir and, in the layout mode, the symlinks in its subdirs.
+
+	:return: Absolute link path -> raw link target.
+	"""
+	projectDir = projectDir.absolute()
+	result: Dict[Path, str] = dict()
+	for link, target in iterSymlinks(projectDir):
+		result[link] = target
+	if mode == Mode.layout:
+		try:
+			subdirs = [projectDir / name for name, isDir, isSymlink in fs.scandir(str(projectDir))
+					   if isDir and not isSymlink]
+		except FileNotFoundError:
+			subdirs = []
+		for sub in subdirs:
+			for link, target in iterSymlinks(sub):
+				result[link] = target
+	return result
+
+
+LINKS_FILE_NAME = ".depz-links"
+MARKER_NAME = ".depz-materialized"  # the dirs copied by materializeProject
+
+
+def readLinksFile(projectDir: Path) -> Optional[List[Path]]:
+	"""Returns the links listed in the ownership file of the project, or None
+	if there is no such file. The file lists the links created by depz, one
+	path relative to the project dir per line.
+
+	Only the paths the modes produce are returned: "name" of the default mode
+	and "subdir/name" of the layout mode. Both are accepted whatever the mode
+	is now, so the links of the other mode are removed after switching modes.
+	The other lines may lead out of the project dir, so they are ignored.
+	"""
+	try:
+		text = fs.readText(str(projectDir / LINKS_FILE_NAME))
+	except FileNotFoundError:
+		return None
+	result: List[Path] = list()
+	for line in text.splitlines():
+		parts = line.strip().split("/")
+		if len(parts) <= 2 and all(p not in ("", ".", "..") for p in parts):
+			result.append(projectDir.joinpath(*parts))
+	return result
+
+
+def writeLinksFile(projectDir: Path, links: Iterable[Path]):
+	"""Replaces the ownership file with the list of the links."""
+	lines = sorted(link.relative_to(projectDir).as_posix() for link in links)
+	text = "".join(line + "\n" for line in lines)
+	writeFileAtomically(str(projectDir / LINKS_FILE_NAME), text.encode())
+
+
+def ownedLinks(projectDir: Path, mode: Mode) -> Tuple[Dict[Path, str], Optional[List[Path]]]:
+	"""Returns the symlinks created by depz in the project.
+
+	If the project has the ownership file, only the listed paths are checked:
+	the cost depends on the number of the links, not on the size of the dirs,
+	and the symlinks made by hand are never touched. The listed paths that are
+	no longer symlinks are skipped. Without the file, all the symlinks found
+	by existingLinks are considered ours, as in the earlier versions.
+
+	:return: Absolute link path -> raw link target, and the content of the
+	ownership file (None if there is no file).
+	"""
+	projectDir = projectDir.absolute()
+	listed = readLinksFile(projectDir)
+	if listed is None:
+		return existingLinks(projectDir, mode), None
+	result: Dict[Path, str] = dict()
+	realParents: Dict[Path, bool] = {projectDir: True}
+	for link in listed:
+		parent = link.parent
+		isReal = realParents.get(parent)
+		if isReal is None:
+			# a link in a symlinked subdir would be outside the project
+			try:
+				isReal = stat.S_ISDIR(fs.lstat(str(parent)).st_mode)
+			except (FileNotFoundError, NotADirectoryError):
+				isReal = False
+			realParents[parent] = isReal
+		if not isReal:
+			continue
+		try:
+			result[link] = fs.readlink(str(link))
+		except (FileNotFoundError, NotADirectoryError):
+			pass
+		except OSError as e:
+			if e.errno != errno.EINVAL:  # not a symlink
+				raise
+	return result, listed
+
+
+def updateLinksFile(projectDir: Path, existing: Dict[Path, str], diff: 'LinksDiff',
+					listed: Optional[List[Path]], failed: Iterable[Path] = ()):
+	"""Writes the ownership file after the diff is applied, if there was no
+	file or the set of our links has changed. The file is written even if
+	there are no links: since then the project has no links owned by depz,
+	and the symlinks made later by hand are kept.
+
+	:param existing: The links owned before the change, as returned by ownedLinks.
+	:param listed: The content of the file before the change.
+	:param failed: The links whose changes failed.
+	"""
+	failed = set(failed)
+	owned = set(existing) - (set(diff.removed) - failed)
+	owned.update(link for link, _ in diff.added if link not in failed)
+	if listed is not None and set(listed) == owned:
+		return
+	writeLinksFile(projectDir.absolute(), owned)
+
+
+def _sameTarget(linkPath: Path, rawTarget: str, desired: Path) -> bool:
+	if not os.path.isabs(rawTarget):
+		rawTarget = os.path.join(str(linkPath.parent), rawTarget)
+	return os.path.normpath(rawTarget) == os.path.normpath(str(desired))
+
+
+class LinksDiff:
+	"""The changes needed to turn the existing symlinks into the desired ones.
+
+	All the lists contain absolute paths sorted by link path.
+	"""
+
+	def __init__(self):
+		self.added: List[Tuple[Path, Path]] = list()  # (link, target)
+		self.retargeted: List[Tuple[Path, Path]] = list()  # (link, new target)
+		self.removed: List[Path] = list()
+		self.unchanged: List[Tuple[Path, Path]] = list()  # (link, target)
+
+	@property
+	def changesCount(self) -> int:
+		return len(self.added) + len(self.retargeted) + len(self.removed)
+
+	def summary(self) -> str:
+		return (f"Symlinks: {len(self.added)} created, "
+				f"{len(self.retargeted)} retargeted, "
+				f"{len(self.removed)} removed, "
+				f"{len(self.unchanged)} unchanged")
+
+
+def diffLinks(desired: Dict[Path, Path], existing: Dict[Path, str]) -> LinksDiff:
+	"""Compares the desired mapping with the symlinks found on disk.
+
+	:param desired: Link path -> target path. Both absolute.
+	:param existing: Link path -> raw readlink value, as returned by ownedLinks.
+	"""
+	diff = LinksDiff()
+	for link in sorted(desired):
+		target = desired[link]
+		if link not in existing:
+			diff.added.append((link, target))
+		elif _sameTarget(link, existing[link], target):
+			diff.unchanged.append((link, target))
+		else:
+			diff.retargeted.append((link, target))
+	for link in sorted(existing):
+		if link not in desired:
+			diff.removed.append(link)
+	return diff
+
+
+class LinksCheck:
+	"""The differences between the desired symlinks and the disk, found by
+	checkLinks. All the paths are absolute."""
+
+	def __init__(self):
+		self.missing: List[Tuple[Path, Path]] = list()  # (link, target)
+		self.stale: List[Tuple[Path, Path]] = list()  # (link, desired target)
+		self.dangling: List[Path] = list()  # not desired, the target does not exist
+		self.extra: List[Path] = list()  # not desired, the target exists
+
+	@property
+	def ok(self) -> bool:
+		return not (self.missing or self.stale or self.dangling or self.extra)
+
+	def lines(self) -> List[str]:
+		result = [f"missing: {link} -> {target}" for link, target in self.missing]
+		result += [f"stale: {link} -> {target}" for link, target in self.stale]
+		result += [f"dangling: {link}" for link in self.dangling]
+		result += [f"extra: {link}" for link in self.extra]
+		return result
+
+
+def checkLinks(desired: Dict[Path, Path], projectDir: Path, mode: Mode,
+			   quick: bool = False, partial: bool = False) -> LinksCheck:
+	"""Compares the desired symlinks with the disk without changing anything.
+	Each desired link costs a lstat and a readlink.
+
+	:param desired: Link path -> target path. Both absolute.
+	:param quick: Stop at the first difference.
+	:param partial: The desired links are only a part of the graph: the other
+	links are not reported as extra or dangling.
+
+	Only the links owned by depz (see ownedLinks) can be extra or dangling.
+	"""
+	check = LinksCheck()
+	for link in sorted(desired):
+		target = desired[link]
+		try:
+			linkMode = fs.lstat(str(link)).st_mode
+		except FileNotFoundError:
+			check.missing.append((link, target))
+		else:
+			if not stat.S_ISLNK(linkMode) \
+					or not _sameTarget(link, fs.readlink(str(link)), target):
+				check.stale.append((link, target))
+		if quick and not check.ok:
+			return check
+
+	if partial:
+		return check
+	for link, rawTarget in sorted(ownedLinks(projectDir, mode)[0].items()):
+		if link in desired:
+			continue
+		if fs.exists(str(link)):
+			check.extra.append(link)
+		else:
+			check.dangling.append(link)
+		if quick:
+			break
+	return check
+
+
+def replaceSymlink(realPath: Path, linkPath: Path,
+				   createLinkParent: bool = False):
+	"""Creates a symlink or atomically replaces the existing one.
+
+	The new link is created under a temporary name and then renamed
+	over the final name. So any process reading the tree
+	always sees either the old link or the new one, but never a missing link.
+	Only symlinks are replaced: any other existing file causes FileExistsError.
+	"""
+
+	if createLinkParent:
+		fs.makedirs(str(linkPath.parent))
+	elif not fs.exists(str(linkPath.parent)):
+		raise FileNotFoundError(
+			f"The parent dir of destination linkPath {linkPath} does not exist")
+	_placeSymlink(realPath, linkPath)
+
+
+def _removeTree(path: str):
+	"""Removes the dir with all its content. Symlinks are not followed."""
+	for name, isDir, isSymlink in fs.scandir(path):
+		child = os.path.join(path, name)
+		if isDir and not isSymlink:
+			_removeTree(child)
+		else:
+			fs.unlink(child)
+	fs.rmdir(path)
+
+
+def _placeSymlink(realPath: Path, linkPath: Path):
+	"""replaceSymlink for the link whose parent dir is known to exist.
+	Also replaces a dir left by materializeProject: it is moved aside
+	before the link takes its place, and then removed."""
+	try:
+		realIsDir = stat.S_ISDIR(fs.stat(str(realPath)).st_mode)
+	except FileNotFoundError:
+		raise FileNotFoundError(f"realPath path {realPath} does not exist") from None
+	materialized = False
+	try:
+		linkMode = fs.lstat(str(linkPath)).st_mode
+	except FileNotFoundError:
+		pass
+	else:
+		if not stat.S_ISLNK(linkMode):
+			materialized = stat.S_ISDIR(linkMode) \
+						   and fs.exists(str(linkPath / MARKER_NAME))
+			if not materialized:
+				raise FileExistsError(f"Cannot replace {linkPath}: it is not a symlink")
+
+	tempPath = str(linkPath.with_name(f".{linkPath.name}.depz-{os.getpid()}.tmp"))
+	fs.symlink(str(realPath), tempPath, isDir=realIsDir)
+	oldPath = str(linkPath.with_name(f".{linkPath.name}.depz-{os.getpid()}.old"))
+	movedAside = False
+	try:
+		if materialized:
+			fs.replace(str(linkPath), oldPath)
+			movedAside = True
+		fs.replace(tempPath, str(linkPath))
+	except OSError:
+		fs.unlink(tempPath)
+		if movedAside:
+			fs.replace(oldPath, str(linkPath))
+		raise
+	if materialized:
+		_removeTree(oldPath)
+
+
+class LinksApplyError(OSError):
+	"""Some of the changes of the diff failed. The other changes are made.
+
+	It is an OSError, like the errors of the single changes, so the callers
+	handling the filesystem errors handle this one too.
+	"""
+
+	def __init__(self, errors: List[Tuple[Path, Exception]]):
+		self.errors = errors
+		lines = [f"{len(errors)} of the symlink changes failed:"]
+		lines += [f"  {path}: {error}" for path, error in errors]
+		super().__init__("\n".join(lines))
+
+	def __reduce__(self):
+		# passed from the worker processes of the workspace relink
+		return LinksApplyError, (self.errors,)
+
+
+def _runAll(func: Callable[[Path], None], items: List[Any], jobs: int,
+			key: Callable[[Any], Path]) -> List[Tuple[Path, Exception]]:
+	"""Calls func for each item, up to jobs calls at once. Returns the errors
+	instead of stopping at the first one."""
+
+	def call(item) -> Optional[Tuple[Path, Exception]]:
+		try:
+			func(item)
+		except OSError as e:
+			return key(item), e
+		return None
+
+	if jobs > 1 and len(items) > 1:
+		from concurrent.futures import ThreadPoolExecutor
+		with ThreadPoolExecutor(max_workers=jobs) as executor:
+			results = list(executor.map(call, items))
+	else:
+		results = [call(item) for item in items]
+	return [r for r in results if r is not None]
+
+
+def _printPair(header: str, target: Path, link: Path):
+	printVerbose(header)
+	printVerbose(f"  real: {target}")
+	printVerbose(f"  link: {link}")
+
+
+def applyLinksDiff(diff: LinksDiff, projectDir: Path, mode: Mode, jobs: int = 1) -> None:
+	"""Makes the filesystem changes described by the diff. Unchanged links
+	are not touched at all.
+
+	New and retargeted links are put in place atomically. The links that are
+	no longer wanted are removed only after that, so at any moment the project
+	has either the old set of links or a superset of the new one.
+
+	The changes are grouped by the parent dir: each parent is created or
+	checked once. With jobs > 1 the symlink and unlink calls of the group
+	run in a pool of up to jobs threads, which pays off on network
+	filesystems. A failed change does not stop the others: all the errors
+	are raised together as LinksApplyError at the end.
+	"""
+
+	projectDir = projectDir.absolute()
+	createParents = mode == Mode.layout
+
+	for link, target in diff.unchanged:
+		_printPair("Symlink is up to date:", target, link)
+	for link, target in diff.retargeted:
+		_printPair("Retargeting symlink:", target, link)
+	for link, target in diff.added:
+		_printPair("Creating symlink:", target, link)
+
+	errors: List[Tuple[Path, Exception]] = list()
+
+	byParent: Dict[Path, List[Tuple[Path, Path]]] = dict()
+	for link, target in diff.retargeted + diff.added:
+		byParent.setdefault(link.parent, list()).append((link, target))
+	toPlace: List[Tuple[Path, Path]] = list()
+	for parent, pairs in byParent.items():
+		try:
+			if createParents:
+				fs.makedirs(str(parent))
+			elif not fs.exists(str(parent)):
+				raise FileNotFoundError(
+					f"The parent dir of destination linkPath {pairs[0][0]} does not exist")
+		except OSError as e:
+			errors.extend((link, e) for link, _ in pairs)
+			continue
+		toPlace.extend(pairs)
+
+	errors += _runAll(lambda pair: _placeSymlink(pair[1], pair[0]), toPlace, jobs,
+					  key=lambda pair: pair[0])
+
+	for link in diff.removed:
+		printVerbose("Removing symlink:")
+		printVerbose(f"  link: {link}")
+
+	def unlink(link: Path):
+		fs.unlink(str(link))
+
+	errors += _runAll(unlink, diff.removed, jobs, key=lambda link: link)
+
+	# the subdirs that contained only our links are removed, also after
+	# switching from the layout mode to the default one
+	for sub in sorted({link.parent for link in diff.removed}):
+		if sub == projectDir:
+			continue
+		if not fs.scandir(str(sub)):
+			fs.rmdir(str(sub))
+
+	printVerbose(diff.summary())
+	if errors:
+		raise LinksApplyError(errors)
@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+
+from depz.x00_common import Mode
+from depz.x01_testsBase import TestWithTempDir
+from depz.x60_relink import existingLinks, diffLinks, applyLinksDiff, replaceSymlink, \
+	LinksApplyError, checkLinks
+
+
+class TestLinksDiff(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		self.libA = self.mkd(self.tempDir / "libs" / "libA")
+		self.libB = self.mkd(self.tempDir / "libs" / "libB")
+
+	def relink(self, desired, mode=Mode.default, jobs=1):
+		diff = diffLinks(desired, existingLinks(self.project, mode))
+		applyLinksDiff(diff, self.project, mode, jobs)
+		return diff
+
+	def test_noop_relink_makes_no_changes(self):
+		desired = {self.project / "libA": self.libA, self.project / "libB": self.libB}
+		first = self.relink(desired)
+		self.assertEqual(len(first.added), 2)
+
+		before = os.lstat(str(self.project / "libA")).st_ino
+		second = self.relink(desired)
+		self.assertEqual(second.changesCount, 0)
+		self.assertEqual(len(second.unchanged), 2)
+		self.assertEqual(os.lstat(str(self.project / "libA")).st_ino, before)
+
+	def test_retarget_and_remove(self):
+		self.relink({self.project / "libA": self.libA, self.project / "libB": self.libB})
+		diff = self.relink({self.project / "libA": self.libB})
+		self.assertEqual([link for link, _ in diff.retargeted], [self.project / "libA"])
+		self.assertEqual(diff.removed, [self.project / "libB"])
+		self.assertTrue((self.project / "libA").resolve().samefile(self.libB))
+		self.assertFalse(os.path.lexists(str(self.project / "libB")))
+
+	def test_relative_link_is_unchanged(self):
+		os.symlink(os.path.join("..", "libs", "libA"), str(self.project / "libA"))
+		diff = self.relink({self.project / "libA": self.libA})
+		self.assertEqual(diff.changesCount, 0)
+
+	def test_layout_removes_emptied_subdir(self):
+		self.relink({self.project / "lib" / "libA": self.libA}, Mode.layout)
+		self.assertTrue((self.project / "lib" / "libA").is_symlink())
+		diff = self.relink({}, Mode.layout)
+		self.assertEqual(diff.removed, [self.project / "lib" / "libA"])
+		self.assertFalse((self.project / "lib").exists())
+		self.assertTrue(self.project.exists())
+
+	def test_parallel_layout(self):
+		libs = [self.mkd(self.tempDir / "libs" / f"lib{i}") for i in range(20)]
+		desired = {self.project / sub / lib.name: lib for lib in libs for sub in ("lib", "test")}
+		diff = self.relink(desired, Mode.layout, jobs=4)
+		self.assertEqual(len(diff.added), 40)
+		self.assertTrue((self.project / "test" / "lib7").resolve().samefile(libs[7]))
+		diff = self.relink({}, Mode.layout, jobs=4)
+		self.assertEqual(len(diff.removed), 40)
+		self.assertEqual(os.listdir(str(self.project)), [])
+
+	def test_errors_are_collected(self):
+		(self.project / "libA").write_text("not a link")
+		desired = {self.project / "libA": self.libA,
+				   self.project / "libB": self.libB,
+				   self.project / "libC": self.tempDir / "missing"}
+		with self.assertRaises(LinksApplyError) as cm:
+			self.relink(desired)
+		self.assertEqual(sorted(path.name for path, _ in cm.exception.errors),
+						 ["libA", "libC"])
+		# the failures did not stop the other links
+		self.assertTrue((self.project / "libB").is_symlink())
+
+
+class TestReplaceSymlink(TestWithTempDir):
+
+	def test_replace(self):
+		libA = self.mkd(self.tempDir / "libA")
+		libB = self.mkd(self.tempDir / "libB")
+		link = self.tempDir / "link"
+		replaceSymlink(libA, link)
+		inode = os.lstat(str(link)).st_ino
+		replaceSymlink(libB, link)
+		self.assertTrue(link.resolve().samefile(libB))
+		self.assertNotEqual(os.lstat(str(link)).st_ino, inode)
+		self.assertEqual(sorted(p.name for p in self.tempDir.iterdir()),
+						 ["libA", "libB", "link"])  # no temporary files left
+
+	def test_not_replacing_files(self):
+		libA = self.mkd(self.tempDir / "libA")
+		file = self.tempDir / "file"
+		file.write_text("data")
+		with self.assertRaises(FileExistsError):
+			replaceSymlink(libA, file)
+		self.assertEqual(file.read_text(), "data")
+
+	def test_creating_parent(self):
+		libA = self.mkd(self.tempDir / "libA")
+		link = self.tempDir / "sub" / "link"
+		with self.assertRaises(FileNotFoundError):
+			replaceSymlink(libA, link)
+		replaceSymlink(libA, link, createLinkParent=True)
+		self.assertTrue(link.resolve().samefile(libA))
+
+
+class TestCheckLinks(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		self.libA = self.mkd(self.tempDir / "libs" / "libA")
+		self.libB = self.mkd(self.tempDir / "libs" / "libB")
+		self.desired = {self.project / "libA": self.libA, self.project / "libB": self.libB}
+
+	def test_up_to_date(self):
+		(self.project / "libA").symlink_to(self.libA)
+		(self.project / "libB").symlink_to(self.libB)
+		self.assertTrue(checkLinks(self.desired, self.project, Mode.default).ok)
+
+	def test_differences(self):
+		(self.project / "libA").symlink_to(self.libB)
+		(self.project / "old").symlink_to(self.libA)
+		(self.project / "gone").symlink_to(self.tempDir / "gone")
+		check = checkLinks(self.desired, self.project, Mode.default)
+		self.assertEqual(check.missing, [(self.project / "libB", self.libB)])
+		self.assertEqual(check.stale, [(self.project / "libA", self.libA)])
+		self.assertEqual(check.dangling, [self.project / "gone"])
+		self.assertEqual(check.extra, [self.project / "old"])
+		self.assertEqual(len(check.lines()), 4)
+
+		quick = checkLinks(self.desired, self.project, Mode.default, quick=True)
+		self.assertEqual((quick.stale, quick.missing), (check.stale, []))
+
+		partial = checkLinks(self.desired, self.project, Mode.default, partial=True)
+		self.assertEqual((partial.dangling, partial.extra), ([], []))
+
+	def test_not_a_symlink_is_stale(self):
+		self.mkd(self.project / "libA")
+		check = checkLinks({self.project / "libA": self.libA}, self.project, Mode.default)
+		self.assertEqual(check.stale, [(self.project / "libA", self.libA)])
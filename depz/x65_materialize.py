@@ -0,0 +1,247 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode, CopyMethod, printVerbose
+from depz.x05_stats import stats
+from depz.x10_fs import replaceFileAtomically
+from depz.x60_relink import MARKER_NAME, readLinksFile, writeLinksFile
+
+FICLONE = 0x40049409  # from linux/fs.h
+
+
+class MaterializeResult:
+	"""What materializeProject did to the project."""
+
+	def __init__(self):
+		self.dirs = 0
+		self.filesCopied = 0
+		self.filesUnchanged = 0
+		self.entriesRemoved = 0
+		self.dirsRemoved: List[Path] = list()
+
+	def summary(self) -> str:
+		return (f"Materialized: {self.dirs} dirs, "
+				f"{self.filesCopied} files copied, "
+				f"{self.filesUnchanged} unchanged, "
+				f"{self.entriesRemoved} removed, "
+				f"{len(self.dirsRemoved)} stale dirs removed")
+
+
+class FileCloner:
+	"""Copies files the cheapest way the filesystem allows.
+
+	With CopyMethod.clone tries a reflink (FICLONE), then copy_file_range,
+	then an ordinary copy. A way that failed once is not tried again by
+	the same cloner. With CopyMethod.hardlink the files are hardlinked, and
+	copied only when the link fails (another filesystem, for example).
+	"""
+
+	def __init__(self, method: CopyMethod = CopyMethod.clone):
+		self.method = method
+		self._reflink = method == CopyMethod.clone and os.name == "posix"
+		self._copyRange = method == CopyMethod.clone and hasattr(os, "copy_file_range")
+		self._hardlink = method == CopyMethod.hardlink
+
+	def _cloneData(self, src: str, dst: str) -> bool:
+		with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+			if self._reflink:
+				import fcntl
+				try:
+					fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+					stats.count("ficlone")
+					return True
+				except OSError:
+					self._reflink = False
+			if self._copyRange:
+				size = os.fstat(fsrc.fileno()).st_size
+				copied = 0
+				try:
+					while copied < size:
+						n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+						if n == 0:
+							break
+						copied += n
+					stats.count("copy_file_range")
+					return True
+				except OSError:
+					self._copyRange = False
+					fdst.seek(0)
+					fdst.truncate()
+		return False
+
+	def copy(self, src: str, dst: str, srcStat: os.stat_result):
+		"""Replaces dst with the copy of src. The new file is prepared under
+		a temporary name, so dst is never seen half-written. With the hardlink
+		method dst shares the data with src: writing to dst changes src."""
+		replaceFileAtomically(dst, lambda tempPath: self._create(src, tempPath, srcStat))
+
+	def _create(self, src: str, tempPath: str, srcStat: os.stat_result):
+		if self._hardlink:
+			try:
+				os.link(src, tempPath)
+				stats.count("link")
+				return
+			except OSError:
+				pass
+		if not self._cloneData(src, tempPath):
+			stats.count("copy")
+			shutil.copyfile(src, tempPath)
+		os.chmod(tempPath, stat.S_IMODE(srcStat.st_mode))
+		# the same mtime tells the next run that the file is up to date
+		os.utime(tempPath, ns=(srcStat.st_atime_ns, srcStat.st_mtime_ns))
+
+
+def _removeEntry(path: str):
+	stats.count("unlink")
+	if os.path.isdir(path) and not os.path.islink(path):
+		shutil.rmtree(path)
+	else:
+		os.unlink(path)
+
+
+def syncTree(src: str, dst: str, cloner: FileCloner, result: MaterializeResult,
+			 keep: Iterable[str] = ()):
+	"""Makes dst a copy of src. Only the files that differ in size or mtime
+	are copied. The files hardlinked to src are copied again, unless the
+	cloner hardlinks too. The entries of dst missing from src are removed, except
+	the names in keep. Symlinks are copied as symlinks."""
+	stats.count("scandir")
+	with os.scandir(src) as it:
+		srcEntries = {e.name: e for e in it}
+	try:
+		stats.count("scandir")
+		with os.scandir(dst) as it:
+			dstEntries = {e.name: e for e in it}
+	except FileNotFoundError:
+		stats.count("mkdir")
+		os.mkdir(dst)
+		dstEntries = dict()
+
+	for name, srcEntry in srcEntries.items():
+		srcPath = os.path.join(src, name)
+		dstPath = os.path.join(dst, name)
+		dstEntry = dstEntries.get(name)
+
+		if srcEntry.is_symlink():
+			target = os.readlink(srcPath)
+			if dstEntry is not None:
+				if dstEntry.is_symlink() and os.readlink(dstPath) == target:
+					result.filesUnchanged += 1
+					continue
+				_removeEntry(dstPath)
+			os.symlink(target, dstPath)
+			result.filesCopied += 1
+		elif srcEntry.is_dir():
+			if dstEntry is not None and (dstEntry.is_symlink() or not dstEntry.is_dir()):
+				_removeEntry(dstPath)
+			syncTree(srcPath, dstPath, cloner, result)
+		else:
+			srcStat = srcEntry.stat(follow_symlinks=False)
+			if dstEntry is not None:
+				if dstEntry.is_symlink() or dstEntry.is_dir():
+					_removeEntry(dstPath)
+				else:
+					dstStat = dstEntry.stat(follow_symlinks=False)
+					# a hardlink left by an earlier run has the same size and
+					# mtime, but must become a copy
+					hardlinked = dstStat.st_ino == srcStat.st_ino \
+								 and dstStat.st_dev == srcStat.st_dev
+					if dstStat.st_size == srcStat.st_size \
+							and dstStat.st_mtime_ns == srcStat.st_mtime_ns \
+							and not (hardlinked and cloner.method != CopyMethod.hardlink):
+						result.filesUnchanged += 1
+						continue
+			cloner.copy(srcPath, dstPath, srcStat)
+			result.filesCopied += 1
+
+	for name in dstEntries:
+		if name not in srcEntries and name not in keep:
+			_removeEntry(os.path.join(dst, name))
+			result.entriesRemoved += 1
+
+
+def materializedDirs(projectDir: Path, mode: Mode) -> List[Path]:
+	"""Returns the dirs created by materializeProject: the dirs in the project
+	dir and, in the layout mode, in its subdirs, that contain the marker file."""
+	projectDir = projectDir.absolute()
+	parents = [projectDir]
+	if mode == Mode.layout:
+		stats.count("scandir")
+		with os.scandir(str(projectDir)) as it:
+			parents += [Path(e.path) for e in it if e.is_dir(follow_symlinks=False)]
+	result: List[Path] = list()
+	for parent in parents:
+		stats.count("scandir")
+		try:
+			with os.scandir(str(parent)) as it:
+				subdirs = [e.path for e in it if e.is_dir(follow_symlinks=False)]
+		except FileNotFoundError:
+			continue
+		for sub in subdirs:
+			stats.count("stat")
+			if os.path.exists(os.path.join(sub, MARKER_NAME)):
+				result.append(Path(sub))
+	return result
+
+
+def materializeProject(projectDir: Path, mapping: Dict[Path, Path], mode: Mode,
+					   method: CopyMethod = CopyMethod.clone,
+					   partial: bool = False) -> MaterializeResult:
+	"""Same as relinkProject, but puts real copies of the library dirs
+	instead of the symlinks.
+
+	The dirs are marked with a MARKER_NAME file: only the marked dirs are
+	updated or removed later, and a later relink replaces them with the
+	symlinks. The symlinks left by an earlier relink are replaced with the
+	dirs and dropped from the LINKS_FILE_NAME file. With partial, the marked
+	dirs missing from the mapping are kept.
+	"""
+	projectDir = projectDir.absolute()
+	if not projectDir.exists():
+		projectDir.mkdir()
+	desired = {dst.absolute(): src.absolute() for src, dst in mapping.items()}
+	cloner = FileCloner(method)
+	result = MaterializeResult()
+
+	with stats.phase("materialize"):
+		for dst in sorted(desired):
+			src = desired[dst]
+			printVerbose("Materializing:")
+			printVerbose(f"  real: {src}")
+			printVerbose(f"  copy: {dst}")
+			if dst.is_symlink():
+				stats.count("unlink")
+				dst.unlink()
+			elif dst.exists() and not (dst / MARKER_NAME).exists():
+				raise FileExistsError(f"Cannot materialize {dst}: it was not created by depz")
+			dst.parent.mkdir(parents=True, exist_ok=True)
+			syncTree(str(src), str(dst), cloner, result, keep=[MARKER_NAME])
+			(dst / MARKER_NAME).touch()
+			result.dirs += 1
+
+		for old in ([] if partial else materializedDirs(projectDir, mode)):
+			if old not in desired:
+				printVerbose("Removing materialized dir:")
+				printVerbose(f"  copy: {old}")
+				shutil.rmtree(str(old))
+				result.dirsRemoved.append(old)
+				parent = old.parent
+				if mode == Mode.layout and parent != projectDir and not any(parent.iterdir()):
+					stats.count("rmdir")
+					parent.rmdir()
+
+		# the copies are not symlinks owned by depz anymore
+		listed = readLinksFile(projectDir)
+		if listed is not None:
+			kept = [link for link in listed if link not in desired]
+			if len(kept) != len(listed):
+				writeLinksFile(projectDir, kept)
+
+	printVerbose(result.summary())
+	return result
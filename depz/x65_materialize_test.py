@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+
+from depz import runmain
+from depz.x00_common import Mode, CopyMethod, printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x60_relink import readLinksFile
+from depz.x65_materialize import materializeProject, MARKER_NAME
+from depz.x80_rescanRelink import relinkProject
+
+
+class TestMaterialize(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		printVerbose.allowed = False
+		self.project = self.mkd(self.tempDir / "project")
+		self.lib = self.mkd(self.tempDir / "libs" / "libA")
+		self.mkd(self.lib / "sub")
+		(self.lib / "a.py").write_text("a = 1\n")
+		(self.lib / "sub" / "b.py").write_text("b = 2\n")
+		self.mapping = {self.lib: self.project / "libA"}
+
+	def tearDown(self):
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def test_copies_the_tree(self):
+		result = materializeProject(self.project, self.mapping, Mode.default)
+		copy = self.project / "libA"
+		self.assertFalse(copy.is_symlink())
+		self.assertEqual((copy / "sub" / "b.py").read_text(), "b = 2\n")
+		self.assertTrue((copy / MARKER_NAME).exists())
+		self.assertEqual(result.filesCopied, 2)
+
+	def test_incremental(self):
+		materializeProject(self.project, self.mapping, Mode.default)
+		result = materializeProject(self.project, self.mapping, Mode.default)
+		self.assertEqual((result.filesCopied, result.filesUnchanged), (0, 2))
+
+		(self.lib / "a.py").write_text("a = 100\n")
+		(self.lib / "sub" / "b.py").unlink()
+		result = materializeProject(self.project, self.mapping, Mode.default)
+		self.assertEqual((result.filesCopied, result.entriesRemoved), (1, 1))
+		self.assertEqual((self.project / "libA" / "a.py").read_text(), "a = 100\n")
+		self.assertFalse((self.project / "libA" / "sub" / "b.py").exists())
+
+	def test_hardlink(self):
+		materializeProject(self.project, self.mapping, Mode.default, CopyMethod.hardlink)
+		self.assertTrue((self.project / "libA" / "a.py").samefile(self.lib / "a.py"))
+		# copying again replaces the hardlinks with independent files
+		result = materializeProject(self.project, self.mapping, Mode.default, CopyMethod.copy)
+		self.assertEqual(result.filesCopied, 2)
+		self.assertFalse((self.project / "libA" / "a.py").samefile(self.lib / "a.py"))
+		with (self.project / "libA" / "a.py").open("a") as f:
+			f.write("b = 3\n")
+		self.assertEqual((self.lib / "a.py").read_text(), "a = 1\n")
+
+	def test_replaces_symlink_and_removes_stale(self):
+		(self.project / "libA").symlink_to(self.lib)
+		materializeProject(self.project, self.mapping, Mode.default)
+		self.assertFalse((self.project / "libA").is_symlink())
+		result = materializeProject(self.project, dict(), Mode.default)
+		self.assertEqual(result.dirsRemoved, [self.project.absolute() / "libA"])
+		self.assertFalse((self.project / "libA").exists())
+		self.assertTrue((self.lib / "a.py").exists())
+
+	def test_round_trip_with_relink(self):
+		copy = self.project.absolute() / "libA"
+		relinkProject(self.project, self.mapping, Mode.default)
+		self.assertEqual(readLinksFile(self.project), [copy])
+
+		materializeProject(self.project, self.mapping, Mode.default)
+		self.assertFalse(copy.is_symlink())
+		self.assertEqual(readLinksFile(self.project), [])
+
+		relinkProject(self.project, self.mapping, Mode.default)
+		self.assertTrue(copy.is_symlink())
+		self.assertEqual(readLinksFile(self.project), [copy])
+		self.assertEqual(sorted(os.listdir(str(self.project))), [".depz-links", "libA"])
+		self.assertTrue((self.lib / "a.py").exists())
+
+	def test_foreign_dir_is_not_overwritten(self):
+		self.mkd(self.project / "libA")
+		with self.assertRaises(FileExistsError):
+			materializeProject(self.project, self.mapping, Mode.default)
+
+	def test_cli_layout(self):
+		(self.project / "depz.txt").write_text("../libs/libA\n")
+		runmain(["-p", str(self.project), "-m", "layout", "--materialize"])
+		self.assertEqual((self.project / "sub" / "libA" / "b.py").read_text(), "b = 2\n")
+		self.assertEqual(sorted(os.listdir(str(self.project / "sub" / "libA"))),
+						 [MARKER_NAME, "b.py"])
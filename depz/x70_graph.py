@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from array import array
+from pathlib import Path
+
+
+def libnameOf(dirName: str) -> str:
+	"""Returns the library name for the name of the library dir."""
+	if dirName.endswith("_py"):
+		return dirName[:-3]
+	if dirName.endswith("_flutter"):
+		return dirName[:-8]
+	return dirName
+
+
+class DepGraph:
+	"""The dependency graph of a project with compact storage.
+
+	Each dir is interned into an integer node id: the project dir is node 0,
+	the libraries follow in the order they were found. The edges and the
+	external dependencies are stored as parallel arrays of ints, the external
+	names are interned too. Only a single Path object is kept for each node,
+	the results are built from the ids by the accessors.
+	"""
+
+	__slots__ = ("_ids", "_dirs", "edgeFrom", "edgeTo",
+				 "_externalIds", "_externals", "externalFrom", "externalName")
+
+	def __init__(self, projectDir: Path):
+		self._ids: "Dict[str, int]" = dict()
+		self._dirs: "List[Path]" = list()
+		self.edgeFrom = array("i")
+		self.edgeTo = array("i")
+		self._externalIds: "Dict[str, int]" = dict()
+		self._externals: "List[str]" = list()
+		self.externalFrom = array("i")
+		self.externalName = array("i")
+		self.intern(projectDir)
+
+	def intern(self, dirPath: Path) -> "Tuple[int, bool]":
+		"""Returns the node id of the absolute dir path and whether the node
+		was added by this call."""
+		key = str(dirPath)
+		nodeId = self._ids.get(key)
+		if nodeId is not None:
+			return nodeId, False
+		nodeId = len(self._dirs)
+		self._ids[key] = nodeId
+		self._dirs.append(dirPath)
+		return nodeId, True
+
+	def addEdge(self, fromId: int, toId: int):
+		self.edgeFrom.append(fromId)
+		self.edgeTo.append(toId)
+
+	def addExternal(self, fromId: int, name: str):
+		nameId = self._externalIds.get(name)
+		if nameId is None:
+			nameId = len(self._externals)
+			self._externalIds[name] = nameId
+			self._externals.append(name)
+		self.externalFrom.append(fromId)
+		self.externalName.append(nameId)
+
+	@property
+	def nodesCount(self) -> int:
+		return len(self._dirs)
+
+	@property
+	def edgesCount(self) -> int:
+		return len(self.edgeFrom)
+
+	def dirOf(self, nodeId: int) -> Path:
+		return self._dirs[nodeId]
+
+	def localLibs(self) -> "Set[Path]":
+		"""All the library dirs, that is, all the nodes except the project."""
+		return set(self._dirs[1:])
+
+	def externalLibs(self) -> "Dict[str, Set[str]]":
+		"""Returns the mapping from external library names to the names of
+		local libraries (or the project) that need them."""
+		libNames: "Dict[int, str]" = dict()
+		result: "Dict[str, Set[str]]" = dict()
+		for fromId, nameId in zip(self.externalFrom, self.externalName):
+			libName = libNames.get(fromId)
+			if libName is None:
+				libName = libnameOf(self._dirs[fromId].name)
+				libNames[fromId] = libName
+			name = self._externals[nameId]
+			users = result.get(name)
+			if users is None:
+				users = result[name] = set()
+			users.add(libName)
+		return result
@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from pathlib import Path
+
+from depz.x70_graph import DepGraph, libnameOf
+
+
+class TestDepGraph(unittest.TestCase):
+
+	def test_intern(self):
+		graph = DepGraph(Path("/prj"))
+		self.assertEqual(graph.intern(Path("/libs/a")), (1, True))
+		self.assertEqual(graph.intern(Path("/libs/b")), (2, True))
+		self.assertEqual(graph.intern(Path("/libs/a")), (1, False))
+		self.assertEqual(graph.intern(Path("/prj")), (0, False))
+		self.assertEqual(graph.nodesCount, 3)
+		self.assertEqual(graph.localLibs(), {Path("/libs/a"), Path("/libs/b")})
+
+	def test_external_provenance(self):
+		graph = DepGraph(Path("/prj"))
+		a, _ = graph.intern(Path("/libs/a_py"))
+		b, _ = graph.intern(Path("/libs/b_flutter"))
+		graph.addEdge(0, a)
+		graph.addEdge(a, b)
+		graph.addExternal(0, "numpy")
+		graph.addExternal(a, "numpy")
+		graph.addExternal(b, "requests")
+		self.assertEqual(graph.edgesCount, 2)
+		self.assertEqual(graph.externalLibs(),
+						 {"numpy": {"prj", "a"}, "requests": {"b"}})
+		self.assertEqual(list(graph.externalName), [0, 0, 1])
+
+	def test_libname(self):
+		self.assertEqual(libnameOf("lib_py"), "lib")
+		self.assertEqual(libnameOf("lib_flutter"), "lib")
+		self.assertEqual(libnameOf("lib"), "lib")
@@ -0,0 +1,181 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from collections import deque
+from pathlib import Path
+from typing import *
+
+from depz.x70_graph import DepGraph
+
+
+class Cycle:
+	"""The libraries depending on each other, directly or indirectly.
+
+	:ivar libraries: All the dirs of the strongly connected component, sorted.
+	:ivar path: One of the cycles through them, starting and ending with the same dir.
+	"""
+
+	def __init__(self, libraries: List[Path], path: List[Path]):
+		self.libraries = libraries
+		self.path = path
+
+	def lines(self) -> List[str]:
+		result = ["cycle: " + " -> ".join(str(p) for p in self.path)]
+		inPath = set(self.path)
+		result += [f"  also in the cycle: {p}" for p in self.libraries if p not in inPath]
+		return result
+
+
+class Schedule:
+	"""The libraries of the project in the build order, found by buildSchedule.
+
+	Each level contains the libraries that depend only on the libraries of the
+	previous levels, so the libraries of a level can be built concurrently.
+	The libraries of a cycle are put in the same level.
+	"""
+
+	def __init__(self, projectDir: Path, levels: List[List[Path]], cycles: List[Cycle],
+				 dependencies: Dict[Path, List[Path]]):
+		self.projectDir = projectDir
+		self.levels = levels
+		self.cycles = cycles
+		self.dependencies = dependencies  # library -> direct local dependencies
+
+	def lines(self) -> List[str]:
+		"""The schedule as text: a line "LEVEL<tab>DIR" for each library, the
+		levels are numbered from 1."""
+		return [f"{number}\t{libDir}"
+				for number, level in enumerate(self.levels, start=1)
+				for libDir in level]
+
+	def toDict(self) -> Dict[str, Any]:
+		return {
+			"project": str(self.projectDir),
+			"levels": [[str(p) for p in level] for level in self.levels],
+			"cycles": [{"libraries": [str(p) for p in cycle.libraries],
+						"path": [str(p) for p in cycle.path]}
+					   for cycle in self.cycles],
+			"dependencies": {str(lib): [str(p) for p in deps]
+							 for lib, deps in sorted(self.dependencies.items())},
+		}
+
+
+def _components(successors: List[List[int]]) -> List[List[int]]:
+	"""Tarjan's algorithm of the strongly connected components, without
+	recursion, so deep chains of libraries do not hit the recursion limit.
+	Each component is returned after all the components reachable from it."""
+	count = len(successors)
+	index = [-1] * count
+	low = [0] * count
+	onStack = [False] * count
+	stack: List[int] = list()
+	result: List[List[int]] = list()
+	counter = 0
+	for start in range(count):
+		if index[start] >= 0:
+			continue
+		index[start] = low[start] = counter
+		counter += 1
+		stack.append(start)
+		onStack[start] = True
+		work = [(start, 0)]
+		while work:
+			node, i = work[-1]
+			if i < len(successors[node]):
+				work[-1] = (node, i + 1)
+				succ = successors[node][i]
+				if index[succ] < 0:
+					index[succ] = low[succ] = counter
+					counter += 1
+					stack.append(succ)
+					onStack[succ] = True
+					work.append((succ, 0))
+				elif onStack[succ]:
+					low[node] = min(low[node], index[succ])
+				continue
+			work.pop()
+			if work:
+				parent = work[-1][0]
+				low[parent] = min(low[parent], low[node])
+			if low[node] == index[node]:
+				component: List[int] = list()
+				while True:
+					member = stack.pop()
+					onStack[member] = False
+					component.append(member)
+					if member == node:
+						break
+				result.append(component)
+	return result
+
+
+def _cyclePath(start: int, members: Set[int], successors: List[List[int]]) -> List[int]:
+	"""The shortest cycle from the start node through the members and back."""
+	parents: Dict[int, int] = dict()
+	queue = deque([start])
+	while queue:
+		node = queue.popleft()
+		for succ in successors[node]:
+			if succ not in members or succ in parents:
+				continue
+			parents[succ] = node
+			if succ == start:
+				path = [start]
+				node = parents[start]
+				while node != start:
+					path.append(node)
+					node = parents[node]
+				path.append(start)
+				path.reverse()
+				return path
+			queue.append(succ)
+	raise ValueError("Not a cycle")
+
+
+def buildSchedule(graph: DepGraph) -> Schedule:
+	"""Groups the libraries of the graph into the levels that can be built
+	concurrently, and finds the cycles.
+
+	The cycles are found as the strongly connected components; the levels
+	are the longest path lengths in the graph of the components. A library
+	listing itself is not considered a cycle.
+	"""
+	count = graph.nodesCount
+	successorSets: List[Set[int]] = [set() for _ in range(count)]
+	for fromId, toId in zip(graph.edgeFrom, graph.edgeTo):
+		if fromId != toId:
+			successorSets[fromId].add(toId)
+	successors = [sorted(s) for s in successorSets]
+
+	components = _components(successors)
+	componentOf = [0] * count
+	for number, component in enumerate(components):
+		for node in component:
+			componentOf[node] = number
+
+	levelOf: List[int] = list()
+	levels: List[List[Path]] = list()
+	cycles: List[Cycle] = list()
+	for number, component in enumerate(components):
+		# the components reachable from this one are numbered before it
+		level = 0
+		for node in component:
+			for succ in successors[node]:
+				if componentOf[succ] != number:
+					level = max(level, levelOf[componentOf[succ]] + 1)
+		levelOf.append(level)
+		while len(levels) <= level:
+			levels.append(list())
+		levels[level].extend(graph.dirOf(node) for node in component if node != 0)
+		if len(component) > 1:
+			start = min(component, key=lambda node: str(graph.dirOf(node)))
+			path = _cyclePath(start, set(component), successors)
+			cycles.append(Cycle(sorted(graph.dirOf(node) for node in component),
+								[graph.dirOf(node) for node in path]))
+
+	dependencies = {graph.dirOf(node): sorted(graph.dirOf(succ) for succ in successors[node])
+					for node in range(1, count)}
+	return Schedule(graph.dirOf(0),
+					[sorted(level) for level in levels if level],
+					sorted(cycles, key=lambda c: c.libraries),
+					dependencies)
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from pathlib import Path
+
+from depz.x70_graph import DepGraph
+from depz.x75_schedule import buildSchedule
+
+
+def makeGraph(edges) -> DepGraph:
+	"""The graph of the project "/p" from the (from, to) pairs of library names."""
+	graph = DepGraph(Path("/p"))
+	for fromName, toName in edges:
+		fromId, _ = graph.intern(Path("/" + fromName))
+		toId, _ = graph.intern(Path("/" + toName))
+		graph.addEdge(fromId, toId)
+	return graph
+
+
+def names(paths):
+	return [p.name for p in paths]
+
+
+class TestSchedule(unittest.TestCase):
+
+	def test_levels(self):
+		graph = makeGraph([("p", "a"), ("p", "b"), ("a", "c"), ("b", "c"), ("c", "d"),
+						   ("a", "d"), ("b", "e"), ("a", "c"), ("e", "e")])
+		schedule = buildSchedule(graph)
+		self.assertEqual([names(level) for level in schedule.levels],
+						 [["d", "e"], ["c"], ["a", "b"]])
+		self.assertEqual(schedule.cycles, [])
+		self.assertEqual(names(schedule.dependencies[Path("/a")]), ["c", "d"])
+		self.assertEqual(schedule.lines()[:2], ["1\t/d", "1\t/e"])
+
+	def test_cycles(self):
+		# a -> b -> c -> a and b -> d -> b form one component
+		graph = makeGraph([("p", "a"), ("a", "b"), ("b", "c"), ("c", "a"), ("b", "d"),
+						   ("d", "b"), ("d", "x"), ("p", "y"), ("y", "z"), ("z", "y")])
+		schedule = buildSchedule(graph)
+		self.assertEqual([names(level) for level in schedule.levels],
+						 [["x", "y", "z"], ["a", "b", "c", "d"]])
+		self.assertEqual([names(c.libraries) for c in schedule.cycles],
+						 [["a", "b", "c", "d"], ["y", "z"]])
+		self.assertEqual(names(schedule.cycles[0].path), ["a", "b", "c", "a"])
+		self.assertEqual(schedule.cycles[0].lines(),
+						 ["cycle: /a -> /b -> /c -> /a", "  also in the cycle: /d"])
+		data = schedule.toDict()
+		self.assertEqual(data["cycles"][1], {"libraries": ["/y", "/z"],
+											 "path": ["/y", "/z", "/y"]})
+
+	def test_deep_chain(self):
+		size = 5000
+		graph = makeGraph([("p", "lib0")] + [(f"lib{i}", f"lib{i + 1}") for i in range(size - 1)])
+		schedule = buildSchedule(graph)
+		self.assertEqual(len(schedule.levels), size)
+		self.assertEqual(names(schedule.levels[0]), [f"lib{size - 1}"])
@@ -1,53 +1,31 @@
 # SPDX-FileCopyrightText: (c) 2020 Art Galkin <ortemeo@gmail.com>
 # SPDX-License-Identifier: BSD-3-Clause
 import os
-from collections import deque, defaultdict
+import time
+from collections import namedtuple
 from pathlib import Path
-from typing import *
 
-from depz.x00_common import Mode, printVerbose
-from depz.x50_resolve import resolvePath
-from depz.x50_unlink import unlinkChildren, unlinkChildrenAndMaybeRemove
+from depz.x00_common import Mode, CopyMethod, printVerbose
+from depz.x05_stats import stats
+from depz.x10_fs import fs
+from depz.x20_listings import DirListings
+from depz.x50_resolve import resolvePath, PathResolver
+from depz.x55_scanCache import ScanCache, statSignature, isEnvDependent
+from depz.x70_graph import DepGraph, libnameOf
 
 
 def pathToLibname(path: Path) -> str:
-	n = path.name
-	if n.endswith("_py"):
-		n = n[:-3]
-	elif n.endswith("_flutter"):
-		n = n[:-8]
+	return libnameOf(path.name)
 
-	return n
 
-
-def _debugIterParents(p: Path) -> Iterator[Path]:
+def _debugIterParents(p: Path) -> "Iterator[Path]":
 	"""Returns /path/to/parent/file, /path/to/parent, /path/to, /path, /"""
 	parts = list(p.parts)
 	for l in range(len(parts), 0, -1):
 		yield Path(*parts[:l])
 
 
-def symlinkVerbose(realPath: Path, linkPath: Path,
-				   createLinkParent: bool = False):
-	"""Creates a symlink. Throws more detailed exceptions, than Path.
-
-	Path.symlink_to can throw a FileNotFound error without making it clear what is missing:
-	source or target.
-	"""
-
-	if not realPath.exists():
-		# for par in _debugIterParents(realPath):
-		# 	printVerbose(par, par.exists())
-		raise FileNotFoundError(f"realPath path {realPath} does not exist")
-	if createLinkParent:
-		linkPath.parent.mkdir(parents=True, exist_ok=True)
-	elif not linkPath.parent.exists():
-		raise FileNotFoundError(f"The parent dir of destination linkPath {linkPath} does not exist")
-
-	linkPath.symlink_to(realPath, target_is_directory=realPath.is_dir())
-
-
-def defaultMapping(srcLibDir: Path, dstPythonpathDir: Path) -> Iterator[Tuple[Path, Path]]:
+def defaultMapping(srcLibDir: Path, dstPythonpathDir: Path) -> "Iterator[Tuple[Path, Path]]":
 	"""Returns pairs srcPath -> symlinkPath
 
 		libraryA -> project/libraryA
@@ -59,7 +37,37 @@ def defaultMapping(srcLibDir: Path, dstPythonpathDir: Path) -> Iterator[Tuple[Pa
 	yield srcLibDir, dstPythonpathDir / libName
 
 
-def layoutMapping(srcLibDir: Path, dstProjectDir: Path) -> Iterator[Tuple[Path, Path]]:
+class LayoutFilter:
+	"""Which subdirs of the libraries are linked in the layout mode.
+
+	With the allow list, only the listed subdirs are linked. The subdirs from
+	the deny list are never linked. Hidden subdirs (like .git) are linked only
+	if they are allowed explicitly.
+	"""
+
+	def __init__(self, allow: "Optional[Iterable[str]]" = None, deny: "Iterable[str]" = ()):
+		self.allow = None if allow is None else frozenset(allow)
+		self.deny = frozenset(deny)
+
+	def accepts(self, name: str) -> bool:
+		if name in self.deny:
+			return False
+		if self.allow is not None:
+			return name in self.allow
+		return not name.startswith(".")
+
+	def overriddenBy(self, other: "Optional[LayoutFilter]") -> 'LayoutFilter':
+		"""The allow list of the other filter replaces this one, the deny lists
+		are joined."""
+		if other is None:
+			return self
+		return LayoutFilter(allow=other.allow if other.allow is not None else self.allow,
+							deny=self.deny | other.deny)
+
+
+def layoutMapping(srcLibDir: Path, dstProjectDir: Path,
+				  listings: "Optional[DirListings]" = None,
+				  layoutFilter: "Optional[LayoutFilter]" = None) -> "Iterator[Tuple[Path, Path]]":
 	"""Returns pairs srcPath -> symlinkPath
 
 	libraryA/lib	-> project/lib/libraryA
@@ -68,128 +76,464 @@ def layoutMapping(srcLibDir: Path, dstProjectDir: Path) -> Iterator[Tuple[Path,
 	libraryB/lib	-> project/lib/libraryB
 	libraryB/test	-> project/test/libraryB
 
+	The subdirs are taken from the cached scandir listing, so the dir types
+	come from d_type without extra stat calls.
 	"""
 
+	if listings is None:
+		listings = DirListings()
+	if layoutFilter is None:
+		layoutFilter = LayoutFilter()
+
 	libName = pathToLibname(srcLibDir)
 
-	for item in srcLibDir.glob("*"):
-		if item.is_dir():
-			yield (srcLibDir / item.name).absolute(), dstProjectDir / item.name / libName
+	for name in listings.subdirs(srcLibDir):
+		if layoutFilter.accepts(name):
+			yield (srcLibDir / name).absolute(), dstProjectDir / name / libName
+
 
+MANIFEST_NAMES = (
+	"depz.txt",
+	"pydpn.txt",  # deprecated since 2021-03
+)
 
-def pydpnFiles(dirPath: Path) -> Iterable[Path]:
-	for p in [
-		dirPath / "depz.txt",
-		dirPath / "lib" / "depz.txt",
-		dirPath / "pydpn.txt",  # deprecated since 2021-03
-		dirPath / "lib" / "pydpn.txt"  # deprecated since 2021-03
-	]:
-		if p.exists():
-			yield p
 
+def pydpnFiles(dirPath: Path, listings: "Optional[DirListings]" = None,
+			   names: "Iterable[str]" = MANIFEST_NAMES) -> "Iterable[Path]":
+	"""Yields the manifests found in the library dir and in its "lib" subdir.
 
-def iterLnkdpnLines(file: Path) -> Iterator[str]:
-	"""Returns all lines except empty and comments"""
-	for line in file.read_text().splitlines():
+	Lists the library dir once, and the "lib" subdir only if it exists, instead
+	of checking each candidate path."""
+
+	if listings is None:
+		listings = DirListings()
+
+	entries = listings.entries(dirPath)
+	libEntries = listings.entries(dirPath / "lib") if entries.get("lib") else dict()
+
+	for name in names:
+		if entries.get(name) is False:
+			yield dirPath / name
+		if libEntries.get(name) is False:
+			yield dirPath / "lib" / name
+
+
+DIRECTIVE_PREFIX = "@"
+
+
+def _meaningfulLines(file: Path) -> "Iterator[str]":
+	with stats.phase("read"):
+		text = fs.readText(str(file))
+	for line in text.splitlines():
 		line = line.partition("#")[0].strip()
 		if line:
 			yield line
 
 
-def removeLinks(projectDir: Path, mode: Mode):
-	# removing old links
-	projectDir.mkdir(exist_ok=True)
-	unlinkChildren(projectDir)
-	if mode == Mode.layout:
-		for sub in projectDir.glob("*"):
-			if sub.is_dir():
-				unlinkChildrenAndMaybeRemove(sub)
-
-
-def rescan(projectDir: Path, relink: bool, mode: Mode) -> Dict[str, Set[str]]:
-	# сканирует файл depz.txt в каталоге проекта, а также, следуя по ссылкам на другие локальные
-	# библиотеки - все файлы pydpn.txt в тех библиотеках.
-	#
-	# В итоге на локальные библиотеки делает симлинки в каталоге project/pkgs (заменяя все
-	# симлинки, которые там были).
-	#
-	# А имена внешних библиотек просто возвращает списокои
+def iterLnkdpnLines(file: Path) -> "Iterator[str]":
+	"""Returns all lines except empty, comments and directives"""
+	for line in _meaningfulLines(file):
+		if not line.startswith(DIRECTIVE_PREFIX):
+			yield line
 
-	localLibs: Set[Path] = set()
-	externalLibs = defaultdict(set)
 
-	# читаю все pydpn, запоминая результаты, но ничего не меняя
+def iterDirectives(file: Path) -> "Iterator[Tuple[str, List[str]]]":
+	"""Returns (name, arguments) for the lines like "@layout-allow lib test"."""
+	for line in _meaningfulLines(file):
+		if line.startswith(DIRECTIVE_PREFIX):
+			name, *args = line[len(DIRECTIVE_PREFIX):].split()
+			yield name, args
+
+
+def readLayoutFilter(projectDir: Path, listings: "Optional[DirListings]" = None,
+					 names: "Iterable[str]" = MANIFEST_NAMES) -> LayoutFilter:
+	"""Reads the @layout-allow and @layout-deny directives of the project
+	manifests. The directives in the manifests of libraries are ignored."""
+	allow: "Optional[List[str]]" = None
+	deny: "List[str]" = list()
+	for file in pydpnFiles(projectDir, listings, names):
+		for name, args in iterDirectives(file):
+			if name == "layout-allow":
+				allow = (allow or list()) + args
+			elif name == "layout-deny":
+				deny += args
+			else:
+				raise ValueError(f"Unknown directive {DIRECTIVE_PREFIX}{name} in {file}")
+	return LayoutFilter(allow, deny)
+
+
+def manifestEntries(file: Path, cache: "Optional[ScanCache]" = None,
+					resolver: "Optional[PathResolver]" = None) -> "Entries":
+	"""Returns (line, resolvedPath) for each meaningful line of the manifest.
+	The resolvedPath is None for external dependencies."""
+	resolve = resolver.resolve if resolver is not None else resolvePath
+
+	if cache is None:
+		lines = list(iterLnkdpnLines(file))
+		with stats.phase("resolve"):
+			return [(line, resolve(file.parent, line)) for line in lines]
+
+	with stats.phase("cache"):
+		signature = statSignature(file)
+		entries = cache.get(file, signature)
+	if entries is not None:
+		with stats.phase("resolve"):
+			return [(line, resolve(file.parent, line) if isEnvDependent(line) else target)
+					for line, target in entries]
+
+	lines = list(iterLnkdpnLines(file))
+	with stats.phase("resolve"):
+		entries = [(line, resolve(file.parent, line)) for line in lines]
+	cache.put(file, signature, entries)
+	return entries
+
+
+class Scanner:
+	"""The state shared by all the dirs scanned during a run."""
+
+	def __init__(self, cache: "Optional[ScanCache]" = None,
+				 manifestNames: "Iterable[str]" = MANIFEST_NAMES,
+				 listings: "Optional[DirListings]" = None,
+				 resolver: "Optional[PathResolver]" = None):
+		self.cache = cache
+		self.manifestNames = tuple(manifestNames)
+		self.listings = listings if listings is not None else DirListings()
+		self.resolver = resolver if resolver is not None else PathResolver()
+
+	def scanDir(self, dirPath: Path) -> "List[Tuple[Path, Entries]]":
+		"""Reads and resolves all the manifests of the project or library dir.
+		Does not change anything, so it is safe to run for many dirs concurrently."""
+		started = time.perf_counter()
+		with stats.phase("discovery"):
+			files = list(pydpnFiles(dirPath, self.listings, self.manifestNames))
+		result = [(file, manifestEntries(file, self.cache, self.resolver)) for file in files]
+		stats.dirScanned(str(dirPath), time.perf_counter() - started)
+		return result
+
+
+class MemoScanner(Scanner):
+	"""Scanner that remembers the results of each scanned dir until it is
+	invalidated. Traversing the graph again only rescans the invalidated dirs."""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.scans: "Dict[Path, List[Tuple[Path, Entries]]]" = dict()
+
+	def scanDir(self, dirPath: Path) -> "List[Tuple[Path, Entries]]":
+		result = self.scans.get(dirPath)
+		if result is None:
+			result = super().scanDir(dirPath)
+			self.scans[dirPath] = result
+		return result
+
+	def invalidate(self, dirs: "Iterable[Path]"):
+		for d in dirs:
+			self.scans.pop(d, None)
+			self.listings.forget(d)
+			self.listings.forget(d / "lib")
+		# the resolved and the negative results may be outdated now
+		self.resolver = PathResolver()
+
+	def retain(self, dirs: "Set[Path]"):
+		"""Forgets the dirs that are no longer part of the graph."""
+		for d in list(self.scans):
+			if d not in dirs:
+				del self.scans[d]
+
+
+def projectLayoutFilter(projectDir: Path, mode: Mode, scanner: Scanner,
+						override: "Optional[LayoutFilter]" = None) -> "Optional[LayoutFilter]":
+	"""The filter of the project manifests overridden by the given one.
+	None in the default mode, where the filter is not used."""
+	if mode != Mode.layout:
+		return None
+	return readLayoutFilter(projectDir, scanner.listings, scanner.manifestNames) \
+		.overriddenBy(override)
+
+
+# namedtuple, not typing.NamedTuple: typing would slow down each CLI run
+
+class ManifestRead(namedtuple("ManifestRead", "dirPath file")):
+	"""A manifest of the dir was read. Its lines follow as other events."""
+	__slots__ = ()
+
+
+class LocalEdge(namedtuple("LocalEdge", "fromDir toDir line isNew")):
+	"""A line of the dir's manifest resolved to a local library dir.
+	The isNew is True when the library is met for the first time."""
+	__slots__ = ()
+
+
+class ExternalDep(namedtuple("ExternalDep", "fromDir name libName")):
+	"""A line of the dir's manifest is an external dependency."""
+	__slots__ = ()
+
+
+# GraphEvent in the annotations is any of ManifestRead, LocalEdge and ExternalDep
+
+
+def iterGraph(projectDir: Path, scanner: "Optional[Scanner]" = None, jobs: int = 1,
+			  maxDepth: "Optional[int]" = None) -> "Iterator[GraphEvent]":
+	"""Traverses the dependency graph lazily, yielding the events as soon
+	as they are discovered. The caller may stop iterating at any moment:
+	the rest of the graph is not scanned then.
 
-	pathsToAnalyze: Deque[Path] = deque((projectDir.absolute(),))
+	The graph is traversed breadth-first, level by level. With jobs > 1 the dirs of
+	each level are scanned concurrently, but the events are yielded in the same order
+	as the serial traversal would do.
 
-	while pathsToAnalyze:
+	:param maxDepth: The libraries more than maxDepth edges away from the project
+	are not visited. The libraries exactly maxDepth edges away are not scanned.
+	"""
+	projectDir = projectDir.absolute()
+	return _iterGraph(projectDir, DepGraph(projectDir), scanner, jobs, maxDepth=maxDepth)
 
-		currDir = pathsToAnalyze.popleft()  # каталог проекта или библиотеки
 
-		for lnkdpnFile in pydpnFiles(currDir):
+def _iterGraph(projectDir: Path, graph: DepGraph, scanner: "Optional[Scanner]",
+			   jobs: int, roots: "Optional[List[Path]]" = None,
+			   maxDepth: "Optional[int]" = None) -> "Iterator[GraphEvent]":
+	"""Same as iterGraph, but also records the nodes, edges and external
+	dependencies into the graph.
 
-			printVerbose(f"Depz file: {lnkdpnFile}")
+	:param roots: Start from these library dirs as if the project depended
+	only on them. The project dir itself is not scanned then.
+	"""
+	if scanner is None:
+		scanner = Scanner()
+
+	frontier: "List[Tuple[int, Path]]" = [(0, projectDir)]
+	depth = 0
+	if roots is not None:
+		frontier = list()
+		for root in roots:
+			root = root.absolute()
+			rootId, isNew = graph.intern(root)
+			graph.addEdge(0, rootId)
+			if isNew:
+				frontier.append((rootId, root))
+		depth = 1
+
+	executor = None
+	if jobs > 1:
+		from concurrent.futures import ThreadPoolExecutor
+		executor = ThreadPoolExecutor(max_workers=jobs)
+
+	try:
+		while frontier and (maxDepth is None or depth < maxDepth):
+			dirs = [d for _, d in frontier]
+			if executor is not None:
+				scans = executor.map(scanner.scanDir, dirs)
+			else:
+				scans = (scanner.scanDir(d) for d in dirs)  # lazily, one by one
+
+			nextFrontier: "List[Tuple[int, Path]]" = list()
+			for (currId, currDir), dirScan in zip(frontier, scans):  # каталог проекта или библиотеки
+				stats.nodes += 1
+				libName = None
+				for lnkdpnFile, entries in dirScan:
+					yield ManifestRead(currDir, lnkdpnFile)
+					for line, localPkgPath in entries:
+						if localPkgPath:
+							stats.edges += 1
+							localPkgPath = localPkgPath.absolute()
+							toId, isNew = graph.intern(localPkgPath)
+							graph.addEdge(currId, toId)
+							if isNew:
+								nextFrontier.append((toId, localPkgPath))
+							yield LocalEdge(currDir, localPkgPath, line, isNew)
+						else:
+							graph.addExternal(currId, line)
+							if libName is None:
+								libName = pathToLibname(currDir)
+							yield ExternalDep(currDir, line, libName)
+			frontier = nextFrontier
+			depth += 1
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+
+def buildGraph(projectDir: Path, scanner: "Optional[Scanner]" = None, jobs: int = 1,
+			   observer: "Optional[Callable[[GraphEvent], None]]" = None,
+			   roots: "Optional[List[Path]]" = None,
+			   maxDepth: "Optional[int]" = None) -> DepGraph:
+	"""Traverses the dependency graph of the project: the whole graph, or
+	the part limited by roots and maxDepth, as in _iterGraph.
+
+	:param observer: Called for each event of iterGraph while traversing.
+	"""
+	projectDir = projectDir.absolute()
+	graph = DepGraph(projectDir)
+	for event in _iterGraph(projectDir, graph, scanner, jobs, roots, maxDepth):
+		if observer is not None:
+			observer(event)
+		if isinstance(event, ManifestRead):
+			printVerbose(f"Depz file: {event.file}")
+	return graph
+
+
+def findLibrary(projectDir: Path, name: str, scanner: "Optional[Scanner]" = None,
+				jobs: int = 1) -> "Optional[Path]":
+	"""Finds the library the project depends on, directly or indirectly, by
+	its dir path or its name, like "mylib" for "mylib_py". The traversal
+	stops as soon as the library is found.
+
+	:return: The absolute library dir or None.
+	"""
+	wanted = os.path.abspath(name) if os.sep in name else None
+	for event in iterGraph(projectDir, scanner, jobs):
+		if isinstance(event, LocalEdge) and event.isNew:
+			libDir = event.toDir
+			if wanted is not None:
+				if os.path.abspath(str(libDir)) == wanted:
+					return libDir
+			elif name in (libDir.name, libnameOf(libDir.name)):
+				return libDir
+	return None
+
+
+def traverse(projectDir: Path, scanner: "Optional[Scanner]" = None, jobs: int = 1,
+			 observer: "Optional[Callable[[GraphEvent], None]]" = None) \
+		-> "Tuple[Set[Path], Dict[str, Set[str]]]":
+	"""Finds all the local libraries the project depends on, directly
+	or indirectly, and the external dependencies of them all.
+
+	:param observer: Called for each event of iterGraph while traversing.
+	:return: Local library dirs and the mapping from external library names to the
+	names of local libraries that need them.
+	"""
+	graph = buildGraph(projectDir, scanner=scanner, jobs=jobs, observer=observer)
+	return graph.localLibs(), graph.externalLibs()
+
+
+def computeMapping(localLibs: "Iterable[Path]", projectDir: Path, mode: Mode,
+				   listings: "Optional[DirListings]" = None,
+				   layoutFilter: "Optional[LayoutFilter]" = None) -> "Dict[Path, Path]":
+	"""Returns srcPath -> symlinkPath for all the local libraries."""
+	mapping: "Dict[Path, Path]" = dict()
+	with stats.phase("mapping"):
+		for path in localLibs:
+			if mode == Mode.layout:
+				pairs = layoutMapping(path, projectDir, listings, layoutFilter)
+			else:
+				pairs = defaultMapping(path, projectDir)
+			for k, v in pairs:
+				mapping[k] = v
+	return mapping
+
+
+def relinkProject(projectDir: Path, mapping: "Dict[Path, Path]", mode: Mode,
+				  jobs: int = 1, partial: bool = False) -> "LinksDiff":
+	"""Makes the symlinks in the project dir match the mapping, changing only
+	the links that differ. With jobs > 1 the links are changed by a pool
+	of threads.
+
+	Only the links created by depz are removed or replaced: they are listed
+	in the LINKS_FILE_NAME file of the project (see ownedLinks).
+
+	:param partial: The mapping covers only a part of the graph: the links
+	missing from it are kept.
+	"""
+	# imported here, so the runs only printing the dependencies do not load it
+	from depz.x60_relink import ownedLinks, diffLinks, applyLinksDiff, LinksApplyError, \
+		updateLinksFile
+
+	if not fs.exists(str(projectDir)):
+		fs.mkdir(str(projectDir))
+	with stats.phase("links scan"):
+		desired = {dst.absolute(): src.absolute() for src, dst in mapping.items()}
+		existing, listed = ownedLinks(projectDir, mode)
+		diff = diffLinks(desired, existing)
+		if partial:
+			diff.removed = []
+	with stats.phase("links apply"):
+		try:
+			applyLinksDiff(diff, projectDir, mode, jobs)
+		except LinksApplyError as e:
+			updateLinksFile(projectDir, existing, diff, listed, [path for path, _ in e.errors])
+			raise
+		updateLinksFile(projectDir, existing, diff, listed)
+	return diff
+
+
+def checkProject(projectDir: Path, mapping: "Dict[Path, Path]", mode: Mode,
+				 quick: bool = False, partial: bool = False) -> "LinksCheck":
+	"""Compares the symlinks in the project dir with the mapping without
+	changing anything. See checkLinks."""
+	from depz.x60_relink import checkLinks
+	with stats.phase("links check"):
+		desired = {dst.absolute(): src.absolute() for src, dst in mapping.items()}
+		return checkLinks(desired, projectDir.absolute(), mode, quick, partial)
+
+
+def applyMapping(projectDir: Path, mapping: "Dict[Path, Path]", mode: Mode, relink: bool,
+				 materialize: "Optional[CopyMethod]" = None, jobs: int = 1,
+				 partial: bool = False):
+	"""Relinks the project according to the mapping or, if relink is False,
+	only prints the mapping. With materialize, copies the library dirs
+	into the project instead of linking."""
+	if materialize is not None:
+		from depz.x65_materialize import materializeProject
+		materializeProject(projectDir, mapping, mode, materialize, partial)
+	elif relink:
+		relinkProject(projectDir, mapping, mode, jobs, partial)
+	else:
+		for srcPath in sorted(mapping):
+			printVerbose("Supposed mapping:")
+			printVerbose(f"  real: {srcPath.absolute()}")
+			printVerbose(f"  link: {mapping[srcPath].absolute()}")
 
-			for line in iterLnkdpnLines(lnkdpnFile):
 
-				localPkgPath = resolvePath(lnkdpnFile.parent, line)
+class ScanResult:
+	"""Everything found out about the project by scanProject."""
 
-				if localPkgPath:
+	def __init__(self, graph: DepGraph, mapping: "Dict[Path, Path]"):
+		self.graph = graph
+		self.mapping = mapping
+		self.externalLibs = graph.externalLibs()
 
-					localPkgPath = localPkgPath.absolute()
-					if not localPkgPath in localLibs:
-						localLibs.add(localPkgPath)
-						pathsToAnalyze.append(localPkgPath)
+	@property
+	def localLibs(self) -> "Set[Path]":
+		return self.graph.localLibs()
 
-				else:
 
-					assert not localPkgPath
-					externalLibs[line].add(pathToLibname(currDir))
+def scanProject(projectDir: Path, relink: bool, mode: Mode,
+				scanner: "Optional[Scanner]" = None, jobs: int = 1,
+				observer: "Optional[Callable[[GraphEvent], None]]" = None,
+				materialize: "Optional[CopyMethod]" = None,
+				layoutFilter: "Optional[LayoutFilter]" = None,
+				roots: "Optional[List[Path]]" = None,
+				maxDepth: "Optional[int]" = None,
+				apply: bool = True) -> ScanResult:
+	"""Same as rescan, but returns the local libraries and the mapping too.
 
-	mapping: Dict[Path, Path] = dict()
+	:param layoutFilter: Overrides the directives of the project manifests.
+	:param roots, maxDepth: Limit the scan to a part of the graph, as in buildGraph.
+	Then the links outside the part are not removed.
+	:param apply: False to only compute the mapping, without printing or relinking.
+	"""
 
-	if mode == Mode.layout:
-		mapper = layoutMapping
-	else:
-		mapper = defaultMapping
-
-	for path in localLibs:
-		for k, v in mapper(path, projectDir):
-			mapping[k] = v
-
-	if relink:
-		removeLinks(projectDir, mode)
-
-	# if relink:
-	# 	# removing old links
-	# 	projectDir.mkdir(exist_ok=True)
-	# 	unlinkAll(projectDir)
-	# 	if mode == Mode.layout:
-	# 		for sub in projectDir.glob("*"):
-	# 			if sub.is_dir():
-	# 				unlinkAll(sub)
-	# 			if len(list(sub.glob("*"))):
-	# 				# seems dangerous: we're remove a directory!
-	# 				# But since it is not a rmtree, the directory
-	# 				# will only be removed it it's empty
-	# 				os.rmdir(str(sub))
-	# 			#if sub.
-	# 	# todo
-
-	for srcPath in sorted(mapping):
-		dstPath = mapping[srcPath].absolute()
-		srcPath = srcPath.absolute()
-		if relink:
-			printVerbose("Creating symlink:")
-		else:
-			printVerbose("Supposed mapping:")
+	if scanner is None:
+		scanner = Scanner()
 
-		printVerbose(f"  real: {srcPath}")
-		printVerbose(f"  link: {dstPath}")
+	graph = buildGraph(projectDir, scanner=scanner, jobs=jobs, observer=observer,
+					   roots=roots, maxDepth=maxDepth)
+	mapping = computeMapping(graph.localLibs(), projectDir, mode, scanner.listings,
+							 projectLayoutFilter(projectDir, mode, scanner, layoutFilter))
+	if apply:
+		applyMapping(projectDir, mapping, mode, relink, materialize, jobs,
+					 partial=roots is not None or maxDepth is not None)
+	return ScanResult(graph, mapping)
 
-		if relink:
-			symlinkVerbose(srcPath, mapping[srcPath], createLinkParent=(mode == Mode.layout))
 
-	# возвращаю то, что не было ссылками на локальные проекты: т.е. внешние зависимости
+def rescan(projectDir: Path, relink: bool, mode: Mode,
+		   scanner: "Optional[Scanner]" = None, jobs: int = 1) -> "Dict[str, Set[str]]":
+	# сканирует файл depz.txt в каталоге проекта, а также, следуя по ссылкам на другие локальные
+	# библиотеки - все файлы pydpn.txt в тех библиотеках.
+	#
+	# В итоге на локальные библиотеки делает симлинки в каталоге project/pkgs (заменяя все
+	# симлинки, которые там были).
+	#
+	# А имена внешних библиотек просто возвращает списокои
 
-	return externalLibs
+	return scanProject(projectDir, relink, mode, scanner=scanner, jobs=jobs).externalLibs
@@ -0,0 +1,275 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from pathlib import Path
+
+from depz.x00_common import Mode, printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x10_fs import fs, MemoryFileSystem
+from depz.x60_relink import LINKS_FILE_NAME, readLinksFile
+from depz.x80_rescanRelink import traverse, iterGraph, buildGraph, MemoScanner, ManifestRead, \
+	LocalEdge, ExternalDep, LayoutFilter, layoutMapping, readLayoutFilter, findLibrary, \
+	scanProject, Scanner, relinkProject, checkProject
+
+
+class TestTraverse(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		printVerbose.allowed = False
+		# project -> lib0..lib9, each libN -> lib(N+1), lib(N+2) and externals
+		self.project = self.mkd(self.tempDir / "project")
+		(self.project / "depz.txt").write_text("../lib0\nroot_ext\n../lib5\n")
+		for i in range(10):
+			lib = self.mkd(self.tempDir / f"lib{i}")
+			lines = [f"../lib{j}" for j in (i + 1, i + 2) if j < 10]
+			lines += [f"ext{i % 4}", "common"]
+			(lib / "depz.txt").write_text("\n".join(lines))
+
+	def tearDown(self):
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def test_parallel_same_as_serial(self):
+		serialLibs, serialExt = traverse(self.project)
+		parallelLibs, parallelExt = traverse(self.project, jobs=4)
+		self.assertEqual(len(serialLibs), 10)
+		self.assertEqual(serialLibs, parallelLibs)
+		self.assertEqual(list(serialExt.items()), list(parallelExt.items()))
+		self.assertEqual(list(serialExt)[:3], ["root_ext", "ext0", "common"])
+
+	def test_graph(self):
+		graph = buildGraph(self.project)
+		self.assertEqual(graph.nodesCount, 11)
+		# 2 from the project, two from each of lib0..lib7, one from lib8
+		self.assertEqual(graph.edgesCount, 2 + 8 * 2 + 1)
+		self.assertEqual(graph.dirOf(0), self.project.absolute())
+		self.assertEqual(graph.dirOf(graph.edgeTo[0]).name, "lib0")
+		self.assertEqual(graph.externalLibs()["root_ext"], {"project"})
+
+	def test_project_is_not_a_library(self):
+		(self.tempDir / "lib9" / "depz.txt").write_text("../project\n")
+		libs, _ = traverse(self.project)
+		self.assertEqual(len(libs), 10)
+		self.assertNotIn(self.project.absolute(), libs)
+
+	def test_events(self):
+		events = list(iterGraph(self.project))
+		self.assertEqual(events[0], ManifestRead(self.project, self.project / "depz.txt"))
+		self.assertIsInstance(events[1], LocalEdge)
+		self.assertEqual(events[1].toDir.name, "lib0")
+		self.assertTrue(events[1].isNew)
+		self.assertEqual(events[2], ExternalDep(self.project, "root_ext", "project"))
+		edges = [e for e in events if isinstance(e, LocalEdge)]
+		self.assertEqual(len(edges), 1 + 1 + 17)
+		self.assertEqual(sum(e.isNew for e in edges), 10)
+
+	def test_stop_early(self):
+		scanner = MemoScanner()
+		for event in iterGraph(self.project, scanner):
+			if isinstance(event, ExternalDep):
+				break
+		self.assertEqual(list(scanner.scans), [self.project])
+
+	def test_parallel_events_same_as_serial(self):
+		self.assertEqual(list(iterGraph(self.project)), list(iterGraph(self.project, jobs=3)))
+
+
+	def test_depth(self):
+		scanner = MemoScanner()
+		graph = buildGraph(self.project, scanner, maxDepth=1)
+		self.assertEqual({d.name for d in graph.localLibs()}, {"lib0", "lib5"})
+		self.assertEqual(list(graph.externalLibs()), ["root_ext"])
+		self.assertEqual(list(scanner.scans), [self.project.absolute()])
+
+		graph = buildGraph(self.project, maxDepth=2)
+		self.assertEqual({d.name for d in graph.localLibs()},
+						 {"lib0", "lib1", "lib2", "lib5", "lib6", "lib7"})
+
+	def test_only(self):
+		lib8 = findLibrary(self.project, "lib8")
+		self.assertEqual(lib8, (self.tempDir / "lib8").absolute())
+		self.assertEqual(findLibrary(self.project, str(self.tempDir / "lib8")), lib8)
+		self.assertIsNone(findLibrary(self.project, "missing"))
+
+		graph = buildGraph(self.project, roots=[lib8])
+		self.assertEqual({d.name for d in graph.localLibs()}, {"lib8", "lib9"})
+		self.assertEqual(graph.externalLibs()["common"], {"lib8", "lib9"})
+		self.assertNotIn("root_ext", graph.externalLibs())
+
+	def test_partial_relink_keeps_other_links(self):
+		scanProject(self.project, relink=True, mode=Mode.default)
+		result = scanProject(self.project, relink=True, mode=Mode.default, maxDepth=1)
+		self.assertEqual(len(result.mapping), 2)
+		self.assertEqual(len([p for p in self.project.iterdir() if p.is_symlink()]), 10)
+
+
+class TestLayoutFilter(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.lib = self.mkd(self.tempDir / "libA")
+		for name in ["lib", "test", "build", ".git"]:
+			self.mkd(self.lib / name)
+		(self.lib / "README.md").write_text("")
+
+	def mapped(self, layoutFilter=None):
+		return sorted(dst.parent.name for _, dst in
+					  layoutMapping(self.lib, self.tempDir / "project", layoutFilter=layoutFilter))
+
+	def test_default_skips_hidden(self):
+		self.assertEqual(self.mapped(), ["build", "lib", "test"])
+
+	def test_allow_and_deny(self):
+		self.assertEqual(self.mapped(LayoutFilter(allow=["lib", "test", ".git"], deny=["test"])),
+						 [".git", "lib"])
+
+	def test_directives(self):
+		project = self.mkd(self.tempDir / "project")
+		(project / "depz.txt").write_text("../libA\n@layout-allow lib test\n@layout-deny test\n")
+		layoutFilter = readLayoutFilter(project)
+		self.assertEqual(self.mapped(layoutFilter), ["lib"])
+		self.assertEqual(self.mapped(layoutFilter.overriddenBy(LayoutFilter(allow=["build"]))),
+						 ["build"])
+		# the directive lines are not dependencies
+		_, externals = traverse(project)
+		self.assertEqual(dict(externals), {})
+
+
+class TestInMemory(unittest.TestCase):
+	"""A graph too large for the disk-based tests, checked by the operation
+	counts instead of the time."""
+
+	SIZE = 2000
+
+	def setUp(self):
+		printVerbose.allowed = False
+		self.memory = MemoryFileSystem()
+		self._using = fs.using(self.memory)
+		self._using.__enter__()
+		# project -> lib0..lib9, each libN -> lib(N+10), lib(N+11)
+		for i in range(self.SIZE):
+			fs.makedirs(f"/libs/lib{i}")
+			deps = [f"../lib{j}" for j in (i + 10, i + 11) if j < self.SIZE]
+			fs.writeBytes(f"/libs/lib{i}/depz.txt", "\n".join(deps + ["numpy"]).encode())
+		fs.makedirs("/project")
+		fs.writeBytes("/project/depz.txt",
+					  "\n".join(f"../libs/lib{i}" for i in range(10)).encode())
+		self.project = Path("/project")
+		self.memory.resetOps()
+
+	def tearDown(self):
+		self._using.__exit__(None, None, None)
+		printVerbose.allowed = True
+
+	def test_operation_counts(self):
+		result = scanProject(self.project, relink=True, mode=Mode.default,
+							 scanner=Scanner())
+		self.assertEqual(len(result.localLibs), self.SIZE)
+		ops = dict(self.memory.ops)
+		# each manifest is read once, each dir is listed once; without the
+		# links file the symlinks of the project dir are found by listing it
+		self.assertEqual(ops["read"], self.SIZE + 1 + 1)  # + the links file
+		self.assertEqual(ops["scandir"], self.SIZE + 1 + 1)
+		# a stat for each distinct path, not for each line: the library dir and
+		# the "numpy" candidate in it; then a stat of the target and a lstat
+		# of the link for each new link
+		self.assertEqual(ops["stat"], 4 * self.SIZE + 4)
+		self.assertEqual((ops["symlink"], ops["rename"]), (self.SIZE, self.SIZE + 1))
+		self.assertEqual(ops["write"], 1)
+
+		self.memory.resetOps()
+		scanProject(self.project, relink=True, mode=Mode.default, scanner=Scanner())
+		self.assertNotIn("symlink", self.memory.ops)
+		self.assertNotIn("write", self.memory.ops)
+		# the links listed in the links file are read, the project dir is not listed
+		self.assertEqual(self.memory.ops["readlink"], self.SIZE)
+		self.assertEqual(self.memory.ops["scandir"], self.SIZE + 1)
+
+
+class TestOwnedLinks(unittest.TestCase):
+
+	def setUp(self):
+		printVerbose.allowed = False
+		self.memory = MemoryFileSystem()
+		self._using = fs.using(self.memory)
+		self._using.__enter__()
+		for name in ("libA", "libB", "mine"):
+			fs.makedirs(f"/libs/{name}")
+		fs.makedirs("/project")
+		self.project = Path("/project")
+		self.mapping = {Path("/libs/libA"): self.project / "libA",
+						Path("/libs/libB"): self.project / "libB"}
+
+	def tearDown(self):
+		self._using.__exit__(None, None, None)
+		printVerbose.allowed = True
+
+	def test_hand_made_links_are_kept(self):
+		relinkProject(self.project, self.mapping, Mode.default)
+		self.assertEqual(readLinksFile(self.project), [self.project / "libA", self.project / "libB"])
+		fs.symlink("/libs/mine", "/project/mine", True)
+
+		self.assertTrue(checkProject(self.project, self.mapping, Mode.default).ok)
+		diff = relinkProject(self.project, {Path("/libs/libA"): self.project / "libA"},
+							 Mode.default)
+		self.assertEqual(diff.removed, [self.project / "libB"])
+		self.assertEqual(fs.readlink("/project/mine"), "/libs/mine")
+		self.assertEqual(readLinksFile(self.project), [self.project / "libA"])
+
+		relinkProject(self.project, dict(), Mode.default)
+		self.assertEqual(readLinksFile(self.project), [])
+		self.assertEqual(sorted(name for name, _, _ in fs.scandir("/project")),
+						 [LINKS_FILE_NAME, "mine"])
+
+	def test_without_links_file_all_symlinks_are_ours(self):
+		fs.symlink("/libs/mine", "/project/old", True)
+		diff = relinkProject(self.project, self.mapping, Mode.default)
+		self.assertEqual(diff.removed, [self.project / "old"])
+		self.assertFalse(fs.exists("/project/old"))
+
+	def test_changed_and_foreign_entries(self):
+		relinkProject(self.project, self.mapping, Mode.default)
+		# the user replaced a link with a real dir and listed the paths outside
+		fs.unlink("/project/libB")
+		fs.mkdir("/project/libB")
+		fs.symlink("/libs/mine", "/libs/outside", True)
+		fs.symlink("/libs/mine", "/libs/libA/important", True)
+		self.memory.writeText("/project/" + LINKS_FILE_NAME,
+							  "libA\nlibB\n../libs/outside\n/libs/outside\nlibA/important\n")
+
+		diff = relinkProject(self.project, dict(), Mode.default)
+		self.assertEqual(diff.removed, [self.project / "libA"])
+		self.assertTrue(fs.isDir("/project/libB"))
+		self.assertEqual(fs.readlink("/libs/outside"), "/libs/mine")
+		self.assertEqual(fs.readlink("/libs/libA/important"), "/libs/mine")
+		self.assertEqual(readLinksFile(self.project), [])
+
+	def test_no_links_is_recorded_too(self):
+		relinkProject(self.project, dict(), Mode.default)
+		self.assertEqual(readLinksFile(self.project), [])
+		fs.symlink("/libs/mine", "/project/mine", True)
+		relinkProject(self.project, dict(), Mode.default)
+		self.assertEqual(fs.readlink("/project/mine"), "/libs/mine")
+
+	def test_layout_links_through_symlinked_subdir(self):
+		fs.symlink("/libs/libA", "/libs/libB/inner", True)
+		fs.symlink("/libs/libB", "/project/sub", True)
+		self.memory.writeText("/project/" + LINKS_FILE_NAME, "sub/inner\ninner\n")
+		relinkProject(self.project, dict(), Mode.layout)
+		self.assertEqual(fs.readlink("/libs/libB/inner"), "/libs/libA")
+
+	def test_switching_modes(self):
+		relinkProject(self.project, self.mapping, Mode.default)
+		layoutMapping = {Path("/libs/libA/lib"): self.project / "lib" / "libA"}
+		fs.makedirs("/libs/libA/lib")
+		relinkProject(self.project, layoutMapping, Mode.layout)
+		self.assertFalse(fs.exists("/project/libA"))
+		self.assertFalse(fs.exists("/project/libB"))
+		self.assertEqual(readLinksFile(self.project), [self.project / "lib" / "libA"])
+		self.assertTrue(checkProject(self.project, layoutMapping, Mode.layout).ok)
+
+		relinkProject(self.project, self.mapping, Mode.default)
+		self.assertFalse(fs.exists("/project/lib"))
+		self.assertEqual(readLinksFile(self.project), [self.project / "libA", self.project / "libB"])
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import hashlib
+import json
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode
+from depz.x10_fs import writeFileAtomically
+from depz.x80_rescanRelink import MemoScanner, ScanResult
+
+LOCK_FILENAME = "depz.lock"
+_LOCK_VERSION = 2
+
+
+def contentHash(file: Path) -> Optional[str]:
+	"""Returns the sha256 of the file content or None if there is no file.
+	Unlike the mtime or the inode, the hash survives a fresh checkout."""
+	try:
+		data = file.read_bytes()
+	except FileNotFoundError:
+		return None
+	return hashlib.sha256(data).hexdigest()
+
+
+class Lock:
+	"""The resolved state of the project, stored in depz.lock.
+
+	Allows to relink the project without traversing the dependency graph.
+	The content hashes of the manifests the lock was derived from tell
+	whether the lock is still up to date. Note that a manifest created after
+	locking (for example, lib/depz.txt of a library) is not noticed.
+	"""
+
+	def __init__(self, mode: Mode,
+				 libraries: List[Path],
+				 manifests: Dict[Path, Optional[str]],
+				 mapping: Dict[Path, Path],
+				 externalLibs: Dict[str, Set[str]]):
+		self.mode = mode
+		self.libraries = libraries
+		self.manifests = manifests
+		self.mapping = mapping
+		self.externalLibs = externalLibs
+
+	@staticmethod
+	def fromScan(result: ScanResult, scanner: MemoScanner, mode: Mode) -> 'Lock':
+		manifests = [manifest for dirScan in scanner.scans.values()
+					 for manifest, _ in dirScan]
+		return Lock(mode=mode,
+					libraries=sorted(result.localLibs),
+					manifests={m: contentHash(m) for m in sorted(manifests)},
+					mapping={src.absolute(): dst.absolute() for src, dst in result.mapping.items()},
+					externalLibs=result.externalLibs)
+
+	def changedManifests(self) -> List[Path]:
+		"""Returns the manifests that were changed or removed after locking."""
+		return [m for m, digest in self.manifests.items() if contentHash(m) != digest]
+
+	def save(self, file: Path):
+		data = {
+			"version": _LOCK_VERSION,
+			"mode": self.mode.name,
+			"libraries": [str(p) for p in self.libraries],
+			"manifests": {str(m): digest for m, digest in self.manifests.items()},
+			"mapping": [[str(src), str(self.mapping[src])] for src in sorted(self.mapping)],
+			"externals": {name: sorted(libs) for name, libs in self.externalLibs.items()},
+		}
+		writeFileAtomically(str(file), (json.dumps(data, indent=2) + "\n").encode())
+
+	@staticmethod
+	def load(file: Path) -> 'Lock':
+		data = json.loads(file.read_text())
+		if data.get("version") != _LOCK_VERSION:
+			raise ValueError(f"Unsupported lock file version in {file}. "
+							 f"Run depz --lock to update it.")
+		return Lock(mode=Mode[data["mode"]],
+					libraries=[Path(p) for p in data["libraries"]],
+					manifests={Path(m): digest for m, digest in data["manifests"].items()},
+					mapping={Path(src): Path(dst) for src, dst in data["mapping"]},
+					externalLibs={name: set(libs) for name, libs in data["externals"].items()})
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+from unittest import mock
+
+from depz import runmain
+from depz.x01_testsBase import TestWithTempDir
+from depz.x82_lock import Lock
+from depz.x99_run_test import CapturedOutput
+
+
+class TestLock(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		(self.project / "depz.txt").write_text("../libs/lib1\nnumpy\n")
+		self.lib1 = self.mkd(self.tempDir / "libs" / "lib1")
+		(self.lib1 / "depz.txt").write_text("../lib2\nrequests\n")
+		self.lib2 = self.mkd(self.tempDir / "libs" / "lib2")
+		with CapturedOutput():
+			runmain(["--project", str(self.project), "--lock", "--no-cache"])
+
+	def test_lock_content(self):
+		lock = Lock.load(self.project / "depz.lock")
+		self.assertEqual([p.name for p in lock.libraries], ["lib1", "lib2"])
+		self.assertEqual(len(lock.manifests), 2)
+		self.assertEqual(sorted(dst.name for dst in lock.mapping.values()), ["lib1", "lib2"])
+		self.assertEqual(lock.externalLibs, {"numpy": {"project"}, "requests": {"lib1"}})
+		self.assertEqual(lock.changedManifests(), [])
+
+	def test_relink_from_lock_without_scanning(self):
+		with mock.patch("depz.x80_rescanRelink.buildGraph", side_effect=AssertionError):
+			with CapturedOutput() as output:
+				runmain(["--project", str(self.project), "--relink", "--from-lock", "-e", "line"])
+		self.assertEqual(output.std.strip(), "numpy requests")
+		self.assertTrue((self.project / "lib2").resolve().samefile(self.lib2))
+
+	def test_frozen(self):
+		with CapturedOutput():
+			runmain(["--project", str(self.project), "--relink", "--frozen"])
+		self.assertTrue((self.project / "lib1").is_symlink())
+
+		(self.lib1 / "depz.txt").write_text("../lib2\nrequests\nflask\n")
+		with CapturedOutput() as output:
+			with self.assertRaises(SystemExit) as cm:
+				runmain(["--project", str(self.project), "--relink", "--frozen"])
+		self.assertNotEqual(cm.exception.code, 0)
+		self.assertTrue(str(self.lib1 / "depz.txt") in output.err)
+
+	def test_frozen_ignores_rewrite_with_same_content(self):
+		# like a fresh checkout: new mtime and inode, the same bytes
+		manifest = self.lib1 / "depz.txt"
+		content = manifest.read_bytes()
+		manifest.unlink()
+		manifest.write_bytes(content)
+		os.utime(str(manifest), ns=(1, 1))
+		with CapturedOutput():
+			runmain(["--project", str(self.project), "--relink", "--frozen"])
+		self.assertTrue((self.project / "lib1").is_symlink())
+
+	def test_mode_mismatch(self):
+		with self.assertRaises(ValueError):
+			with CapturedOutput():
+				runmain(["--project", str(self.project), "--from-lock", "--mode", "layout"])
@@ -0,0 +1,298 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode, printVerbose
+from depz.x55_scanCache import statSignature
+from depz.x60_relink import LinksDiff
+from depz.x80_rescanRelink import MemoScanner, traverse, computeMapping, relinkProject, \
+	LayoutFilter, projectLayoutFilter
+
+# (watched dir, entry name or None if unknown, whether the entry is a dir)
+Event = Tuple[Path, Optional[str], bool]
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+			   | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollingWatcher:
+	"""Detects changes by comparing stat signatures of the watched dirs
+	and files. Works everywhere, but only notices changes once per interval."""
+
+	def __init__(self, interval: float = 0.5):
+		self.interval = interval
+		self._dirs: Set[Path] = set()
+		self._files: Set[Path] = set()
+		self._snapshot: Dict[Path, Any] = dict()
+
+	def setWatches(self, dirs: Iterable[Path], files: Iterable[Path] = ()):
+		self._dirs = set(dirs)
+		self._files = set(files)
+		self._snapshot = self._takeSnapshot()
+
+	def _takeSnapshot(self) -> Dict[Path, Any]:
+		return {p: statSignature(p) for p in self._dirs | self._files}
+
+	def read(self, timeout: Optional[float] = None) -> List[Event]:
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			snapshot = self._takeSnapshot()
+			changed = [p for p, sig in snapshot.items() if self._snapshot.get(p) != sig]
+			self._snapshot = snapshot
+			if changed:
+				return [(p, None, True) if p in self._dirs else (p.parent, p.name, False)
+						for p in changed]
+			if deadline is not None:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					return []
+				time.sleep(min(self.interval, remaining))
+			else:
+				time.sleep(self.interval)
+
+	def close(self):
+		pass
+
+
+class InotifyWatcher:
+	"""Watches dirs with Linux inotify. The files are covered by the watches
+	of their parent dirs."""
+
+	def __init__(self):
+		import ctypes
+		import ctypes.util
+		self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+		if self._fd < 0:
+			errno = ctypes.get_errno()
+			raise OSError(errno, os.strerror(errno))
+		# several paths may lead to the same inode and thus the same watch descriptor
+		self._pathsByWd: Dict[int, Set[Path]] = dict()
+		self._wdByPath: Dict[Path, int] = dict()
+
+	@staticmethod
+	def isSupported() -> bool:
+		if not sys.platform.startswith("linux"):
+			return False
+		try:
+			InotifyWatcher().close()
+		except (OSError, AttributeError):
+			return False
+		return True
+
+	def setWatches(self, dirs: Iterable[Path], files: Iterable[Path] = ()):
+		dirs = set(dirs)
+		for path in list(self._wdByPath):
+			if path not in dirs:
+				self._unwatch(path)
+		for path in dirs:
+			if path not in self._wdByPath:
+				wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), _WATCH_MASK)
+				if wd < 0:
+					continue  # the dir disappeared meanwhile
+				self._wdByPath[path] = wd
+				self._pathsByWd.setdefault(wd, set()).add(path)
+
+	def _unwatch(self, path: Path):
+		wd = self._wdByPath.pop(path)
+		paths = self._pathsByWd.get(wd, set())
+		paths.discard(path)
+		if not paths:
+			self._pathsByWd.pop(wd, None)
+			self._libc.inotify_rm_watch(self._fd, wd)
+
+	def read(self, timeout: Optional[float] = None) -> List[Event]:
+		ready, _, _ = select.select([self._fd], [], [], timeout)
+		if not ready:
+			return []
+		try:
+			data = os.read(self._fd, 65536)
+		except BlockingIOError:
+			return []
+
+		events: List[Event] = list()
+		offset = 0
+		while offset < len(data):
+			wd, mask, _, nameLen = _EVENT_HEADER.unpack_from(data, offset)
+			offset += _EVENT_HEADER.size
+			name = os.fsdecode(data[offset:offset + nameLen].rstrip(b"\0")) or None
+			offset += nameLen
+
+			if mask & _IN_Q_OVERFLOW:
+				# some events are lost: reporting everything as changed
+				return [(path, None, True) for path in self._wdByPath]
+
+			paths = self._pathsByWd.get(wd, set())
+			if mask & _IN_IGNORED:
+				# the watched dir was removed
+				self._pathsByWd.pop(wd, None)
+				for path in paths:
+					self._wdByPath.pop(path, None)
+			for path in paths:
+				events.append((path, name, bool(mask & _IN_ISDIR) or name is None))
+		return events
+
+	def close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+			self._fd = -1
+
+
+def createWatcher() -> Union[InotifyWatcher, PollingWatcher]:
+	"""Returns the inotify watcher on Linux and the polling one elsewhere."""
+	if InotifyWatcher.isSupported():
+		return InotifyWatcher()
+	return PollingWatcher()
+
+
+def _looksLikePath(line: str) -> bool:
+	return "/" in line or os.sep in line or line.startswith(("~", ".", "$"))
+
+
+def _nearestExistingDir(path: str) -> Optional[Path]:
+	while True:
+		if os.path.isdir(path):
+			return Path(path)
+		parent = os.path.dirname(path)
+		if parent == path:
+			return None
+		path = parent
+
+
+class ProjectWatcher:
+	"""Keeps the project symlinks up to date while the manifests change.
+
+	Watches the dirs of all the libraries visited by the traversal (and their
+	"lib" subdirs), where the manifests live, and the nearest existing parents
+	of the local paths that could not be resolved. After a change only the
+	affected dirs are scanned again, and only the differing links are changed.
+	"""
+
+	def __init__(self, projectDir: Path, mode: Mode, scanner: MemoScanner,
+				 watcher=None, debounce: float = 0.3,
+				 layoutFilter: Optional[LayoutFilter] = None):
+		self.projectDir = projectDir.absolute()
+		self.mode = mode
+		self.layoutFilter = layoutFilter
+		self.scanner = scanner
+		self.watcher = watcher if watcher is not None else createWatcher()
+		self.debounce = debounce
+		# watched dir -> library dirs to rescan when it changes
+		self._owners: Dict[Path, Set[Path]] = dict()
+		# watched dirs where any change matters (parents of unresolved paths)
+		self._anyChange: Set[Path] = set()
+
+	def refresh(self) -> Tuple[Dict[str, Set[str]], Dict[Path, Path]]:
+		"""Traverses the graph, rescanning only the invalidated dirs. The
+		caller applies the mapping and then calls updateWatches, so the
+		changes of the links are not taken for the changes of the graph.
+
+		:return: The external dependencies and the mapping.
+		"""
+		localLibs, externalLibs = traverse(self.projectDir, self.scanner)
+		self.scanner.retain(localLibs | {self.projectDir})
+		mapping = computeMapping(localLibs, self.projectDir, self.mode, self.scanner.listings,
+								 projectLayoutFilter(self.projectDir, self.mode, self.scanner,
+													 self.layoutFilter))
+		return externalLibs, mapping
+
+	def sync(self) -> Tuple[Dict[str, Set[str]], LinksDiff]:
+		"""Traverses the graph (rescanning only the invalidated dirs),
+		relinks the project and updates the watches."""
+		externalLibs, mapping = self.refresh()
+		diff = relinkProject(self.projectDir, mapping, self.mode)
+		self.updateWatches()
+		return externalLibs, diff
+
+	def updateWatches(self):
+		owners: Dict[Path, Set[Path]] = dict()
+		anyChange: Set[Path] = set()
+		files: List[Path] = list()
+		for libDir, dirScan in self.scanner.scans.items():
+			owners.setdefault(libDir, set()).add(libDir)
+			owners.setdefault(libDir / "lib", set()).add(libDir)
+			for manifest, entries in dirScan:
+				files.append(manifest)
+				for line, target in entries:
+					if target is None and _looksLikePath(line):
+						expanded = os.path.normpath(os.path.expandvars(os.path.expanduser(line)))
+						parent = _nearestExistingDir(
+							os.path.dirname(os.path.join(str(manifest.parent), expanded)))
+						if parent is not None:
+							owners.setdefault(parent, set()).add(libDir)
+							anyChange.add(parent)
+		self._owners = {d: o for d, o in owners.items() if d.is_dir()}
+		self._anyChange = anyChange
+		self.watcher.setWatches(self._owners, files)
+
+	def _isRelevant(self, event: Event) -> bool:
+		watched, name, isDir = event
+		if name is None or watched in self._anyChange:
+			return True
+		if name in self.scanner.manifestNames or name == "lib":
+			return True
+		# in the layout mode new or removed subdirs change the mapping
+		return isDir and self.mode == Mode.layout and watched.name != "lib"
+
+	def waitForChanges(self, timeout: Optional[float] = None) -> bool:
+		"""Waits for the changes of the watched dirs, then for a quiet period
+		of the debounce interval. Invalidates the affected dirs.
+
+		:return: True, if the graph needs to be traversed again.
+		"""
+		events = self.watcher.read(timeout)
+		if not events:
+			return False
+		while True:
+			more = self.watcher.read(self.debounce)
+			if not more:
+				break
+			events.extend(more)
+
+		affected: Set[Path] = set()
+		for event in events:
+			if self._isRelevant(event):
+				affected.update(self._owners.get(event[0], ()))
+		if affected:
+			for d in sorted(affected):
+				printVerbose(f"Changed: {d}")
+			self.scanner.invalidate(affected)
+		return bool(affected)
+
+	def run(self, onSync: Callable[[Dict[str, Set[str]]], None]):
+		"""Relinks the project each time the graph changes, until interrupted."""
+		try:
+			while True:
+				externalLibs, _ = self.sync()
+				onSync(externalLibs)
+				while not self.waitForChanges():
+					pass
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self.watcher.close()
@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+
+from depz.x00_common import Mode, printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x80_rescanRelink import MemoScanner
+from depz.x85_watch import ProjectWatcher, PollingWatcher, InotifyWatcher
+
+
+class WatchTests:
+
+	def createWatcher(self):
+		raise NotImplementedError
+
+	def setUp(self):
+		super().setUp()
+		printVerbose.allowed = False
+		self.project = self.mkd(self.tempDir / "project")
+		self.libA = self.mkd(self.tempDir / "libA")
+		self.libB = self.mkd(self.tempDir / "libB")
+		(self.project / "depz.txt").write_text("../libA\n../libC\n")
+		(self.libA / "depz.txt").write_text("numpy\n")
+		self.scanner = MemoScanner()
+		self.pw = ProjectWatcher(self.project, Mode.default, self.scanner,
+								 watcher=self.createWatcher(), debounce=0.05)
+		externals, diff = self.pw.sync()
+		self.assertEqual(list(externals), ["../libC", "numpy"])
+		self.assertEqual(len(diff.added), 1)
+
+	def tearDown(self):
+		self.pw.watcher.close()
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def test_manifest_changed(self):
+		projectScan = self.scanner.scans[self.project.absolute()]
+		(self.libA / "depz.txt").write_text("../libB\nnumpy\n")
+		self.assertTrue(self.pw.waitForChanges(timeout=5))
+		externals, diff = self.pw.sync()
+		self.assertEqual([link.name for link, _ in diff.added], ["libB"])
+		self.assertEqual(len(diff.unchanged), 1)
+		# the project manifest was not scanned again
+		self.assertIs(self.scanner.scans[self.project.absolute()], projectScan)
+
+	def test_unresolved_dir_created(self):
+		self.mkd(self.tempDir / "libC")
+		self.assertTrue(self.pw.waitForChanges(timeout=5))
+		externals, diff = self.pw.sync()
+		self.assertEqual([link.name for link, _ in diff.added], ["libC"])
+		self.assertEqual(list(externals), ["numpy"])
+
+	def test_no_changes(self):
+		self.assertFalse(self.pw.waitForChanges(timeout=0.2))
+
+
+class TestPollingWatch(WatchTests, TestWithTempDir):
+
+	def createWatcher(self):
+		return PollingWatcher(interval=0.02)
+
+
+@unittest.skipUnless(InotifyWatcher.isSupported(), "inotify is not available")
+class TestInotifyWatch(WatchTests, TestWithTempDir):
+
+	def createWatcher(self):
+		return InotifyWatcher()
+
+	def test_unrelated_file_ignored(self):
+		(self.libA / "code.py").write_text("pass")
+		self.assertFalse(self.pw.waitForChanges(timeout=0.2))
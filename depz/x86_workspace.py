@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode, printVerbose
+from depz.x60_relink import LinksDiff
+from depz.x80_rescanRelink import MemoScanner, traverse, computeMapping, relinkProject, \
+	pydpnFiles, LayoutFilter, projectLayoutFilter
+
+
+class ProjectResult:
+	"""The outcome of processing a single project of the workspace."""
+
+	def __init__(self, projectDir: Path, externalLibs: Dict[str, Set[str]],
+				 mapping: Dict[Path, Path]):
+		self.projectDir = projectDir
+		self.externalLibs = externalLibs
+		self.mapping = mapping
+		self.linksSummary: Optional[str] = None
+		self.error: Optional[str] = None
+
+
+def findProjects(paths: Iterable[Path], scanner: MemoScanner) -> List[Path]:
+	"""Returns the project dirs of the workspace.
+
+	A path that has its own manifest is a project. Otherwise each of its
+	immediate subdirs that has a manifest is a candidate, and the candidates
+	that are local dependencies of other candidates are libraries rather
+	than projects.
+	"""
+	explicit: List[Path] = list()
+	candidates: List[Path] = list()
+	for path in paths:
+		path = path.absolute()
+		if not path.is_dir():
+			raise FileNotFoundError(f"Directory {path} does not exist.")
+		if any(True for _ in pydpnFiles(path, scanner.listings, scanner.manifestNames)):
+			explicit.append(path)
+			continue
+		for name in sorted(scanner.listings.subdirs(path)):
+			sub = path / name
+			if any(True for _ in pydpnFiles(sub, scanner.listings, scanner.manifestNames)):
+				candidates.append(sub)
+
+	dependencies: Set[Path] = set()
+	for candidate in candidates:
+		for _, entries in scanner.scanDir(candidate):
+			dependencies.update(target for _, target in entries if target is not None)
+
+	result = explicit + [c for c in candidates if c.resolve() not in dependencies]
+	return list(dict.fromkeys(result))
+
+
+def workspaceStateDir(paths: List[Path]) -> Path:
+	"""The dir where the workspace commands keep their caches: the first
+	workspace path. The common parent of the paths is not used, as it may
+	be a dir shared with others, like the home dir or the root."""
+	return paths[0].absolute()
+
+
+def _relinkInWorker(projectDir: Path, mapping: Dict[Path, Path], mode: Mode) -> str:
+	# runs in a child process: the output would be interleaved, so it is muted
+	printVerbose.allowed = False
+	return relinkProject(projectDir, mapping, mode).summary()
+
+
+def processWorkspace(projects: List[Path], scanner: MemoScanner, mode: Mode,
+					 relink: bool, jobs: int = 1,
+					 layoutFilter: Optional[LayoutFilter] = None) -> List[ProjectResult]:
+	"""Computes the closures of all the projects from one shared graph
+	and optionally relinks them.
+
+	Each manifest of the shared libraries is read and resolved only once,
+	no matter how many projects depend on it. With jobs > 1 the projects
+	are relinked by a pool of processes.
+	"""
+	results: List[ProjectResult] = list()
+	for projectDir in projects:
+		localLibs, externalLibs = traverse(projectDir, scanner)
+		mapping = computeMapping(localLibs, projectDir, mode, scanner.listings,
+								 projectLayoutFilter(projectDir, mode, scanner, layoutFilter))
+		results.append(ProjectResult(projectDir, externalLibs, mapping))
+
+	if not relink:
+		return results
+
+	if jobs > 1 and len(results) > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			futures = [executor.submit(_relinkInWorker, r.projectDir, r.mapping, mode)
+					   for r in results]
+			for r, future in zip(results, futures):
+				try:
+					r.linksSummary = future.result()
+				except OSError as e:
+					r.error = str(e)
+	else:
+		# muted like the workers: the caller reports the summaries in the order
+		# of the projects, and the relink would print each summary again
+		allowed, log = printVerbose.allowed, printVerbose.log
+		printVerbose.allowed, printVerbose.log = False, None
+		try:
+			for r in results:
+				try:
+					diff: LinksDiff = relinkProject(r.projectDir, r.mapping, mode)
+					r.linksSummary = diff.summary()
+				except OSError as e:
+					r.error = str(e)
+		finally:
+			printVerbose.allowed, printVerbose.log = allowed, log
+
+	return results
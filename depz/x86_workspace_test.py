@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from unittest import mock
+
+from depz import x80_rescanRelink
+from depz.x00_common import Mode, printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x80_rescanRelink import MemoScanner
+from depz.x86_workspace import findProjects, processWorkspace
+from depz.x99_run_test import CapturedOutput
+from depz import runmain
+
+
+class TestWorkspace(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		printVerbose.allowed = False
+		self.root = self.mkd(self.tempDir / "ws")
+		self.shared = self.mkd(self.root / "shared")
+		(self.shared / "depz.txt").write_text("../base\nnumpy\n")
+		self.mkd(self.root / "base")
+		for name in ["p1", "p2", "p3"]:
+			(self.mkd(self.root / name) / "depz.txt").write_text(f"../shared\n{name}_ext\n")
+		self.mkd(self.root / "not_a_project")
+
+	def tearDown(self):
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def test_find_projects(self):
+		projects = findProjects([self.root], MemoScanner())
+		self.assertEqual([p.name for p in projects], ["p1", "p2", "p3"])
+
+	def test_explicit_projects(self):
+		projects = findProjects([self.root / "p2", self.root / "shared"], MemoScanner())
+		self.assertEqual([p.name for p in projects], ["p2", "shared"])
+
+	def test_shared_manifests_read_once(self):
+		scanner = MemoScanner()
+		with mock.patch.object(x80_rescanRelink, "iterLnkdpnLines",
+							   wraps=x80_rescanRelink.iterLnkdpnLines) as reader:
+			results = processWorkspace(findProjects([self.root], scanner), scanner,
+									   Mode.default, relink=False)
+		self.assertEqual(reader.call_count, 4)  # p1, p2, p3 and shared
+		self.assertEqual(list(results[1].externalLibs), ["p2_ext", "numpy"])
+		self.assertEqual(sorted(dst.name for dst in results[1].mapping.values()),
+						 ["base", "shared"])
+
+	def test_relink_with_process_pool(self):
+		scanner = MemoScanner()
+		results = processWorkspace(findProjects([self.root], scanner), scanner,
+								   Mode.default, relink=True, jobs=2)
+		for r in results:
+			self.assertIsNone(r.error)
+			self.assertTrue(r.linksSummary.startswith("Symlinks: 2 created"))
+			self.assertTrue((r.projectDir / "base").is_symlink())
+
+	def test_cli(self):
+		with CapturedOutput() as output:
+			runmain(["--workspace", str(self.root), "-e", "line", "--relink"])
+		self.assertEqual(output.std.splitlines(),
+						 [f"{self.root / name}: {name}_ext numpy" for name in ["p1", "p2", "p3"]])
+		self.assertTrue((self.root / "p3" / "shared").is_symlink())
+
+	def test_summary_printed_once(self):
+		printVerbose.allowed = True
+		for jobs in ("1", "2"):
+			with CapturedOutput() as output:
+				runmain(["--workspace", str(self.root), "--relink", "--jobs", jobs])
+			self.assertEqual(output.std.count("Symlinks: "), 3)
+			self.assertIn(f"Project dir: {self.root / 'p1'}\n  Symlinks: ", output.std)
+
+	def test_cache_in_first_path(self):
+		# the common parent of the paths may be shared with others
+		runmain(["--workspace", str(self.root / "p2"), str(self.root / "p1"), "-e", "line"])
+		self.assertTrue((self.root / "p2" / ".depz-cache").exists())
+		self.assertFalse((self.root / ".depz-cache").exists())
+
+	def test_failed_project_does_not_stop_others(self):
+		self.mkd(self.root / "p1" / "base")  # a real dir where the link must be
+		for jobs in (1, 2):
+			scanner = MemoScanner()
+			results = processWorkspace(findProjects([self.root], scanner), scanner,
+									   Mode.default, relink=True, jobs=jobs)
+			self.assertIn("1 of the symlink changes failed", results[0].error)
+			self.assertTrue((results[0].projectDir / "shared").is_symlink())
+			for r in results[1:]:
+				self.assertIsNone(r.error)
+				self.assertTrue((r.projectDir / "base").is_symlink())
+
+		with CapturedOutput() as output:
+			with self.assertRaises(SystemExit):
+				runmain(["--workspace", str(self.root), "--relink"])
+		self.assertIn(f"Failed to relink {self.root / 'p1'}", output.err)
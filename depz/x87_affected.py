@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import marshal
+import os
+from pathlib import Path
+from typing import *
+
+from depz.x05_stats import stats
+from depz.x10_fs import writeFileAtomically
+from depz.x20_listings import DirListings
+from depz.x55_scanCache import ScanCache, statSignature, CACHE_FILENAME
+from depz.x80_rescanRelink import MemoScanner, buildGraph, pydpnFiles, MANIFEST_NAMES
+from depz.x86_workspace import findProjects, workspaceStateDir
+
+INDEX_FILENAME = ".depz-affected"
+_INDEX_VERSION = 1
+
+
+class ReverseIndex:
+	"""Maps each dir of a workspace graph to the projects that depend on it.
+
+	The projects are stored once, and each dir keeps the ids of its projects,
+	so a query is one dict lookup per asked path. A project depends on
+	itself: a change in the project dir affects the project too.
+
+	The index is valid as long as the manifests it was built from are
+	unchanged and the workspace contains the same candidate projects. Just
+	like with depz.lock, a manifest created after indexing (for example,
+	lib/depz.txt of a library) is not noticed.
+	"""
+
+	def __init__(self, workspace: List[str], projects: List[str],
+				 dependents: Dict[str, List[int]],
+				 signatures: Dict[str, Optional[Tuple[int, int, int]]]):
+		self.workspace = workspace
+		self.projects = projects
+		self.dependents = dependents
+		self.signatures = signatures
+
+	@staticmethod
+	def build(paths: List[Path], scanner: MemoScanner) -> 'ReverseIndex':
+		projectDirs = findProjects(paths, scanner)
+		dependents: Dict[str, List[int]] = dict()
+		with stats.phase("index"):
+			for projectId, projectDir in enumerate(projectDirs):
+				graph = buildGraph(projectDir, scanner)
+				nodes = [os.path.realpath(str(projectDir))]
+				nodes += [str(graph.dirOf(nodeId)) for nodeId in range(1, graph.nodesCount)]
+				for node in nodes:
+					dependents.setdefault(node, list()).append(projectId)
+
+		manifests = sorted(str(manifest) for dirScan in scanner.scans.values()
+						   for manifest, _ in dirScan)
+		return ReverseIndex(workspace=workspaceCandidates(paths, scanner.manifestNames,
+														  scanner.listings),
+							projects=[str(p) for p in projectDirs],
+							dependents=dependents,
+							signatures={m: statSignature(Path(m)) for m in manifests})
+
+	def isUpToDate(self, paths: List[Path], manifestNames: Iterable[str]) -> bool:
+		return self.workspace == workspaceCandidates(paths, manifestNames) \
+			   and all(statSignature(Path(m)) == sig for m, sig in self.signatures.items())
+
+	def affected(self, changed: Iterable[Path]) -> List[Path]:
+		"""Returns the projects whose dependency closure includes any of the
+		changed dirs or files. A path inside a library dir counts as a change
+		of the library."""
+		result: Set[int] = set()
+		for path in changed:
+			current = os.path.realpath(str(path))
+			while True:
+				ids = self.dependents.get(current)
+				if ids is not None:
+					result.update(ids)
+					break
+				parent = os.path.dirname(current)
+				if parent == current:
+					break
+				current = parent
+		return [Path(self.projects[i]) for i in sorted(result)]
+
+	def save(self, file: Path):
+		data = {"version": _INDEX_VERSION,
+				"workspace": self.workspace,
+				"projects": self.projects,
+				"dependents": self.dependents,
+				"signatures": self.signatures}
+		try:
+			writeFileAtomically(str(file), marshal.dumps(data))
+		except OSError:
+			# the index is an optimization, just like the scan cache
+			pass
+
+	@staticmethod
+	def load(file: Path) -> Optional['ReverseIndex']:
+		"""Returns the saved index or None if there is no valid one."""
+		stats.count("read")
+		try:
+			data = marshal.loads(file.read_bytes())
+		except (FileNotFoundError, ValueError, EOFError, TypeError):
+			return None
+		if not isinstance(data, dict) or data.get("version") != _INDEX_VERSION:
+			return None
+		return ReverseIndex(data["workspace"], data["projects"], data["dependents"],
+							data["signatures"])
+
+
+def workspaceCandidates(paths: List[Path], manifestNames: Iterable[str],
+						listings: Optional[DirListings] = None) -> List[str]:
+	"""Returns the dirs that findProjects considers: the workspace paths with
+	manifests and the subdirs with manifests of the other paths."""
+	if listings is None:
+		listings = DirListings()
+	result: List[str] = list()
+	for path in paths:
+		if any(True for _ in pydpnFiles(path, listings, manifestNames)):
+			result.append(str(path))
+			continue
+		for name in sorted(listings.subdirs(path)):
+			if any(True for _ in pydpnFiles(path / name, listings, manifestNames)):
+				result.append(str(path / name))
+	return result
+
+
+def affectedProjects(paths: List[Path], changed: List[Path], useCache: bool = True,
+					 manifestNames: Iterable[str] = MANIFEST_NAMES) -> List[Path]:
+	"""Returns the projects of the workspace affected by the changed dirs.
+
+	The index is stored in the first workspace path (see workspaceStateDir)
+	and rebuilt only when it is not up to date.
+	"""
+	paths = [p.absolute() for p in paths]
+	stateDir = workspaceStateDir(paths)
+	indexFile = stateDir / INDEX_FILENAME
+
+	index = ReverseIndex.load(indexFile) if useCache else None
+	if index is not None and not index.isUpToDate(paths, manifestNames):
+		index = None
+	if index is None:
+		cache = ScanCache(stateDir / CACHE_FILENAME) if useCache else None
+		index = ReverseIndex.build(paths, MemoScanner(cache, manifestNames))
+		if useCache:
+			cache.save()
+			index.save(indexFile)
+	return index.affected(changed)
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+from unittest import mock
+
+from depz import runmain
+from depz import x87_affected
+from depz.x00_common import printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x87_affected import affectedProjects, INDEX_FILENAME
+from depz.x99_run_test import CapturedOutput
+
+
+class TestAffected(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		printVerbose.allowed = False
+		# p1 -> shared -> base, p2 -> shared, p3 -> other
+		self.root = self.mkd(self.tempDir / "ws")
+		(self.mkd(self.root / "shared") / "depz.txt").write_text("../base\n")
+		self.mkd(self.root / "base" / "src")
+		self.mkd(self.root / "other")
+		(self.mkd(self.root / "p1") / "depz.txt").write_text("../shared\n")
+		(self.mkd(self.root / "p2") / "depz.txt").write_text("../shared\nnumpy\n")
+		(self.mkd(self.root / "p3") / "depz.txt").write_text("../other\n")
+
+	def tearDown(self):
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def names(self, *changed):
+		return [p.name for p in affectedProjects([self.root], [self.root / c for c in changed])]
+
+	def test_affected(self):
+		self.assertEqual(self.names("base"), ["p1", "p2"])
+		self.assertEqual(self.names("base/src/code.py"), ["p1", "p2"])
+		self.assertEqual(self.names("other", "p1"), ["p1", "p3"])
+		self.assertEqual(self.names("unrelated"), [])
+		self.assertTrue((self.root / INDEX_FILENAME).exists())
+
+	def test_index_in_first_path(self):
+		paths = [self.root / "p3", self.root / "p1"]
+		self.assertEqual([p.name for p in affectedProjects(paths, [self.root / "base"])], ["p1"])
+		self.assertTrue((self.root / "p3" / INDEX_FILENAME).exists())
+		self.assertFalse((self.root / INDEX_FILENAME).exists())
+		self.assertFalse((self.root / ".depz-cache").exists())
+
+	def test_index_reused_and_invalidated(self):
+		self.names("base")
+		with mock.patch.object(x87_affected.ReverseIndex, "build",
+							   wraps=x87_affected.ReverseIndex.build) as build:
+			self.assertEqual(self.names("other"), ["p3"])
+			self.assertEqual(build.call_count, 0)
+			(self.root / "p3" / "depz.txt").write_text("../base\n")
+			self.assertEqual(self.names("other"), [])
+			self.assertEqual(self.names("base"), ["p1", "p2", "p3"])
+			(self.mkd(self.root / "p4") / "depz.txt").write_text("../base\n")
+			self.assertEqual(self.names("base"), ["p1", "p2", "p3", "p4"])
+			self.assertEqual(build.call_count, 2)
+
+	def test_cli(self):
+		with CapturedOutput() as output:
+			runmain(["affected", "-w", str(self.root), str(self.root / "shared")])
+		self.assertEqual(output.std.split(), [str(self.root / "p1"), str(self.root / "p2")])
+
+	def test_cli_rejects_scan_limits(self):
+		with CapturedOutput():
+			with self.assertRaises(SystemExit) as cm:
+				runmain(["affected", "-w", str(self.root), "--depth", "1", str(self.root / "shared")])
+		self.assertEqual(cm.exception.code, 2)
@@ -0,0 +1,286 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""The resident process that keeps the dependency graphs in memory.
+
+The CLI sends its arguments and the current dir to the daemon over a Unix
+socket and prints the output it gets back. The daemon keeps a watched,
+memoized graph for each project it was asked about, so a request only
+rescans the dirs whose manifests changed since the previous one.
+
+The requests the daemon does not handle (workspaces, locks, --watch and
+so on), the bad arguments and the failures are answered with a fallback:
+then the CLI does everything in-process, as if there was no daemon. So are
+the projects with the "~" or "$VAR" lines: the daemon would resolve them
+with its own environment instead of the environment of the CLI.
+
+This module is imported by each CLI run, so the heavy imports are local.
+"""
+
+import os
+import sys
+
+SOCKET_ENV = "DEPZ_SOCKET"
+_MAX_MESSAGE = 64 * 1024 * 1024
+
+
+def socketPath() -> str:
+	"""The socket of the daemon of the current user. May be set by the
+	DEPZ_SOCKET environment variable. Without XDG_RUNTIME_DIR the socket is
+	put into a private dir of the user in /tmp."""
+	path = os.environ.get(SOCKET_ENV)
+	if path:
+		return path
+	runtimeDir = os.environ.get("XDG_RUNTIME_DIR")
+	if runtimeDir:
+		return os.path.join(runtimeDir, f"depz-{os.getuid()}.sock")
+	return os.path.join("/tmp", f"depz-{os.getuid()}", "daemon.sock")
+
+
+def _isOwnSocket(path: str) -> bool:
+	"""Whether the path is a socket created by the current user. Anything
+	else may be planted by another user to answer for the daemon."""
+	import stat
+	try:
+		st = os.lstat(path)
+	except OSError:
+		return False
+	return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def _peerIsOwn(sock) -> bool:
+	"""Whether the process listening on the connected socket runs as the
+	current user. Where the OS does not tell, only the socket file is checked."""
+	import socket
+	import struct
+	if not hasattr(socket, "SO_PEERCRED"):
+		return True
+	creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+	_, uid, _ = struct.unpack("3i", creds)
+	return uid == os.getuid()
+
+
+def _send(sock, data: dict):
+	import json
+	sock.sendall(json.dumps(data).encode() + b"\n")
+
+
+def _receive(sock) -> dict:
+	import json
+	chunks = list()
+	size = 0
+	while True:
+		chunk = sock.recv(65536)
+		if not chunk:
+			break
+		chunks.append(chunk)
+		size += len(chunk)
+		if chunk.endswith(b"\n") or size > _MAX_MESSAGE:
+			break
+	return json.loads(b"".join(chunks).decode())
+
+
+def askDaemon(programArgs: "List[str]") -> bool:
+	"""Lets the running daemon handle the command and prints its output.
+
+	:return: False if there is no daemon or it cannot handle the command.
+	"""
+	if "--no-daemon" in programArgs or not hasattr(os, "getuid"):
+		return False
+	path = socketPath()
+	if not _isOwnSocket(path):
+		return False
+
+	import socket
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(path)
+			if not _peerIsOwn(sock):
+				return False
+			_send(sock, {"args": programArgs, "cwd": os.getcwd()})
+			response = _receive(sock)
+	except (OSError, ValueError):
+		return False
+	if response.get("fallback"):
+		return False
+	sys.stdout.write(response["stdout"])
+	sys.stderr.write(response["stderr"])
+	if response["exit"]:
+		exit(response["exit"])
+	return True
+
+
+class Daemon:
+	"""Answers the requests of the CLI using the warm graphs of the projects."""
+
+	def __init__(self, watcherFactory=None):
+		self._watcherFactory = watcherFactory
+		# (project dir, mode, manifest names) -> ProjectWatcher
+		self._projects: dict = dict()
+
+	def _projectWatcher(self, projectDir, mode, manifestNames):
+		from depz.x80_rescanRelink import MemoScanner
+		from depz.x85_watch import ProjectWatcher, createWatcher
+
+		key = (projectDir, mode, tuple(manifestNames))
+		projectWatcher = self._projects.get(key)
+		if projectWatcher is None:
+			watcher = self._watcherFactory() if self._watcherFactory else createWatcher()
+			projectWatcher = ProjectWatcher(projectDir, mode, MemoScanner(None, manifestNames),
+											watcher=watcher, debounce=0)
+			self._projects[key] = projectWatcher
+		else:
+			# the changes since the previous request
+			projectWatcher.waitForChanges(0)
+		return projectWatcher
+
+	def handle(self, request: dict) -> dict:
+		import io
+		from contextlib import redirect_stdout, redirect_stderr
+		from pathlib import Path
+
+		from depz.x00_common import printVerbose
+		from depz.x55_scanCache import isEnvDependent
+		from depz.x80_rescanRelink import relinkProject, applyMapping, MANIFEST_NAMES
+		from depz.x98_dooo import printExternals, OutputMode
+		from depz.x99_run import parseArgs
+
+		if request.get("command") == "stop":
+			return {"stopped": True}
+
+		stdout = io.StringIO()
+		stderr = io.StringIO()
+		try:
+			with redirect_stdout(stdout), redirect_stderr(stderr):
+				args, mode, outputMode, layoutFilter = parseArgs(request["args"])
+				if (args.workspace or args.watch or args.lock or args.from_lock
+						or args.frozen or args.materialize or args.stats
+						or args.stats_json or args.no_cache
+						or args.depth is not None or args.only
+						or args.externals_out or args.graph_json or args.log
+						or args.check or args.schedule):
+					return {"fallback": True}
+				printVerbose.allowed = outputMode == OutputMode.default
+
+				projectDir = Path(os.path.join(request["cwd"], args.project)).absolute()
+				printVerbose(f"Project dir: {projectDir}")
+				if not projectDir.exists():
+					return {"fallback": True}  # the CLI reports the error itself
+				projectWatcher = self._projectWatcher(projectDir, mode,
+													  args.manifest or MANIFEST_NAMES)
+				projectWatcher.layoutFilter = layoutFilter
+				externalLibs, mapping = projectWatcher.refresh()
+				if any(isEnvDependent(line)
+					   for dirScan in projectWatcher.scanner.scans.values()
+					   for _, entries in dirScan
+					   for line, _ in entries):
+					return {"fallback": True}
+				if args.relink:
+					relinkProject(projectDir, mapping, mode, args.jobs)
+				else:
+					applyMapping(projectDir, mapping, mode, relink=False)
+				projectWatcher.updateWatches()
+				printExternals(externalLibs, outputMode)
+		except BaseException:
+			# including SystemExit of --help and argument errors
+			return {"fallback": True}
+		finally:
+			printVerbose.allowed = True
+		return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "exit": 0}
+
+	def close(self):
+		for projectWatcher in self._projects.values():
+			projectWatcher.watcher.close()
+		self._projects.clear()
+
+
+def serve(path: str, daemon: "Optional[Daemon]" = None, ready=None):
+	"""Answers the requests one by one until the stop request."""
+	import socket
+
+	if daemon is None:
+		daemon = Daemon()
+	parent = os.path.dirname(os.path.abspath(path))
+	if not os.path.exists(parent):
+		os.mkdir(parent, 0o700)
+	if os.lstat(parent).st_uid not in (os.getuid(), 0):
+		# the owner of the dir could replace the socket
+		raise SystemExit(f"{parent} belongs to another user")
+	if os.path.exists(path):
+		# a socket left by a killed daemon, unless another one is running
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+			try:
+				probe.connect(path)
+			except OSError:
+				os.unlink(path)
+			else:
+				raise SystemExit(f"Another daemon is already listening on {path}")
+
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	oldMask = os.umask(0o077)  # only the owner may connect
+	try:
+		server.bind(path)
+	finally:
+		os.umask(oldMask)
+	server.listen(16)
+	if ready is not None:
+		ready()
+	try:
+		while True:
+			conn, _ = server.accept()
+			with conn:
+				try:
+					response = daemon.handle(_receive(conn))
+					_send(conn, response)
+				except (OSError, ValueError):
+					continue
+			if response.get("stopped"):
+				break
+	finally:
+		server.close()
+		daemon.close()
+		try:
+			os.unlink(path)
+		except OSError:
+			pass
+
+
+def stopDaemon(path: str) -> bool:
+	import socket
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(path)
+			_send(sock, {"command": "stop"})
+			_receive(sock)
+	except (OSError, ValueError):
+		return False
+	return True
+
+
+def runDaemon(programArgs: "List[str]"):
+	import argparse
+
+	parser = argparse.ArgumentParser(
+		prog="depz daemon",
+		description="Keeps the dependency graphs in memory and answers the depz commands "
+					"run by the same user. The commands fall back to scanning by "
+					"themselves when the daemon is not running.")
+	parser.add_argument("--socket", type=str, default=None,
+						help=f"The socket path. Defaults to ${SOCKET_ENV} or "
+							 f"$XDG_RUNTIME_DIR/depz-UID.sock or /tmp/depz-UID/daemon.sock")
+	parser.add_argument("--stop", action="store_true",
+						help="Stop the running daemon")
+	args = parser.parse_args(programArgs)
+	path = args.socket or socketPath()
+
+	if args.stop:
+		if not stopDaemon(path):
+			raise SystemExit(f"No daemon is listening on {path}")
+		return
+
+	print(f"Listening on {path}. Press Ctrl+C to stop.")
+	sys.stdout.flush()
+	try:
+		serve(path)
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import io
+import os
+import stat
+import threading
+import unittest
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from depz.x00_common import printVerbose
+from depz.x01_testsBase import TestWithTempDir
+from depz.x85_watch import PollingWatcher
+from depz.x88_daemon import Daemon, serve, stopDaemon, askDaemon, socketPath, SOCKET_ENV
+from depz.x99_run import runmain
+
+
+class TestDaemon(TestWithTempDir):
+
+	def setUp(self):
+		super().setUp()
+		self.project = self.mkd(self.tempDir / "project")
+		self.libA = self.mkd(self.tempDir / "libA")
+		(self.project / "depz.txt").write_text("../libA\nrequests\n")
+		(self.libA / "depz.txt").write_text("numpy\n")
+
+		self.socket = str(self.tempDir / "depz.sock")
+		self._oldSocket = os.environ.get(SOCKET_ENV)
+		os.environ[SOCKET_ENV] = self.socket
+		self.daemon = Daemon(watcherFactory=lambda: PollingWatcher(interval=0.01))
+		ready = threading.Event()
+		self.thread = threading.Thread(target=serve, args=(self.socket, self.daemon, ready.set))
+		self.thread.start()
+		self.assertTrue(ready.wait(5))
+
+	def tearDown(self):
+		stopDaemon(self.socket)
+		self.thread.join(5)
+		if self._oldSocket is None:
+			del os.environ[SOCKET_ENV]
+		else:
+			os.environ[SOCKET_ENV] = self._oldSocket
+		printVerbose.allowed = True
+		super().tearDown()
+
+	def run_depz(self, args) -> str:
+		out = io.StringIO()
+		with redirect_stdout(out):
+			runmain(args)
+		return out.getvalue()
+
+	def test_same_output_as_in_process(self):
+		args = ["-p", str(self.project), "-e", "line"]
+		self.assertTrue(askDaemon(args))
+		self.assertEqual(self.run_depz(args), "requests numpy\n")
+		self.assertEqual(self.run_depz(args + ["--no-daemon"]), "requests numpy\n")
+		self.assertEqual(len(self.daemon._projects), 1)
+
+	def test_env_dependent_lines_fall_back(self):
+		# the daemon would resolve the line with its own environment
+		libB = self.mkd(self.tempDir / "libB")
+		(self.libA / "depz.txt").write_text("numpy\n$DEPZ_TEST_LIB_B\n")
+		args = ["-p", str(self.project), "-e", "line"]
+		with mock.patch.dict(os.environ, {"DEPZ_TEST_LIB_B": str(libB)}):
+			self.assertFalse(askDaemon(args))
+			self.assertEqual(self.run_depz(args), "requests numpy\n")
+			self.assertEqual(self.run_depz(args + ["--no-daemon"]), "requests numpy\n")
+		with mock.patch.dict(os.environ, {"DEPZ_TEST_LIB_B": str(self.tempDir / "missing")}):
+			self.assertEqual(self.run_depz(args), "requests numpy $DEPZ_TEST_LIB_B\n")
+
+	def test_relink_and_changes(self):
+		self.run_depz(["-p", str(self.project), "--relink"])
+		self.assertTrue((self.project / "libA").is_symlink())
+
+		libB = self.mkd(self.tempDir / "libB")
+		(self.libA / "depz.txt").write_text("../libB\nnumpy\nscipy\n")
+		out = self.run_depz(["-p", str(self.project), "--relink", "-e", "multi"])
+		self.assertEqual(out, "requests\nnumpy\nscipy\n")
+		self.assertEqual((self.project / "libB").resolve(), libB.resolve())
+
+	def test_unsupported_falls_back(self):
+		self.assertFalse(askDaemon(["-p", str(self.project), "--no-cache"]))
+		self.assertFalse(askDaemon(["--bad-argument"]))
+		self.assertFalse(askDaemon(["-p", str(self.tempDir / "missing")]))
+		self.assertEqual(len(self.daemon._projects), 0)
+
+	def test_no_daemon_running(self):
+		stopDaemon(self.socket)
+		self.thread.join(5)
+		self.assertFalse(os.path.exists(self.socket))
+		self.assertFalse(askDaemon(["-p", str(self.project)]))
+		self.assertEqual(self.run_depz(["-p", str(self.project), "-e", "line"]),
+						 "requests numpy\n")
+
+	def test_only_own_socket_is_trusted(self):
+		args = ["-p", str(self.project), "-e", "line"]
+		# as seen by another user, the socket and the daemon are not theirs
+		with mock.patch("os.getuid", return_value=os.getuid() + 1):
+			self.assertFalse(askDaemon(args))
+		self.assertEqual(len(self.daemon._projects), 0)
+		self.assertTrue(askDaemon(args))
+
+
+class TestSocketPath(unittest.TestCase):
+
+	def test_private_dir_without_runtime_dir(self):
+		with mock.patch.dict(os.environ, clear=True):
+			self.assertEqual(socketPath(), f"/tmp/depz-{os.getuid()}/daemon.sock")
+		with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/5"}, clear=True):
+			self.assertEqual(socketPath(), f"/run/user/5/depz-{os.getuid()}.sock")
+
+	def test_serve_creates_private_dir(self):
+		with TemporaryDirectory() as td:
+			path = os.path.join(td, "private", "daemon.sock")
+			ready = threading.Event()
+			thread = threading.Thread(target=serve, args=(path, Daemon(), ready.set))
+			thread.start()
+			self.assertTrue(ready.wait(5))
+			stopDaemon(path)
+			thread.join(5)
+			self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
@@ -0,0 +1,65 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import sys
+from pathlib import Path
+from typing import *
+
+from depz.x00_common import Mode
+from depz.x10_fs import writeFileAtomically
+
+
+def formatExternals(externalLibs: Iterable[str], fmt: str) -> str:
+	"""Formats the external dependency names. "multi" is one name per line,
+	"line" is a single space-separated line, "nul" terminates each name with
+	a NUL character, for xargs -0."""
+	names = list(externalLibs)
+	if fmt == "multi":
+		return "".join(name + "\n" for name in names)
+	if fmt == "line":
+		return " ".join(names) + "\n"
+	if fmt == "nul":
+		return "".join(name + "\0" for name in names)
+	raise ValueError(fmt)
+
+
+def graphDict(projectDir: Path, mode: Mode, libraries: Iterable[Path],
+			  mapping: Dict[Path, Path], externalLibs: Dict[str, Set[str]]) -> Dict[str, Any]:
+	"""The result of a run as the JSON-compatible dict. The keys are the same
+	as in depz.lock."""
+	return {
+		"project": str(projectDir.absolute()),
+		"mode": mode.name,
+		"libraries": sorted(str(p.absolute()) for p in libraries),
+		"mapping": [[str(src.absolute()), str(mapping[src].absolute())]
+					for src in sorted(mapping)],
+		"externals": {name: sorted(libs) for name, libs in externalLibs.items()},
+	}
+
+
+def writeOutput(file: str, text: str):
+	"""Writes the text to the file or, if the file is "-", to stdout. The
+	file is replaced at once, so the readers never see it half-written."""
+	if file == "-":
+		sys.stdout.write(text)
+		return
+	writeFileAtomically(file, text.encode())
+
+
+class Outputs:
+	"""The files written by a single run in addition to the stdout output."""
+
+	def __init__(self, externalsFile: Optional[str] = None, externalsFormat: str = "multi",
+				 graphJsonFile: Optional[str] = None):
+		self.externalsFile = externalsFile
+		self.externalsFormat = externalsFormat
+		self.graphJsonFile = graphJsonFile
+
+	def write(self, projectDir: Path, mode: Mode, libraries: Iterable[Path],
+			  mapping: Dict[Path, Path], externalLibs: Dict[str, Set[str]]):
+		if self.externalsFile:
+			writeOutput(self.externalsFile, formatExternals(externalLibs, self.externalsFormat))
+		if self.graphJsonFile:
+			import json
+			data = graphDict(projectDir, mode, libraries, mapping, externalLibs)
+			writeOutput(self.graphJsonFile, json.dumps(data, indent=2) + "\n")
@@ -0,0 +1,27 @@
+# SPDX-FileCopyrightText: (c) 2021 Art Galkin <ortemeo@gmail.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from pathlib import Path
+
+from depz.x00_common import Mode
+from depz.x95_outputs import formatExternals, graphDict
+
+
+class TestOutputs(unittest.TestCase):
+
+	def test_formats(self):
+		names = ["numpy", "my package"]
+		self.assertEqual(formatExternals(names, "multi"), "numpy\nmy package\n")
+		self.assertEqual(formatExternals(names, "line"), "numpy my package\n")
+		self.assertEqual(formatExternals(names, "nul"), "numpy\0my package\0")
+		self.assertEqual(formatExternals([], "multi"), "")
+		with self.assertRaises(ValueError):
+			formatExternals(names, "xml")
+
+	def test_graph_dict(self):
+		data = graphDict(Path("/p"), Mode.layout, [Path("/b"), Path("/a")],
+						 {Path("/a/x"): Path("/p/x/a")}, {"numpy": {"b", "a"}})
+		self.assertEqual(data, {"project": "/p", "mode": "layout", "libraries": ["/a", "/b"],
+								"mapping": [["/a/x", "/p/x/a"]],
+								"externals": {"numpy": ["a", "b"]}})
@@ -1,34 +1,231 @@
+import sys
 from enum import IntEnum, auto
 from pathlib import Path
 
-from depz.x00_common import Mode, printVerbose
-from depz.x80_rescanRelink import rescan
+from depz.x00_common import Mode, CopyMethod, printVerbose
+from depz.x55_scanCache import ScanCache, CACHE_FILENAME
+from depz.x80_rescanRelink import scanProject, applyMapping, checkProject, findLibrary, \
+	Scanner, MemoScanner, ExternalDep, LayoutFilter, MANIFEST_NAMES
 
 
 class OutputMode(IntEnum):
 	default = auto()
 	one_line = auto()
 	multi_line = auto()
+	stream = auto()
+	nul = auto()
 
 
 def doo(projectPath: Path,
 		symlinkLocalDeps: bool = False,
 		mode: Mode = Mode.default,
-		outputMode: OutputMode = OutputMode.default):
+		outputMode: OutputMode = OutputMode.default,
+		useCache: bool = True,
+		jobs: int = 1,
+		manifestNames: "Iterable[str]" = MANIFEST_NAMES,
+		watch: bool = False,
+		writeLock: bool = False,
+		fromLock: bool = False,
+		frozen: bool = False,
+		materialize: "Optional[CopyMethod]" = None,
+		layoutFilter: "Optional[LayoutFilter]" = None,
+		depth: "Optional[int]" = None,
+		only: "Optional[str]" = None,
+		outputs: "Optional[Outputs]" = None,
+		check: bool = False,
+		quick: bool = False,
+		schedule: "Optional[str]" = None):
 	printVerbose(f"Project dir: {projectPath.absolute()}")
 	if not projectPath.exists():
 		raise FileNotFoundError(f"Directory {projectPath} does not exist.")
 
-	externalLibs = rescan(projectPath, relink=symlinkLocalDeps, mode=mode)
+	cache = ScanCache(projectPath.absolute() / CACHE_FILENAME) if useCache else None
 
-	if outputMode == OutputMode.default:
-		if externalLibs:
-			printVerbose(f"External dependencies: {' '.join(externalLibs)}")
+	roots = None
+	if only is not None:
+		libDir = findLibrary(projectPath, only, Scanner(cache, manifestNames), jobs)
+		if libDir is None:
+			raise SystemExit(f"The project does not depend on {only}")
+		printVerbose(f"Only: {libDir}")
+		roots = [libDir]
+
+	if watch:
+		def onSync(externalLibs: "Dict[str, Set[str]]"):
+			if cache is not None:
+				cache.save()
+			printExternals(externalLibs, outputMode)
+			sys.stdout.flush()
+
+		# the optional features are imported only when used, keeping the startup fast
+		from depz.x85_watch import ProjectWatcher
+		printVerbose("Watching for changes. Press Ctrl+C to stop.")
+		ProjectWatcher(projectPath, mode, MemoScanner(cache, manifestNames),
+					   layoutFilter=layoutFilter).run(onSync)
+		return
+
+	if fromLock or frozen or writeLock:
+		from depz.x82_lock import Lock, LOCK_FILENAME
+		lockFile = projectPath / LOCK_FILENAME
+
+	if fromLock or frozen:
+		lock = Lock.load(lockFile)
+		if lock.mode != mode:
+			raise ValueError(f"{lockFile} was created for the {lock.mode.name} mode")
+		if frozen:
+			changed = lock.changedManifests()
+			if changed:
+				for manifest in changed:
+					print(f"Changed after locking: {manifest}", file=sys.stderr)
+				raise SystemExit(f"{lockFile} is outdated. Run depz --lock to update it.")
+		printVerbose(f"Using {lockFile}")
+		if not check:
+			applyMapping(projectPath, lock.mapping, mode, relink=symlinkLocalDeps,
+						 materialize=materialize, jobs=jobs)
+		if outputs is not None:
+			outputs.write(projectPath, mode, lock.libraries, lock.mapping, lock.externalLibs)
+		printExternals(lock.externalLibs, outputMode)
+		if check:
+			reportCheck(checkProject(projectPath, lock.mapping, mode, quick))
+		return
+
+	observer = None
+	if outputMode == OutputMode.stream:
+		observer = ExternalsStreamer()
+
+	scanner = MemoScanner(cache, manifestNames) if writeLock else Scanner(cache, manifestNames)
+	result = scanProject(projectPath, relink=symlinkLocalDeps, mode=mode,
+						 scanner=scanner, jobs=jobs, observer=observer,
+						 materialize=materialize, layoutFilter=layoutFilter,
+						 roots=roots, maxDepth=depth, apply=not (check or schedule))
+	if writeLock:
+		Lock.fromScan(result, scanner, mode).save(lockFile)
+		printVerbose(f"Saved {lockFile}")
+
+	# the cache is read, but the read-only runs leave the project dir as it was
+	if cache is not None and not (check or schedule):
+		cache.save()
+
+	if outputs is not None:
+		outputs.write(projectPath, mode, result.localLibs, result.mapping, result.externalLibs)
+
+	if schedule is not None:
+		from depz.x75_schedule import buildSchedule
+		printSchedule(buildSchedule(result.graph), schedule)
+		return
+
+	if observer is None:  # otherwise already printed
+		printExternals(result.externalLibs, outputMode)
+
+	if check:
+		reportCheck(checkProject(projectPath, result.mapping, mode, quick,
+								 partial=roots is not None or depth is not None))
+
+
+class ExternalsStreamer:
+	"""Prints the names of external dependencies as soon as the traversal
+	finds them, each name once."""
+
+	def __init__(self):
+		self._printed: "Set[str]" = set()
+
+	def __call__(self, event: "GraphEvent"):
+		if isinstance(event, ExternalDep) and event.name not in self._printed:
+			self._printed.add(event.name)
+			print(event.name, flush=True)
+
+
+def dooWorkspace(paths: "List[Path]",
+				 symlinkLocalDeps: bool = False,
+				 mode: Mode = Mode.default,
+				 outputMode: OutputMode = OutputMode.default,
+				 useCache: bool = True,
+				 jobs: int = 1,
+				 manifestNames: "Iterable[str]" = MANIFEST_NAMES,
+				 layoutFilter: "Optional[LayoutFilter]" = None):
+	"""Processes all the projects of the workspace in a single run, scanning
+	each shared library once."""
+	from depz.x86_workspace import findProjects, processWorkspace, workspaceStateDir
+	paths = [p.absolute() for p in paths]
+	cache = ScanCache(workspaceStateDir(paths) / CACHE_FILENAME) if useCache else None
+	scanner = MemoScanner(cache, manifestNames)
+
+	projects = findProjects(paths, scanner)
+	printVerbose(f"Workspace projects: {len(projects)}")
+
+	results = processWorkspace(projects, scanner, mode, relink=symlinkLocalDeps, jobs=jobs,
+							   layoutFilter=layoutFilter)
+
+	if cache is not None:
+		cache.save()
+
+	for r in results:
+		if outputMode == OutputMode.one_line:
+			print(f"{r.projectDir}: {' '.join(r.externalLibs)}")
+		elif outputMode in (OutputMode.multi_line, OutputMode.stream):
+			print(f"{r.projectDir}:")
+			for name in r.externalLibs:
+				print(f"  {name}")
 		else:
-			printVerbose("No external dependencies.")
-	elif outputMode == OutputMode.one_line:
+			printVerbose(f"Project dir: {r.projectDir}")
+			if r.linksSummary is not None:
+				printVerbose(f"  {r.linksSummary}")
+			printExternals(r.externalLibs, outputMode)
+
+	failed = [r for r in results if r.error is not None]
+	for r in failed:
+		print(f"Failed to relink {r.projectDir}: {r.error}", file=sys.stderr)
+	if failed:
+		raise SystemExit(1)
+
+
+def reportCheck(check: "LinksCheck"):
+	"""Prints the result of checkProject. Exits with an error if the links
+	differ from the mapping."""
+	if check.ok:
+		printVerbose("Symlinks: all up to date")
+		return
+	for line in check.lines():
+		print(line, file=sys.stderr)
+	sys.stderr.flush()
+	raise SystemExit("The symlinks do not match the dependencies. "
+					 "Run depz --relink to update them.")
+
+
+def printSchedule(schedule: "Schedule", fmt: str):
+	"""Prints the schedule in the "text" or "json" format to stdout and the
+	cycles to stderr. Exits with an error if there are cycles."""
+	if fmt == "json":
+		import json
+		print(json.dumps(schedule.toDict(), indent=2))
+	else:
+		for line in schedule.lines():
+			print(line)
+	if schedule.cycles:
+		sys.stdout.flush()
+		for cycle in schedule.cycles:
+			for line in cycle.lines():
+				print(line, file=sys.stderr)
+		sys.stderr.flush()
+		raise SystemExit("The local dependencies have cycles. "
+						 "The libraries of each cycle are put in the same level.")
+
+
+def printExternals(externalLibs: "Dict[str, Set[str]]", outputMode: OutputMode):
+	if externalLibs:
+		summary = f"External dependencies: {' '.join(externalLibs)}"
+	else:
+		summary = "No external dependencies."
+	if outputMode == OutputMode.default:
+		printVerbose(summary)
+		return
+	if printVerbose.log is not None:
+		print(summary, file=printVerbose.log)
+	if outputMode == OutputMode.one_line:
 		print(" ".join(externalLibs))
-	elif outputMode == OutputMode.multi_line:
+	elif outputMode in (OutputMode.multi_line, OutputMode.stream):
 		print("\n".join(externalLibs))
+	elif outputMode == OutputMode.nul:
+		from depz.x95_outputs import formatExternals
+		sys.stdout.write(formatExternals(externalLibs, "nul"))
 	else:
 		raise ValueError
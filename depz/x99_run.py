@@ -2,13 +2,12 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 import sys
-import datetime as dt
-from typing import *
-from pathlib import Path
 
-from depz import __version__
-from depz.x00_common import Mode, printVerbose
-from depz.x98_dooo import doo, OutputMode
+from depz.x00_version import __version__
+
+# The other modules are imported by runmain after the fast paths: the
+# CLI is called by shell prompt hooks and build steps, so it should start
+# quickly. The annotations below are strings for the same reason.
 
 helptxt = """
 
@@ -45,10 +44,90 @@ Exact behavior is specified by the program arguments.
 """
 
 
-def runmain(programArgs: List[str] = None):
+def runmain(programArgs: "List[str]" = None):
 	if programArgs is None:
 		programArgs = sys.argv[1:]
 
+	if programArgs == ["--version"]:
+		# answering without building the parser
+		printVersion()
+		exit(0)
+
+	if programArgs[:1] == ["affected"]:
+		runAffected(programArgs[1:])
+		return
+
+	if programArgs[:1] == ["daemon"]:
+		from depz.x88_daemon import runDaemon
+		runDaemon(programArgs[1:])
+		return
+
+	from depz.x88_daemon import askDaemon
+	if askDaemon(programArgs):
+		return
+
+	from pathlib import Path
+
+	from depz.x00_common import CopyMethod, printVerbose
+	from depz.x05_stats import stats
+	from depz.x80_rescanRelink import MANIFEST_NAMES
+	from depz.x98_dooo import doo, dooWorkspace, OutputMode
+
+	args, mode, outputMode, layoutFilter = parseArgs(programArgs)
+	printVerbose.allowed = outputMode == OutputMode.default and not args.schedule
+
+	outputs = None
+	if args.externals_out or args.graph_json:
+		from depz.x95_outputs import Outputs
+		outputs = Outputs(externalsFile=args.externals_out,
+						  externalsFormat=args.externals_format,
+						  graphJsonFile=args.graph_json)
+
+	if args.stats or args.stats_json:
+		stats.enabled = True
+		stats.reset()
+
+	logFile = open(args.log, "w") if args.log else None
+	printVerbose.log = logFile
+
+	try:
+		if args.workspace:
+			dooWorkspace([Path(p) for p in args.workspace],
+						 symlinkLocalDeps=args.relink,
+						 mode=mode, outputMode=outputMode,
+						 useCache=not args.no_cache,
+						 jobs=args.jobs,
+						 manifestNames=args.manifest or MANIFEST_NAMES,
+						 layoutFilter=layoutFilter)
+		else:
+			doo(Path(args.project),
+				symlinkLocalDeps=args.relink,
+				mode=mode, outputMode=outputMode,
+				useCache=not args.no_cache,
+				jobs=args.jobs,
+				manifestNames=args.manifest or MANIFEST_NAMES,
+				watch=args.watch,
+				writeLock=args.lock,
+				fromLock=args.from_lock,
+				frozen=args.frozen,
+				materialize=CopyMethod[args.materialize] if args.materialize else None,
+				layoutFilter=layoutFilter,
+				depth=args.depth,
+				only=args.only,
+				outputs=outputs,
+				check=args.check,
+				quick=args.quick,
+				schedule=args.schedule)
+	finally:
+		if logFile is not None:
+			printVerbose.log = None
+			logFile.close()
+		if stats.enabled:
+			stats.enabled = False
+			printStats(args.stats, args.stats_json)
+
+
+def buildParser() -> "argparse.ArgumentParser":
 	import argparse
 
 	parser = argparse.ArgumentParser()
@@ -58,24 +137,163 @@ def runmain(programArgs: List[str] = None):
 	parser.add_argument("-m", "--mode", type=str, default="default", choices=["default", "layout"],
 						help='The link creation mode. See docs.')
 
-	parser.add_argument("-e", type=str, default="default", choices=["default", "line", "multi"],
-						help='When specified, only external dependencies will be printed to stdout.')
+	parser.add_argument("--layout-allow", type=str, nargs="+", metavar="NAME",
+						help="In the layout mode, link only these subdirs of the libraries. "
+							 "Overrides the @layout-allow lines of the project depz.txt")
+	parser.add_argument("--layout-deny", type=str, nargs="+", metavar="NAME",
+						help="In the layout mode, never link these subdirs of the libraries. "
+							 "Added to the @layout-deny lines of the project depz.txt")
+
+	parser.add_argument("-e", type=str, default="default",
+						choices=["default", "line", "multi", "stream", "nul"],
+						help='When specified, only external dependencies will be printed to stdout. '
+							 '"stream" prints them one per line as soon as they are found. '
+							 '"nul" terminates each name with a NUL character, for xargs -0')
+
+	parser.add_argument("--externals-out", type=str, metavar="FILE",
+						help='Also save the external dependencies to FILE ("-" for stdout), '
+							 'in the --externals-format')
+	parser.add_argument("--externals-format", type=str, default="multi",
+						choices=["multi", "line", "nul"],
+						help='The format of --externals-out: one name per line (default), '
+							 'a single line, or NUL-terminated names')
+	parser.add_argument("--graph-json", type=str, metavar="FILE",
+						help='Save the local libraries, the link mapping and the external '
+							 'dependencies with the libraries requiring them as JSON '
+							 'to FILE ("-" for stdout)')
+	parser.add_argument("--log", type=str, metavar="FILE",
+						help="Write the default verbose output to FILE, whatever the -e is")
 
 	parser.add_argument("--relink", action="store_true",
-						help="Remove all symlinks from the project dir and create symlinks to local dependencies")
+						help="Update the symlinks in the project dir to match the local dependencies. "
+							 "Only the symlinks that differ are created, retargeted or removed")
+
+	parser.add_argument("--check", action="store_true",
+						help="Only check that the symlinks in the project dir match the "
+							 "dependencies, without changing anything. Lists the missing, "
+							 "stale, dangling and extra links and fails if there are any")
+
+	parser.add_argument("--quick", action="store_true",
+						help="With --check, stop at the first difference")
+
+	parser.add_argument("--schedule", type=str, nargs="?", const="text",
+						choices=["text", "json"],
+						help="Print the local libraries in the build order, grouped into "
+							 "levels that can be built concurrently, instead of the external "
+							 "dependencies. The text format is a LEVEL<tab>DIR line for "
+							 "each library. Fails if the libraries depend on each other "
+							 "in a cycle, listing the cycles to stderr")
+
+	parser.add_argument("--materialize", type=str, nargs="?", const="clone",
+						choices=["clone", "hardlink", "copy"],
+						help="Like --relink, but put real copies of the library dirs "
+							 "instead of symlinks. Files are cloned (reflink or "
+							 "copy_file_range) when the filesystem allows, otherwise "
+							 "hardlinked or copied as requested. Only the files whose "
+							 "size or mtime changed are copied again")
+
+	parser.add_argument("--depth", type=int, metavar="N",
+						help="Follow the local dependencies only N levels deep: 1 for the "
+							 "direct dependencies of the project. The libraries of the last "
+							 "level are linked, but their depz.txt files are not read. "
+							 "The links outside the scanned part are kept")
+
+	parser.add_argument("--only", type=str, metavar="LIB",
+						help="Process only the library LIB and its dependencies. LIB is "
+							 "a library name (like mylib for mylib_py) or a dir path. "
+							 "The links outside the scanned part are kept")
+
+	parser.add_argument("-w", "--workspace", type=str, nargs="+", metavar="PATH",
+						help="Process many projects in a single run, scanning the shared "
+							 "libraries once. Each PATH is either a project or a dir "
+							 "containing projects")
+
+	parser.add_argument("--watch", action="store_true",
+						help="Keep running: relink the project each time a depz.txt "
+							 "of the project or of its libraries changes")
+
+	parser.add_argument("--lock", action="store_true",
+						help="Save the resolved dependencies and the link mapping to depz.lock")
+
+	parser.add_argument("--from-lock", action="store_true",
+						help="Use depz.lock instead of scanning the dependencies")
+
+	parser.add_argument("--frozen", action="store_true",
+						help="Same as --from-lock, but fail if any depz.txt was changed "
+							 "after locking")
+
+	parser.add_argument("--stats", action="store_true",
+						help="Print timings of the scanning phases, operation counts "
+							 "and the slowest dirs to stderr")
+
+	parser.add_argument("--stats-json", type=str, metavar="FILE",
+						help='Save the same statistics as JSON to FILE ("-" for stdout)')
+
+	parser.add_argument("--no-cache", action="store_true",
+						help="Do not use the scan cache (.depz-cache in the project dir): "
+							 "read and resolve every depz.txt again")
+
+	parser.add_argument("--manifest", type=str, action="append", metavar="NAME",
+						help="The file name of the dependency lists. May be repeated. "
+							 "Defaults to depz.txt and pydpn.txt")
+
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+						help="Scan up to N directories and change up to N symlinks "
+							 "concurrently. Useful on network filesystems. With --workspace, "
+							 "also relink up to N projects in parallel processes. Defaults to 1")
+
+	parser.add_argument("--no-daemon", action="store_true",
+						help="Scan in this process even when a depz daemon is running")
 
 	parser.add_argument("--version", action="store_true",
 						help="Print version and exit")
+	return parser
+
 
+def parseArgs(programArgs: "List[str]"):
+	"""Parses and checks the arguments of the main command. Exits on errors,
+	on --help and on --version.
+
+	:return: The args namespace, the Mode, the OutputMode and the LayoutFilter or None.
+	"""
+	from depz.x00_common import Mode
+	from depz.x80_rescanRelink import LayoutFilter
+	from depz.x98_dooo import OutputMode
+
+	parser = buildParser()
 	args = parser.parse_args(programArgs)
 
 	if args.version:
-		m = max(p.stat().st_mtime for p in Path(__file__).parent.glob("*"))
-		y = dt.datetime.fromtimestamp(m).year
-		print(f"DEPZ {__version__} (c) 2020-{y} Art Galkin <ortemeo@gmail.com>")
-		print("https://github.com/rtmigo/depz")
+		printVersion()
 		exit(0)
 
+	if args.jobs < 1:
+		parser.error("--jobs must be at least 1")
+	if args.lock and (args.from_lock or args.frozen):
+		parser.error("--lock cannot be combined with --from-lock or --frozen")
+	if args.materialize and (args.relink or args.watch or args.workspace):
+		parser.error("--materialize cannot be combined with --relink, --watch or --workspace")
+	if (args.externals_out or args.graph_json) and (args.workspace or args.watch):
+		parser.error("--externals-out and --graph-json cannot be combined with "
+					 "--workspace or --watch")
+	if args.quick and not args.check:
+		parser.error("--quick requires --check")
+	if args.check and (args.relink or args.materialize or args.watch or args.workspace
+					   or args.lock):
+		parser.error("--check cannot be combined with --relink, --materialize, --watch, "
+					 "--workspace or --lock")
+	if args.schedule and (args.relink or args.materialize or args.watch or args.workspace
+						  or args.lock or args.from_lock or args.frozen or args.check
+						  or args.e != "default"):
+		parser.error("--schedule cannot be combined with -e, --relink, --materialize, "
+					 "--watch, --workspace, --check or the lock options")
+	if args.depth is not None and args.depth < 1:
+		parser.error("--depth must be at least 1")
+	if (args.depth is not None or args.only) and (args.workspace or args.watch or args.lock
+												   or args.from_lock or args.frozen):
+		parser.error("--depth and --only cannot be combined with --workspace, --watch "
+					 "or the lock options")
+
 	mode: Mode
 	if args.mode == "default":
 		mode = Mode.default
@@ -87,20 +305,78 @@ def runmain(programArgs: List[str] = None):
 	outputMode: OutputMode
 
 	if args.e == "default":
-		printVerbose.allowed = True
 		outputMode = OutputMode.default
 	elif args.e == "line":
-		printVerbose.allowed = False
 		outputMode = OutputMode.one_line
 	elif args.e == "multi":
-		printVerbose.allowed = False
 		outputMode = OutputMode.multi_line
+	elif args.e == "stream":
+		outputMode = OutputMode.stream
+	elif args.e == "nul":
+		outputMode = OutputMode.nul
 	else:
 		raise ValueError
 
-	doo(Path(args.project),
-		symlinkLocalDeps=args.relink,
-		mode=mode, outputMode=outputMode)
+	layoutFilter: Optional[LayoutFilter] = None
+	if args.layout_allow or args.layout_deny:
+		if mode != Mode.layout:
+			parser.error("--layout-allow and --layout-deny require --mode layout")
+		layoutFilter = LayoutFilter(allow=args.layout_allow, deny=args.layout_deny or ())
+
+	return args, mode, outputMode, layoutFilter
+
+
+def runAffected(programArgs: "List[str]"):
+	import argparse
+	from pathlib import Path
+
+	from depz.x00_common import printVerbose
+	from depz.x80_rescanRelink import MANIFEST_NAMES
+	from depz.x87_affected import affectedProjects
+
+	parser = argparse.ArgumentParser(
+		prog="depz affected",
+		description="Prints the projects of the workspace that depend on the changed "
+					"libraries, directly or indirectly. One project per line.")
+	parser.add_argument("changed", type=str, nargs="+", metavar="PATH",
+						help="A changed library dir, or any file or dir inside it")
+	parser.add_argument("-w", "--workspace", type=str, action="append", metavar="PATH",
+						help="A project or a dir containing projects, as for "
+							 "depz --workspace. May be repeated. Defaults to the current "
+							 "directory")
+	parser.add_argument("--manifest", type=str, action="append", metavar="NAME",
+						help="The file name of the dependency lists. May be repeated. "
+							 "Defaults to depz.txt and pydpn.txt")
+	parser.add_argument("--no-cache", action="store_true",
+						help="Do not use the saved index (.depz-affected) and the scan cache")
+	args = parser.parse_args(programArgs)
+
+	printVerbose.allowed = False
+	projects = affectedProjects([Path(p) for p in args.workspace or ["."]],
+								[Path(p) for p in args.changed],
+								useCache=not args.no_cache,
+								manifestNames=args.manifest or MANIFEST_NAMES)
+	for project in projects:
+		print(project)
+
+
+def printVersion():
+	print(f"DEPZ {__version__} (c) 2020-2021 Art Galkin <ortemeo@gmail.com>")
+	print("https://github.com/rtmigo/depz")
+
+
+def printStats(asText: bool, jsonFile: "Optional[str]"):
+	from depz.x05_stats import stats
+	if asText:
+		print(stats.report(), file=sys.stderr)
+	if jsonFile:
+		import json
+		text = json.dumps(stats.toDict(), indent=2)
+		if jsonFile == "-":
+			print(text)
+		else:
+			with open(jsonFile, "w") as f:
+				f.write(text + "\n")
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ from tempfile import TemporaryDirectory
 from typing import List, Iterator
 
 from depz import runmain
+from depz.x01_testsBase import TestWithoutDaemon
 
 
 class CapturedOutput:
@@ -83,8 +84,9 @@ def createFile(path: Path, content: str = None):
 		path.touch()
 
 
-class Tests(unittest.TestCase):
+class Tests(TestWithoutDaemon):
 	def setUp(self) -> None:
+		super().setUp()
 		self.td = TemporaryDirectory()
 		self.tempDir = Path(self.td.name)
 		self.createLayout()
@@ -117,11 +119,14 @@ class TestsWithPythonLayout(Tests):
 		createFile(self.tempDir / "libs" / "lib3" / "__init__.py")
 
 	expectedUnchanged = [
+		'.depz-cache (F)',
 		'depz.txt (F)',
 		'stub.py (F)'
 	]
 
 	expectedPythonAfterLink = [
+		'.depz-cache (F)',
+		'.depz-links (F)',
 		'depz.txt (F)',
 		'lib1 (LD)',
 		'lib1/depz.txt (F)',
@@ -166,6 +171,19 @@ class TestsWithPythonLayout(Tests):
 			runmain(["--project", str(self.tempDir / "project"), "--relink", "-e", "line"])
 		self.assertEqual(output.std.strip(), "numpy requests")
 
+	def test_relink_print_externals_stream(self):
+		with CapturedOutput() as output:
+			runmain(["--project", str(self.tempDir / "project"), "--relink", "-e", "stream"])
+		self.assertEqual(output.std.strip(), "numpy\nrequests")
+		self.assertListEqual(listDir((self.tempDir / "project")), self.expectedPythonAfterLink)
+
+	def test_relink_parallel(self):
+		with CapturedOutput() as output:
+			runmain(["--project", str(self.tempDir / "project"), "--relink", "-e", "line",
+					 "--jobs", "4"])
+		self.assertEqual(output.std.strip(), "numpy requests")
+		self.assertListEqual(listDir((self.tempDir / "project")), self.expectedPythonAfterLink)
+
 	def test_relink_print_externals_multi_lines(self):
 		with CapturedOutput() as output:
 			runmain(["--project", str(self.tempDir / "project"), "--relink", "-e", "multi"])
@@ -194,6 +212,75 @@ class TestsWithPythonLayout(Tests):
 		self.assertListEqual(result, self.expectedPythonAfterLink)
 		self.assertTrue("Creating symlink" in output.std)
 
+	def test_relink_noop(self):
+		runmain(["--project", str(self.tempDir / "project"), "--relink"])
+		with CapturedOutput() as output:
+			runmain(["--project", str(self.tempDir / "project"), "--relink"])
+		self.assertListEqual(listDir((self.tempDir / "project")), self.expectedPythonAfterLink)
+		self.assertFalse("Creating symlink" in output.std)
+		self.assertTrue("Symlinks: 0 created, 0 retargeted, 0 removed, 3 unchanged" in output.std)
+
+	def test_no_cache(self):
+		runmain(["--project", str(self.tempDir / "project"), "--relink", "--no-cache"])
+		result = listDir((self.tempDir / "project"))
+		self.assertListEqual(result, [s for s in self.expectedPythonAfterLink
+									  if not s.startswith(".depz-cache")])
+
+	def test_single_pass_outputs(self):
+		import json
+		project = self.tempDir / "project"
+		with CapturedOutput() as output:
+			runmain(["--project", str(project), "--relink", "-e", "nul",
+					 "--externals-out", str(self.tempDir / "reqs.txt"),
+					 "--graph-json", str(self.tempDir / "graph.json"),
+					 "--log", str(self.tempDir / "log.txt")])
+		self.assertEqual(output.std, "numpy\0requests\0")
+		self.assertListEqual(listDir(project), self.expectedPythonAfterLink)
+		self.assertEqual((self.tempDir / "reqs.txt").read_text(), "numpy\nrequests\n")
+
+		graph = json.loads((self.tempDir / "graph.json").read_text())
+		self.assertEqual(graph["externals"], {"numpy": ["project"], "requests": ["lib1"]})
+		self.assertEqual(len(graph["libraries"]), 3)
+		self.assertEqual(sorted(Path(link).name for _, link in graph["mapping"]),
+						 ["lib1", "lib2", "lib3"])
+
+		log = (self.tempDir / "log.txt").read_text()
+		self.assertIn("Creating symlink", log)
+		self.assertIn("External dependencies: numpy requests", log)
+
+	def test_check(self):
+		project = str(self.tempDir / "project")
+		with CapturedOutput() as output:
+			with self.assertRaises(SystemExit) as cm:
+				runmain(["--project", project, "--check"])
+		self.assertIn("do not match", str(cm.exception.code))
+		self.assertEqual(output.err.count("missing: "), 3)
+		self.assertListEqual(listDir(self.tempDir / "project"), ['depz.txt (F)', 'stub.py (F)'])
+
+		runmain(["--project", project, "--relink"])
+		with CapturedOutput() as output:
+			runmain(["--project", project, "--check", "--quick"])
+		self.assertIn("Symlinks: all up to date", output.std)
+
+	def test_schedule(self):
+		import json
+		project = str(self.tempDir / "project")
+		libs = (self.tempDir / "libs").resolve()
+		with CapturedOutput() as output:
+			runmain(["--project", project, "--schedule"])
+		self.assertEqual(output.std, f"1\t{libs / 'lib2'}\n1\t{libs / 'lib3'}\n2\t{libs / 'lib1'}\n")
+		self.assertListEqual(listDir(self.tempDir / "project"), ['depz.txt (F)', 'stub.py (F)'])
+
+		createFile(self.tempDir / "libs" / "lib3" / "depz.txt", "../lib1")
+		with CapturedOutput() as output:
+			with self.assertRaises(SystemExit) as cm:
+				runmain(["--project", project, "--schedule", "json"])
+		self.assertIn("cycles", str(cm.exception.code))
+		self.assertEqual(json.loads(output.std)["levels"],
+						 [[str(libs / "lib1"), str(libs / "lib2"), str(libs / "lib3")]])
+		self.assertIn(f"cycle: {libs / 'lib1'} -> {libs / 'lib3'} -> {libs / 'lib1'}",
+					  output.err)
+
 	def test_project_dir_does_not_exist(self):
 		with self.assertRaises(FileNotFoundError):
 			runmain(["--project", "labuda"])
@@ -235,7 +322,9 @@ class TestsWithFluterLayout(Tests):
 		createFile(self.tempDir / "libraryC" / "lib" / "something.dart")
 		createFile(self.tempDir / "libraryC" / "data" / "binary.dat")
 
-	expectedAfterLink = ['data (D)',
+	expectedAfterLink = ['.depz-cache (F)',
+						 '.depz-links (F)',
+						 'data (D)',
 						 'data/libraryC (LD)',
 						 'data/libraryC/binary.dat (F)',
 						 'depz.txt (F)',
@@ -260,8 +349,24 @@ class TestsWithFluterLayout(Tests):
 
 		self.assertListEqual(result, self.expectedAfterLink)
 
+	def test_relink_layout_allow_directive(self):
+		manifest = self.tempDir / "project" / "depz.txt"
+		manifest.write_text(manifest.read_text() + "\n@layout-allow lib test\n")
+		createFile(self.tempDir / "libraryB" / ".git" / "HEAD")
+		runmain(["--project", str(self.tempDir / "project"), "--relink", "--mode", "layout"])
+		result = listDir((self.tempDir / "project"))
+		self.assertListEqual(result, [line for line in self.expectedAfterLink
+									  if not line.startswith("data")])
+
+	def test_relink_layout_deny_argument(self):
+		runmain(["--project", str(self.tempDir / "project"), "--relink", "--mode", "layout",
+				 "--layout-deny", "test", "data"])
+		result = listDir((self.tempDir / "project"))
+		self.assertListEqual(result, [line for line in self.expectedAfterLink
+									  if not line.startswith(("data", "test/"))])
 
-class TestsInfo(unittest.TestCase):
+
+class TestsInfo(TestWithoutDaemon):
 	def test_help(self):
 		with CapturedOutput() as output:
 			with self.assertRaises(SystemExit) as cm:
@@ -277,3 +382,33 @@ class TestsInfo(unittest.TestCase):
 		self.assertEqual(cm.exception.code, 0)
 		self.assertTrue(output.std.startswith("DEPZ"))
 		self.assertEqual(output.err, "")
+
+
+class TestStartup(unittest.TestCase):
+	"""The modules that the CLI hot path must not import. See also
+	`python3 -m benchmark startup` for the timings."""
+
+	def importedBy(self, code: str) -> List[str]:
+		import subprocess
+		script = code + "\nimport sys\nprint('\\n'.join(sys.modules))"
+		out = subprocess.check_output([sys.executable, "-c", script],
+									  cwd=str(Path(__file__).parent.parent))
+		return out.decode().split()
+
+	def test_import_package(self):
+		modules = self.importedBy("import depz")
+		for name in ["depz.x99_run", "depz.x80_rescanRelink", "typing", "pathlib"]:
+			self.assertNotIn(name, modules)
+
+	def test_import_cli(self):
+		modules = self.importedBy("import depz.x99_run")
+		for name in ["argparse", "depz.x80_rescanRelink", "typing", "pathlib"]:
+			self.assertNotIn(name, modules)
+
+	def test_import_scanning(self):
+		modules = self.importedBy("import argparse, depz.x98_dooo")
+		for name in ["typing", "threading", "contextlib",
+					 "unittest", "tempfile", "datetime", "json", "ctypes", "select",
+					 "concurrent.futures", "depz.x82_lock", "depz.x85_watch",
+					 "depz.x86_workspace", "depz.x60_relink", "depz.x95_outputs"]:
+			self.assertNotIn(name, modules)
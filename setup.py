@@ -15,7 +15,7 @@ setup(
   author_email="ortemeo@gmail.com",
   url='https://github.com/rtmigo/depz',
 
-  packages=find_packages(),
+  packages=find_packages(exclude=["benchmark", "benchmark.*"]),
   install_requires=[],
 
   description="Command-line tool for symlinking directories with reusable code into the project",